@@ -0,0 +1,71 @@
+import copy
+import threading
+import time
+
+import pytest
+
+import workout_backend
+from workout_models import encode_value
+from workout_storage import StorageEngine, apply_mutation
+
+USER_ID = '1234'
+WORKOUT_ID = '1600000000.5'
+# Reports from about two years ago, so that archive_old_reports(365) moves them all
+OLD_REPORT_IDS = [repr(time.time() - 730 * 86400 + day * 86400) for day in range(4)]
+
+
+def make_database():
+    """Make a database with one user, who has one scheduled workout with OLD_REPORT_IDS as its reports.
+
+    :return: (dict) the database as it is stored on disk
+    """
+    reports = {report_id: {'completion': 'complete', 'comment': None} for report_id in OLD_REPORT_IDS}
+    workout = {'workout_name': 'Pushups', 'days_scheduled': ['Monday'], 'muscle_group': 'chest', 'weights_used': None,
+               'tutorial_url': None, 'img_url': None, 'reports': reports}
+    return {'users': {USER_ID: {'username': 'bob', 'unscheduled_workout': {},
+                                'scheduled_workout': {WORKOUT_ID: workout}}}}
+
+
+class MemoryEngine(StorageEngine):
+    """A storage engine that keeps what is durable in a dict, so tests can see what was written and when. write()
+    waits while the gate is closed, like a disk that has stalled, and raises fail instead of writing if it's set.
+    """
+
+    def __init__(self, json_data):
+        self.json_data = json_data
+        self.gate = threading.Event()
+        self.gate.set()
+        self.fail = None
+        self.batches = 0
+
+    def load(self):
+        return copy.deepcopy(self.json_data)
+
+    def prepare(self, json_data, mutations):
+        return [(op, path, encode_value(value)) for op, path, value in mutations]
+
+    def write(self, batch):
+        self.gate.wait()
+        if self.fail is not None:
+            raise self.fail
+        for op, path, value in batch:
+            apply_mutation(self.json_data, op, path, value)
+        self.batches += 1
+
+
+@pytest.fixture
+def engine(tmp_path, monkeypatch):
+    """Point the backend at a MemoryEngine holding make_database(), with an empty archive in a temporary directory,
+    and close it again afterwards.
+
+    :return: (MemoryEngine) the engine
+    """
+    monkeypatch.setenv('WRITE_BEHIND_SECONDS', '0')
+    workout_backend.close_store()
+    memory_engine = MemoryEngine(make_database())
+    workout_backend._engine = memory_engine
+    workout_backend._archive.open(str(tmp_path / 'archive'))
+    workout_backend.load_store()
+    yield memory_engine
+    memory_engine.gate.set()
+    workout_backend.close_store()
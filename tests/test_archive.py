@@ -0,0 +1,112 @@
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+import workout_backend
+from workout_archive import Archive
+from workout_backend import (archive_old_reports, flush_store, delete_from_dict, transaction, get_all_reports,
+                             get_workout_reports, get_report_entries)
+from workout_main import delete_workout_main
+from workout_models import Report, UnscheduledWorkout
+
+from conftest import USER_ID, WORKOUT_ID, OLD_REPORT_IDS
+
+
+def add_to_archive(archive, user_id, year, rows):
+    """Archive reports in all three steps at once."""
+    assert archive.finish_add(archive.write_add(archive.start_add(user_id, year, rows)))
+
+
+def test_archive_files_round_trip_with_missing_fields(tmp_path):
+    times = [datetime(2020, 3, day, 7, 30).timestamp() for day in range(1, 6)]
+    rows = [(repr(times[0]), '1500000000.1', Report(completion='complete', comment=None)),
+            (repr(times[1]), '1500000000.1', Report(completion='partially complete')),
+            (repr(times[2]), '1500000000.2', Report(completion='complete', comment='Felt good ✓')),
+            (repr(times[3]), None, UnscheduledWorkout(workout_name='Run', muscle_group='legs', img_url=None)),
+            (repr(times[4]), None, UnscheduledWorkout())]
+    archive = Archive()
+    archive.open(str(tmp_path))
+    add_to_archive(archive, USER_ID, 2020, rows[:3])
+    # A second add is merged into the year's file
+    add_to_archive(archive, USER_ID, 2020, rows[3:])
+    archive.close()
+
+    archive.open(str(tmp_path))
+    for report_id, workout_id, report in rows:
+        assert archive.contains(USER_ID, report_id)
+        archived_workout_id, archived = archive.get(USER_ID, report_id)
+        assert archived_workout_id == workout_id
+        assert type(archived) is type(report)
+        # Fields that were None come back as None, and fields that were missing stay missing
+        assert dict(archived.items()) == dict(report.items())
+    assert not archive.contains(USER_ID, repr(times[0] + 1))
+    archive.close()
+
+
+def test_archived_reports_stay_on_disk_until_their_replacement_is_durable(engine, tmp_path):
+    assert archive_old_reports(365) == len(OLD_REPORT_IDS)
+    flush_store()
+
+    # The write is stuck, as if the bot were about to crash before it finished
+    engine.gate.clear()
+    delete_workout_main(SimpleNamespace(id=int(USER_ID), display_name='bob'), WORKOUT_ID, 'True')
+    assert WORKOUT_ID in engine.json_data['users'][USER_ID]['scheduled_workout']
+    on_disk = Archive()
+    on_disk.open(str(tmp_path / 'archive'))
+    assert all(on_disk.contains(USER_ID, report_id) for report_id in OLD_REPORT_IDS)
+    on_disk.close()
+
+    engine.gate.set()
+    workout_backend.close_store()
+    assert WORKOUT_ID not in engine.json_data['users'][USER_ID]['scheduled_workout']
+    assert sorted(engine.json_data['users'][USER_ID]['unscheduled_workout']) == sorted(OLD_REPORT_IDS)
+    on_disk.open(str(tmp_path / 'archive'))
+    assert not any(on_disk.contains(USER_ID, report_id) for report_id in OLD_REPORT_IDS)
+    on_disk.close()
+
+
+def test_archived_reports_are_kept_if_the_delete_cant_be_written(engine, tmp_path):
+    assert archive_old_reports(365) == len(OLD_REPORT_IDS)
+    flush_store()
+
+    engine.fail = OSError('disk full')
+    with pytest.raises(OSError):
+        delete_from_dict(USER_ID, WORKOUT_ID).result(timeout=5)
+    workout_backend.close_store()
+
+    on_disk = Archive()
+    on_disk.open(str(tmp_path / 'archive'))
+    assert all(on_disk.contains(USER_ID, report_id) for report_id in OLD_REPORT_IDS)
+    on_disk.close()
+
+
+def test_a_deleted_archived_report_is_hidden_until_it_is_dropped(engine, tmp_path):
+    assert archive_old_reports(365) == len(OLD_REPORT_IDS)
+    flush_store()
+    report_id = OLD_REPORT_IDS[0]
+
+    def listed():
+        return [report_id in get_all_reports(USER_ID), report_id in dict(get_workout_reports(USER_ID, WORKOUT_ID)),
+                report_id in [entry[1] for entry in get_report_entries(USER_ID)]]
+
+    with pytest.raises(RuntimeError):
+        with transaction():
+            delete_from_dict(USER_ID, WORKOUT_ID, report_id)
+            assert listed() == [False] * 3
+            raise RuntimeError('boom')
+    assert listed() == [True] * 3
+
+    engine.gate.clear()
+    delete_from_dict(USER_ID, WORKOUT_ID, report_id)
+    # Still archived on disk, but not read from there anymore
+    assert workout_backend._archive.hidden == {USER_ID: {report_id}}
+    assert listed() == [False] * 3
+
+    engine.gate.set()
+    workout_backend.close_store()
+    on_disk = Archive()
+    on_disk.open(str(tmp_path / 'archive'))
+    assert not on_disk.contains(USER_ID, report_id)
+    assert all(on_disk.contains(USER_ID, other_id) for other_id in OLD_REPORT_IDS[1:])
+    on_disk.close()
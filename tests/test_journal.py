@@ -0,0 +1,30 @@
+import pytest
+
+from workout_codecs import get_codec
+from workout_journal import JournalEngine
+
+BOB = {'username': 'bob', 'unscheduled_workout': {}, 'scheduled_workout': {}}
+
+
+@pytest.mark.parametrize('torn_line', ['{"op":"set","path":["users","1","user',
+                                       '{"op":"set","path":["users","1","username"],"value":"bobby"}'])
+def test_a_torn_last_line_is_cut_off_and_the_rest_replayed(tmp_path, torn_line):
+    filename = str(tmp_path / 'workouts.json')
+    engine = JournalEngine(filename, get_codec('json'))
+    assert engine.load() == {'users': {}}
+    engine.persist(None, [('set', ('users', '1'), BOB), ('set', ('users', '1', 'username'), 'robert')])
+    engine.close()
+
+    # A crash part way through appending a line leaves it without its newline
+    with open(filename + '.journal', 'a') as journal:
+        journal.write(torn_line)
+
+    engine = JournalEngine(filename, get_codec('json'))
+    assert engine.load() == {'users': {'1': dict(BOB, username='robert')}}
+    # New lines start where the last complete one ended, instead of being glued onto the torn one
+    engine.persist(None, [('set', ('users', '2'), dict(BOB, username='alice'))])
+    engine.close()
+
+    engine = JournalEngine(filename, get_codec('json'))
+    assert engine.load() == {'users': {'1': dict(BOB, username='robert'), '2': dict(BOB, username='alice')}}
+    engine.close()
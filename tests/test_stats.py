@@ -0,0 +1,20 @@
+from types import SimpleNamespace
+
+from workout_backend import add_report, edit_value, get_stats
+from workout_main import stats_main
+
+from conftest import USER_ID, WORKOUT_ID, OLD_REPORT_IDS
+
+
+def test_both_spellings_of_partially_complete_are_counted_together(engine):
+    # report_scheduled stores the underscored spelling, edit_report the spaced one
+    add_report(USER_ID, 'partially_complete', workout_id=WORKOUT_ID)
+    edit_value(USER_ID, 'completion', 'partially complete', 'scheduled_workout', WORKOUT_ID, OLD_REPORT_IDS[0])
+    assert get_stats(USER_ID)['completions'][WORKOUT_ID] == {'complete': 3, 'partially complete': 2}
+
+    edit_value(USER_ID, 'completion', 'partially_complete', 'scheduled_workout', WORKOUT_ID, OLD_REPORT_IDS[0])
+    assert get_stats(USER_ID)['completions'][WORKOUT_ID] == {'complete': 3, 'partially complete': 2}
+
+    message = stats_main(SimpleNamespace(id=int(USER_ID), display_name='bob'))
+    assert '40% partially complete' in message
+    assert 'partially_complete' not in message
@@ -0,0 +1,65 @@
+import pytest
+
+import workout_backend
+from workout_backend import (transaction, flush_store, read_json, add_report, add_scheduled_workout, edit_value,
+                             delete_from_dict, get_report_entries, get_report_calendar, get_stats, search_workouts,
+                             get_leaderboard)
+from workout_models import encode_value
+
+from conftest import USER_ID, WORKOUT_ID, OLD_REPORT_IDS, make_database
+
+
+def snapshot():
+    """Get the resident database and what every index says about the test user."""
+    return (encode_value(read_json()), get_report_entries(USER_ID), get_report_calendar(USER_ID), get_stats(USER_ID),
+            search_workouts(USER_ID), get_leaderboard(USER_ID))
+
+
+def test_rollback_restores_the_store_the_indexes_and_the_queue(engine):
+    before = snapshot()
+    flush_store()
+    batches = engine.batches
+
+    futures = []
+    with pytest.raises(RuntimeError):
+        with transaction():
+            futures.append(add_report(USER_ID, 'skipped', workout_id=WORKOUT_ID))
+            futures.append(add_scheduled_workout(USER_ID, 'Squats', ['Friday']))
+            futures.append(edit_value(USER_ID, 'workout_name', 'Renamed', 'scheduled_workout', WORKOUT_ID))
+            futures.append(delete_from_dict(USER_ID, WORKOUT_ID, OLD_REPORT_IDS[0]))
+            assert snapshot() != before
+            assert len(workout_backend._pending) == len(futures)
+            raise RuntimeError('boom')
+
+    assert snapshot() == before
+    assert workout_backend._pending == [] and workout_backend._pending_futures == []
+    for future in futures:
+        with pytest.raises(RuntimeError):
+            future.result(timeout=5)
+    flush_store()
+    assert engine.batches == batches
+    assert engine.json_data == make_database()
+
+
+def test_a_nested_transaction_rolls_back_with_the_outer_one(engine):
+    before = snapshot()
+    with pytest.raises(RuntimeError):
+        with transaction():
+            with transaction():
+                add_report(USER_ID, 'complete', workout_id=WORKOUT_ID)
+            raise RuntimeError('boom')
+
+    assert snapshot() == before
+
+
+def test_a_transaction_goes_out_in_one_batch(engine):
+    flush_store()
+    batches = engine.batches
+    with transaction():
+        add_report(USER_ID, 'complete', workout_id=WORKOUT_ID)
+        add_report(USER_ID, 'skipped', workout_id=WORKOUT_ID)
+        edit_value(USER_ID, 'muscle_group', 'arms', 'scheduled_workout', WORKOUT_ID)
+    flush_store()
+
+    assert engine.batches == batches + 1
+    assert engine.json_data == encode_value(read_json())
@@ -0,0 +1,144 @@
+import time
+from datetime import datetime
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+WEEKDAYS = ('Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday')
+# How many of the latest weeks the recent sessions per week are averaged over
+RECENT_WEEKS = 4
+# The ordinal of 1970-01-01, the day unix time counts from
+_EPOCH_ORDINAL = 719163
+
+
+def schedule_mask(days_scheduled):
+    """Turn a workout's schedule into the weekdays it falls on. Day names are matched ignoring case, and anything that
+    isn't a day name is ignored.
+
+    :param days_scheduled: (list of strs) the days the workout should be done, ex: ["Monday", "Friday"]
+    :return: (list of bools) for each weekday from Monday to Sunday, whether the workout is scheduled on it
+    """
+    days = {str(day).strip().casefold() for day in days_scheduled or ()}
+    return [weekday.casefold() in days for weekday in WEEKDAYS]
+
+
+def compute_adherence(schedules, created, report_times, report_workouts, now=None):
+    """Compare when a user's scheduled workouts should have been done with when they were, for all of them at once.
+    Every workout gets a row in a (workouts x days) grid of expected sessions, from the day it was created to today,
+    and the reports are counted into a grid of the same shape, so every figure is a sum or a mean over those grids.
+    The current schedule is assumed to have held since the workout was created.
+
+    :param schedules: (list of lists of bools) each workout's schedule, from schedule_mask()
+    :param created: (list of floats) the unix time each workout was created
+    :param report_times: (array-like of floats or strs) the unix time of every session, ex: the ids of every report
+                         that wasn't skipped
+    :param report_workouts: (array-like of ints) for each session, the position of its workout in schedules
+    :param now: (float) unix time to measure up to. None means right now
+    :return: (dict) 'workouts', a list with a dict for each workout, in order, holding 'expected_per_week',
+             'actual_per_week' and 'recent_per_week' (sessions per week: scheduled, done since the workout was created
+             and done in the last RECENT_WEEKS weeks), 'hit_rate' (the share of scheduled days a session was done on),
+             'off_schedule' (the share of sessions done on days the workout isn't scheduled on) and 'drift' (how much
+             the weekly hit rate changes every RECENT_WEEKS weeks, from a least-squares line through it); and
+             'weekday_hit_rates', the hit rate of all the workouts together on each weekday from Monday to Sunday.
+             Rates that have nothing to measure are None
+    """
+    if np is None:
+        raise ValueError("Adherence needs NumPy, which isn't installed. Run: pip install numpy")
+    now = time.time() if now is None else now
+    num_workouts = len(schedules)
+    if num_workouts == 0:
+        return {'workouts': [], 'weekday_hit_rates': [None] * 7}
+
+    # Work in local days. The UTC offset is looked up for the days in the grid, so daylight saving time is honoured
+    created_days = np.array([datetime.fromtimestamp(timestamp).toordinal() for timestamp in created])
+    today = datetime.fromtimestamp(now).toordinal()
+    # The grid runs from the Monday of the earliest week a workout was created in to the Sunday of this week, so it
+    # can be folded into whole weeks. Ordinal 1 was a Monday
+    first_day = int(created_days.min()) - (int(created_days.min()) - 1) % 7
+    num_days = (today - (today - 1) % 7 + 7) - first_day
+    days = np.arange(first_day, first_day + num_days)
+    offsets, changing = _utc_offsets(first_day, num_days)
+
+    # Expected sessions: scheduled weekdays between each workout's creation and today
+    weekdays = (days - 1) % 7
+    in_range = (days[None, :] >= created_days[:, None]) & (days[None, :] <= today)
+    expected = np.array(schedules, dtype=bool)[:, weekdays] & in_range
+
+    # Actual sessions: count the reports into their workout's row, at their local day. A first guess with the current
+    # offset picks the day whose offset is then used. Reports from around a change of offset, where the offset at
+    # noon may not be the one at the time of the report, are placed one by one instead
+    report_times = np.array(report_times, dtype=np.float64)
+    report_workouts = np.asarray(report_workouts, dtype=np.int64)
+    guess = np.clip(((report_times + offsets[-1]) // 86400).astype(np.int64) + _EPOCH_ORDINAL - first_day,
+                    0, num_days - 1)
+    report_days = ((report_times + offsets[guess]) // 86400).astype(np.int64) + _EPOCH_ORDINAL - first_day
+    unsure = np.flatnonzero(changing[guess])
+    report_days[unsure] = [datetime.fromtimestamp(report_time).toordinal() - first_day
+                           for report_time in report_times[unsure].tolist()]
+    counted = (report_days >= 0) & (report_days < num_days)
+    actual = np.bincount(report_workouts[counted] * num_days + report_days[counted],
+                         minlength=num_workouts * num_days).reshape(num_workouts, num_days)
+    hits = expected & (actual > 0)
+
+    # Fold the days into weeks
+    num_weeks = num_days // 7
+    weekly_expected = expected.reshape(num_workouts, num_weeks, 7).sum(axis=2)
+    weekly_hits = hits.reshape(num_workouts, num_weeks, 7).sum(axis=2)
+    weekly_actual = actual.reshape(num_workouts, num_weeks, 7).sum(axis=2)
+    # The weeks each workout has existed in, so weeks before it was created don't count against it
+    week_starts = days[::7]
+    active_weeks = np.maximum((week_starts[None, :] + 6 >= created_days[:, None]).sum(axis=1), 1)
+
+    total_expected = expected.sum(axis=1)
+    total_actual = actual.sum(axis=1)
+    off_schedule = (actual * ~expected).sum(axis=1)
+    recent_weeks = np.minimum(active_weeks, RECENT_WEEKS)
+    recent_actual = weekly_actual[:, -RECENT_WEEKS:].sum(axis=1)
+
+    workouts = []
+    for row in range(num_workouts):
+        workouts.append({'expected_per_week': int(sum(schedules[row])),
+                         'actual_per_week': float(total_actual[row] / active_weeks[row]),
+                         'recent_per_week': float(recent_actual[row] / recent_weeks[row]),
+                         'hit_rate': _rate(hits[row].sum(), total_expected[row]),
+                         'off_schedule': _rate(off_schedule[row], total_actual[row]),
+                         'drift': _drift(weekly_hits[row], weekly_expected[row])})
+
+    # Hit rates by weekday, for all the workouts together
+    weekday_expected = expected.reshape(num_workouts, num_weeks, 7).sum(axis=(0, 1))
+    weekday_hits = hits.reshape(num_workouts, num_weeks, 7).sum(axis=(0, 1))
+    weekday_hit_rates = [_rate(weekday_hits[weekday], weekday_expected[weekday]) for weekday in range(7)]
+
+    return {'workouts': workouts, 'weekday_hit_rates': weekday_hit_rates}
+
+
+def _utc_offsets(first_day, num_days):
+    """Get the local UTC offset at noon on each day of the grid, in seconds, along with which days are in or next to
+    a week the offset changes in. The offset is looked up once a week, and day by day only in those weeks."""
+    def offset(day):
+        return datetime.fromordinal(day).replace(hour=12).astimezone().utcoffset().total_seconds()
+
+    weekly = np.array([offset(day) for day in range(first_day, first_day + num_days + 7, 7)])
+    offsets = np.repeat(weekly[:-1], 7)
+    changing = np.zeros(num_days, dtype=bool)
+    for week in np.flatnonzero(np.diff(weekly)):
+        offsets[week * 7:week * 7 + 7] = [offset(first_day + week * 7 + day) for day in range(7)]
+        changing[max(week * 7 - 1, 0):week * 7 + 8] = True
+    return offsets, changing
+
+
+def _rate(part, whole):
+    """Divide, or None if there is nothing to divide by."""
+    return float(part / whole) if whole else None
+
+
+def _drift(weekly_hits, weekly_expected):
+    """Fit a line through the weekly hit rate of the weeks that had scheduled days, and get its slope per
+    RECENT_WEEKS weeks, or None if there are fewer than two such weeks."""
+    weeks = np.flatnonzero(weekly_expected)
+    if len(weeks) < 2:
+        return None
+    slope = np.polyfit(weeks, weekly_hits[weeks] / weekly_expected[weeks], 1)[0]
+    return float(slope * RECENT_WEEKS)
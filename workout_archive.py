@@ -0,0 +1,593 @@
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import zlib
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+from datetime import datetime
+
+from workout_metrics import metrics
+from workout_models import Report, UnscheduledWorkout
+
+# Every archive file starts with this header: the magic bytes, the format version, the number of columns and the
+# number of reports. Then comes the compressed size of each column, then the report times as uncompressed doubles,
+# then the compressed columns themselves
+_MAGIC = b'WKAR'
+_VERSION = 1
+_HEADER = struct.Struct('<4sHHI')
+# The string columns, in the order they are laid out in. workout_id is None for unscheduled reports
+COLUMNS = ('workout_id', 'workout_name', 'completion', 'comment', 'muscle_group', 'weights_used', 'tutorial_url',
+           'img_url')
+# Column codes that don't point into the column's dictionary
+_MISSING_CODE = -1
+_NONE_CODE = -2
+# Stands in for a field that a report doesn't have, as opposed to one that is None
+_MISSING = object()
+
+
+class ArchiveFile:
+    """One user's archived reports from one year, read through a memory map. The report times sit uncompressed right
+    after the header, so they are read straight away. Each string column is compressed on its own, and is only
+    decompressed when something needs it.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        with open(filename, 'rb') as file:
+            self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, num_columns, self.num_reports = _HEADER.unpack_from(self.map, 0)
+        if magic != _MAGIC or version != _VERSION or num_columns != len(COLUMNS):
+            self.map.close()
+            raise ValueError(f"{filename} isn't a version {_VERSION} workout archive.")
+
+        sizes = struct.unpack_from(f'<{num_columns}Q', self.map, _HEADER.size)
+        times_start = _HEADER.size + 8 * num_columns
+        self.times = _read_array('d', self.map[times_start:times_start + 8 * self.num_reports])
+        # column name -> (start, end) of the compressed column in the file
+        self.column_spans = {}
+        start = times_start + 8 * self.num_reports
+        for column, size in zip(COLUMNS, sizes):
+            self.column_spans[column] = (start, start + size)
+            start += size
+        # The (report_id, workout_id, workout_name) of every report, once it's needed
+        self.entries = None
+
+    def close(self):
+        """Release the memory map."""
+        self.map.close()
+
+    def report_ids(self):
+        """Get the id of every report in the file. Only reports whose id is exactly the repr of their time are
+        archived, so the ids are rebuilt from the times.
+
+        :return: (list of strs) the report ids, sorted by time
+        """
+        return [repr(report_time) for report_time in self.times]
+
+    def contains(self, report_id):
+        """Check whether a report is in the file, with a bisection of the times.
+
+        :param report_id: (str) the id of the report
+        :return: (bool) True if it's there
+        """
+        report_time = float(report_id)
+        position = bisect_left(self.times, report_time)
+        return position < len(self.times) and self.times[position] == report_time and repr(report_time) == report_id
+
+    def column(self, column):
+        """Decompress one string column.
+
+        :param column: (str) the name of the column, one of COLUMNS
+        :return: (list) the column's value for every report, with _MISSING for fields the report doesn't have
+        """
+        start, end = self.column_spans[column]
+        return _decode_column(zlib.decompress(self.map[start:end]), self.num_reports)
+
+    def get_entries(self):
+        """Get the id, workout id and workout name of every report, decompressing only the two columns they need.
+
+        :return: (list of tuples) (report_id, workout_id, workout_name). workout_name is only stored for unscheduled
+                 reports, since a scheduled report takes the name of its workout
+        """
+        if self.entries is None:
+            workout_names = self.column('workout_name')
+            self.entries = [(report_id, workout_id, None if workout_name is _MISSING else workout_name)
+                            for report_id, workout_id, workout_name
+                            in zip(self.report_ids(), self.column('workout_id'), workout_names)]
+        return self.entries
+
+    def read_rows(self):
+        """Decompress every column and rebuild the reports.
+
+        :return: (dict) {report_id: (workout_id, report)}, where report is a Report for scheduled reports and an
+                 UnscheduledWorkout for unscheduled ones
+        """
+        columns = {column: self.column(column) for column in COLUMNS}
+        rows = {}
+        for position, report_id in enumerate(self.report_ids()):
+            workout_id = columns['workout_id'][position]
+            report = UnscheduledWorkout() if workout_id is None else Report()
+            for column in COLUMNS[1:]:
+                value = columns[column][position]
+                if value is not _MISSING:
+                    report[column] = value
+            rows[report_id] = (workout_id, report)
+        return rows
+
+
+class Archive:
+    """Cold storage for old reports: a directory of compressed, column-oriented files, one per user per year, named
+    <user_id>-<year>.wkar.
+
+    The indexes count archived reports along with the resident ones, so the report pickers list archived years and
+    days without reading anything but the report times. A year's reports are only decompressed (paged in) when one of
+    them is looked at, and the most recently paged in years are kept in an LRU cache.
+
+    A report that is both resident and archived, which can happen when the bot stops between an archive file being
+    written and the resident copy being deleted, is read from the resident database. A report that was deleted from the
+    database is hidden until it's dropped from the archive, which waits until the delete is durable. The archive isn't
+    thread-safe, so the backend only uses it while holding the database lock, except for write_add(), which only works
+    on files of its own so that the disk work of archiving can be done with the database unlocked.
+    """
+
+    def __init__(self, cache_years=8):
+        self.directory = None
+        self.cache_years = cache_years
+        # user_id -> {year: ArchiveFile}
+        self.files = {}
+        # (user_id, year) -> the year's read_rows(), most recently used last
+        self.paged_in = OrderedDict()
+        # (user_id, year) -> how many times the year's file has been replaced, so that finish_add() can tell whether
+        # it changed while write_add() was running. Kept across close() and open()
+        self.versions = {}
+        # user_id -> the ids of the archived reports that were deleted from the database, but not yet from here
+        self.hidden = {}
+
+    def open(self, directory):
+        """Open every archive file in a directory. The directory is created when the first file is written.
+
+        :param directory: (str) the path of the directory
+        """
+        self.close()
+        self.directory = directory
+        if not os.path.isdir(directory):
+            return
+        for filename in sorted(os.listdir(directory)):
+            if not filename.endswith('.wkar'):
+                continue
+            user_id, year = filename[:-len('.wkar')].rsplit('-', 1)
+            archive_file = ArchiveFile(os.path.join(directory, filename))
+            metrics.count_bytes('read', archive_file.column_spans[COLUMNS[0]][0])
+            self.files.setdefault(user_id, {})[int(year)] = archive_file
+
+    def close(self):
+        """Close every archive file."""
+        for years in self.files.values():
+            for archive_file in years.values():
+                archive_file.close()
+        self.files = {}
+        self.paged_in = OrderedDict()
+        self.hidden = {}
+
+    def has_user(self, user_id):
+        """Check whether any of a user's reports are archived.
+
+        :param user_id: (str) the Discord ID of the user
+        :return: (bool) True if they are
+        """
+        return user_id in self.files
+
+    def contains(self, user_id, report_id):
+        """Check whether a report is archived, without decompressing anything.
+
+        :param user_id: (str) the Discord ID of the user
+        :param report_id: (str) the id of the report
+        :return: (bool) True if it is
+        """
+        return self._stored(user_id, report_id) and report_id not in self.hidden.get(user_id, ())
+
+    def hide(self, user_id, report_id):
+        """Hide an archived report that was just deleted from the database, until drop() deletes it from here too.
+
+        :param user_id: (str) the Discord ID of the user
+        :param report_id: (str) the id of the report
+        """
+        if self._stored(user_id, report_id):
+            self.hidden.setdefault(user_id, set()).add(report_id)
+
+    def unhide(self, user_id, report_id):
+        """Show a hidden report again, since the delete was rolled back.
+
+        :param user_id: (str) the Discord ID of the user
+        :param report_id: (str) the id of the report
+        """
+        if report_id in self.hidden.get(user_id, ()):
+            self.hidden[user_id].discard(report_id)
+            if not self.hidden[user_id]:
+                del self.hidden[user_id]
+
+    def report_ids(self, user_id, user):
+        """Get the id of every archived report of a user, leaving out the same reports as entries() does.
+
+        :param user_id: (str) the Discord ID of the user
+        :param user: (User) the user's resident data
+        :return: (list of strs) the report ids
+        """
+        return [report_id for report_id, workout_id, workout_name in self.entries(user_id, user)]
+
+    def entries(self, user_id, user):
+        """Get the id, workout id and workout name of every archived report of a user, in the same form as the
+        indexes' report_entries(). Reports that are also resident or hidden are left out, and so are reports whose
+        workout no longer exists.
+
+        :param user_id: (str) the Discord ID of the user
+        :param user: (User) the user's resident data
+        :return: (list of tuples) (report_id, workout_id, workout_name) for every archived report
+        """
+        if user_id not in self.files:
+            return []
+        resident = _resident_report_ids(user) | self.hidden.get(user_id, set())
+        entries = []
+        for year in sorted(self.files[user_id]):
+            for report_id, workout_id, workout_name in self.files[user_id][year].get_entries():
+                if report_id in resident:
+                    continue
+                if workout_id is None:
+                    entries.append((report_id, None, workout_name))
+                elif workout_id in user.scheduled_workout:
+                    entries.append((report_id, workout_id, user.scheduled_workout[workout_id].workout_name))
+        return entries
+
+    def completions(self, user_id, user):
+        """Get the id, workout id and completion of every archived report of a user, decompressing only the columns
+        they need. Like entries(), reports that are also resident or hidden, or whose workout no longer exists, are left
+        out.
+
+        :param user_id: (str) the Discord ID of the user
+        :param user: (User) the user's resident data
+        :return: (list of tuples) (report_id, workout_id, completion) for every archived report. workout_id and
+                 completion are None for unscheduled reports
+        """
+        if user_id not in self.files:
+            return []
+        resident = _resident_report_ids(user) | self.hidden.get(user_id, set())
+        completions = []
+        for year in sorted(self.files[user_id]):
+            archive_file = self.files[user_id][year]
+            for report_id, workout_id, completion in zip(archive_file.report_ids(), archive_file.column('workout_id'),
+                                                         archive_file.column('completion')):
+                if report_id in resident or (workout_id is not None and workout_id not in user.scheduled_workout):
+                    continue
+                completions.append((report_id, workout_id, None if completion is _MISSING else completion))
+        return completions
+
+    def get(self, user_id, report_id):
+        """Look up an archived report, paging in its year if it isn't already.
+
+        :param user_id: (str) the Discord ID of the user
+        :param report_id: (str) the id of the report
+        :return: (tuple) (workout_id, report), or None if the report isn't archived. workout_id is None for
+                 unscheduled reports. The report belongs to the archive, so treat it as read-only
+        """
+        if not self.contains(user_id, report_id):
+            return None
+        return self.page_in(user_id, _year_of(report_id))[report_id]
+
+    def workout_reports(self, user_id, workout_id):
+        """Get every archived report of a scheduled workout, paging in only the years it has reports in.
+
+        :param user_id: (str) the Discord ID of the user
+        :param workout_id: (str) the id of the workout
+        :return: (dict) {report_id: report} for every archived report of the workout that isn't hidden
+        """
+        hidden = self.hidden.get(user_id, ())
+        reports = {}
+        for year, archive_file in sorted(self.files.get(user_id, {}).items()):
+            if any(entry[1] == workout_id for entry in archive_file.get_entries()):
+                rows = self.page_in(user_id, year)
+                reports.update((report_id, report) for report_id, (row_workout_id, report) in rows.items()
+                               if row_workout_id == workout_id and report_id not in hidden)
+        return reports
+
+    def page_in(self, user_id, year):
+        """Decompress all of a user's archived reports from one year, or get them from the cache.
+
+        :param user_id: (str) the Discord ID of the user
+        :param year: (int) the year
+        :return: (dict) {report_id: (workout_id, report)}
+        """
+        key = (user_id, year)
+        if key in self.paged_in:
+            self.paged_in.move_to_end(key)
+            return self.paged_in[key]
+
+        with metrics.timer('storage', 'page_in'):
+            rows = self.files[user_id][year].read_rows()
+        self.paged_in[key] = rows
+        if len(self.paged_in) > self.cache_years:
+            self.paged_in.popitem(last=False)
+        return rows
+
+    def start_add(self, user_id, year, rows):
+        """Start archiving reports, which are merged into the year's file if there already is one. This takes three
+        steps, so that the database doesn't have to stay locked while the file is read, merged and written. This one
+        takes note of the year's file as it is now.
+
+        :param user_id: (str) the Discord ID of the user
+        :param year: (int) the year the reports were made in
+        :param rows: (list of tuples) (report_id, workout_id, report) for every report, where workout_id is None for
+                     unscheduled reports. Only reports that archivable() accepts can be archived, and they must be
+                     copies that nothing else changes
+        :return: (tuple) what write_add() needs
+        """
+        return self.directory, user_id, year, rows, self.versions.get((user_id, year), 0)
+
+    def write_add(self, adding):
+        """Merge the reports into a new copy of their year's file and make it durable, without touching anything the
+        other methods use, so this can run without holding the database lock.
+
+        :param adding: (tuple) what start_add() returned
+        :return: (tuple) what finish_add() or cancel_add() needs
+        """
+        directory, user_id, year, rows, version = adding
+        filename = os.path.join(directory, f"{user_id}-{year}.wkar")
+        merged = {}
+        try:
+            archive_file = ArchiveFile(filename)
+        except FileNotFoundError:
+            pass
+        else:
+            try:
+                merged.update(archive_file.read_rows())
+            finally:
+                archive_file.close()
+        merged.update((report_id, (workout_id, report)) for report_id, workout_id, report in rows)
+
+        os.makedirs(directory, exist_ok=True)
+        descriptor, temp_filename = tempfile.mkstemp(suffix='.adding', prefix=f"{user_id}-{year}.", dir=directory)
+        os.close(descriptor)
+        _write_durably(temp_filename, _encode_file(merged))
+        return directory, user_id, year, version, temp_filename
+
+    def finish_add(self, written):
+        """Swap in the file write_add() wrote, unless the year's file was replaced while it was being written, since
+        the new file would undo that change. The file is durable by then, so the resident copies can be deleted.
+
+        :param written: (tuple) what write_add() returned
+        :return: (bool) True if the reports are archived now, and their resident copies can be deleted
+        """
+        directory, user_id, year, version, temp_filename = written
+        if directory != self.directory or self.versions.get((user_id, year), 0) != version:
+            self.cancel_add(written)
+            return False
+        self._install(user_id, year, temp_filename)
+        return True
+
+    def cancel_add(self, written):
+        """Throw away the file write_add() wrote.
+
+        :param written: (tuple) what write_add() returned
+        """
+        os.remove(written[-1])
+
+    def drop(self, user_id, matches):
+        """Delete archived reports, rewriting the files they were in.
+
+        :param user_id: (str) the Discord ID of the user
+        :param matches: (function) called with (report_id, workout_id) for every archived report of the user. The
+                        reports it returns True for are deleted
+        :return: (int) how many reports were deleted
+        """
+        dropped = 0
+        for year, archive_file in list(self.files.get(user_id, {}).items()):
+            doomed = [report_id for report_id, workout_id, workout_name in archive_file.get_entries()
+                      if matches(report_id, workout_id)]
+            if not doomed:
+                continue
+            rows = dict(self.page_in(user_id, year))
+            for report_id in doomed:
+                del rows[report_id]
+                self.unhide(user_id, report_id)
+            self._write(user_id, year, rows)
+            dropped += len(doomed)
+        return dropped
+
+    def drop_path(self, path):
+        """Delete the archived reports that belonged to whatever was at a path of the database, ex: every archived
+        report of a workout once the workout is deleted. Reports can't outlive the user or workout they belong to just
+        because they were archived.
+
+        :param path: (tuple) the keys leading to a value that was deleted or replaced
+        :return: (int) how many reports were deleted
+        """
+        if len(path) < 2 or path[1] not in self.files:
+            return 0
+        user_id = path[1]
+        if len(path) == 2:
+            return self.drop(user_id, lambda report_id, workout_id: True)
+
+        kind = path[2]
+        if kind == 'unscheduled_workout':
+            if len(path) == 3:
+                return self.drop(user_id, lambda report_id, workout_id: workout_id is None)
+            if len(path) == 4 and self._stored(user_id, path[3]):
+                return self.drop(user_id, lambda report_id, workout_id: report_id == path[3] and workout_id is None)
+        elif kind == 'scheduled_workout':
+            if len(path) == 3:
+                return self.drop(user_id, lambda report_id, workout_id: workout_id is not None)
+            if len(path) == 4 or (len(path) == 5 and path[4] == 'reports'):
+                return self.drop(user_id, lambda report_id, workout_id: workout_id == path[3])
+            if len(path) == 6 and path[4] == 'reports' and self._stored(user_id, path[5]):
+                return self.drop(user_id, lambda report_id, workout_id: report_id == path[5] and workout_id == path[3])
+        return 0
+
+    def _stored(self, user_id, report_id):
+        """Check whether a report is in its year's file, hidden or not."""
+        archive_file = self._file_for(user_id, report_id)
+        return archive_file is not None and archive_file.contains(report_id)
+
+    def _file_for(self, user_id, report_id):
+        """Get the file a report would be archived in, if that file exists."""
+        try:
+            year = _year_of(report_id)
+        except ValueError:
+            return None
+        return self.files.get(user_id, {}).get(year)
+
+    def _write(self, user_id, year, rows):
+        """Write a year's file from scratch, or remove it if there are no rows left, and reopen it."""
+        filename = os.path.join(self.directory, f"{user_id}-{year}.wkar")
+        if not rows:
+            self._close_year(user_id, year)
+            if os.path.isfile(filename):
+                os.remove(filename)
+            if not self.files.get(user_id):
+                self.files.pop(user_id, None)
+            return
+
+        os.makedirs(self.directory, exist_ok=True)
+        temp_filename = filename + '.tmp'
+        _write_durably(temp_filename, _encode_file(rows))
+        self._install(user_id, year, temp_filename)
+
+    def _install(self, user_id, year, temp_filename):
+        """Swap a newly written file in for a year's file, and open it."""
+        self._close_year(user_id, year)
+        filename = os.path.join(self.directory, f"{user_id}-{year}.wkar")
+        os.replace(temp_filename, filename)
+        self.files.setdefault(user_id, {})[year] = ArchiveFile(filename)
+
+    def _close_year(self, user_id, year):
+        """Close a year's file and forget what was paged in from it, before it is replaced or removed."""
+        old_file = self.files.get(user_id, {}).pop(year, None)
+        if old_file is not None:
+            old_file.close()
+        self.paged_in.pop((user_id, year), None)
+        self.versions[(user_id, year)] = self.versions.get((user_id, year), 0) + 1
+
+
+def archivable(report_id, report):
+    """Check whether a report can be archived. Its id has to be the repr of its time, which it is for every report the
+    bot creates, so that the id can be rebuilt from the time column, and every field has to be a known one holding a
+    string or None.
+
+    :param report_id: (str) the id of the report
+    :param report: (Report or UnscheduledWorkout) the report
+    :return: (bool) True if it can be archived
+    """
+    try:
+        if repr(float(report_id)) != report_id:
+            return False
+    except ValueError:
+        return False
+    if not isinstance(report, (Report, UnscheduledWorkout)) or report.extra:
+        return False
+    return all(value is None or isinstance(value, str) for value in report.values())
+
+
+def _write_durably(filename, data):
+    """Write a file and wait until it is durable."""
+    with open(filename, 'wb') as file:
+        file.write(data)
+        file.flush()
+        os.fsync(file.fileno())
+    metrics.count_bytes('written', len(data))
+
+
+def _year_of(report_id):
+    """Get the year a report was made in, in local time like the report calendar.
+
+    :param report_id: (str) the id of the report, which is also its unix time
+    :return: (int) the year
+    """
+    return datetime.fromtimestamp(float(report_id)).year
+
+
+def _resident_report_ids(user):
+    """Gather the ids of all of a user's resident reports, scheduled and unscheduled."""
+    report_ids = set(user.unscheduled_workout)
+    for workout in user.scheduled_workout.values():
+        report_ids.update(workout.reports)
+    return report_ids
+
+
+def _read_array(typecode, data):
+    """Read a little-endian array."""
+    values = array(typecode)
+    values.frombytes(data)
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values
+
+
+def _array_bytes(values):
+    """Get the bytes of an array in little-endian order."""
+    if sys.byteorder == 'big':
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _encode_file(rows):
+    """Lay out an archive file.
+
+    :param rows: (dict) {report_id: (workout_id, report)}
+    :return: (bytes) the file's contents
+    """
+    report_ids = sorted(rows, key=float)
+    times = array('d', (float(report_id) for report_id in report_ids))
+    columns = [_encode_column([rows[report_id][0] for report_id in report_ids])]
+    for column in COLUMNS[1:]:
+        columns.append(_encode_column([rows[report_id][1].get(column, _MISSING) for report_id in report_ids]))
+
+    header = _HEADER.pack(_MAGIC, _VERSION, len(COLUMNS), len(report_ids))
+    sizes = struct.pack(f'<{len(COLUMNS)}Q', *(len(column) for column in columns))
+    return b''.join([header, sizes, _array_bytes(times)] + columns)
+
+
+def _encode_column(values):
+    """Dictionary-encode and compress a string column. Each distinct string is stored once, and every report gets the
+    position of its string in the dictionary, or _MISSING_CODE or _NONE_CODE.
+
+    :param values: (list) a str, None or _MISSING for every report
+    :return: (bytes) the compressed column
+    """
+    dictionary = {}
+    codes = array('i')
+    for value in values:
+        if value is _MISSING:
+            codes.append(_MISSING_CODE)
+        elif value is None:
+            codes.append(_NONE_CODE)
+        else:
+            codes.append(dictionary.setdefault(value, len(dictionary)))
+
+    strings = [string.encode() for string in dictionary]
+    lengths = array('I', (len(string) for string in strings))
+    return zlib.compress(struct.pack('<I', len(strings)) + _array_bytes(lengths) + _array_bytes(codes)
+                         + b''.join(strings))
+
+
+def _decode_column(data, num_reports):
+    """Decode a decompressed string column.
+
+    :param data: (bytes) the decompressed column
+    :param num_reports: (int) how many reports the file holds
+    :return: (list) a str, None or _MISSING for every report
+    """
+    num_strings = struct.unpack_from('<I', data)[0]
+    lengths_end = 4 + 4 * num_strings
+    codes_end = lengths_end + 4 * num_reports
+    lengths = _read_array('I', data[4:lengths_end])
+    codes = _read_array('i', data[lengths_end:codes_end])
+
+    strings = []
+    position = codes_end
+    for length in lengths:
+        strings.append(data[position:position + length].decode())
+        position += length
+
+    return [_MISSING if code == _MISSING_CODE else None if code == _NONE_CODE else strings[code] for code in codes]
@@ -0,0 +1,62 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial, wraps
+from decouple import config
+
+from workout_main import (schedule_routine_main, report_scheduled_main, report_unscheduled_main,
+                          edit_workout_main, edit_report_main, view_report_main, view_workout_main,
+                          delete_report_main, delete_workout_main, stats_main, adherence_main,
+                          leaderboard_main, export_main, import_main, reminder_main)
+from workout_quickfetches import (reports_years_quickfetch, reports_months_quickfetch, reports_days_quickfetch,
+                                  reports_by_day_quickfetch, fields_in_report_quickfetch, workouts_quickfetch)
+
+# All blocking storage work runs on this bounded pool, so the event loop that handles interactions never waits on
+# the disk or on parsing, and a burst of commands can't start an unbounded number of threads
+_io_pool = ThreadPoolExecutor(max_workers=config("IO_THREADS", default=4, cast=int), thread_name_prefix='workout-io')
+
+
+async def run_blocking(function, *args, **kwargs):
+    """Run a blocking function on the I/O thread pool and wait for it without blocking the event loop.
+
+    :param function: (function) the blocking function
+    :return: (any) whatever the function returns. Exceptions it raises are raised here, too
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_io_pool, partial(function, *args, **kwargs))
+
+
+def _async_version(function):
+    """Make a coroutine function that runs a blocking function on the I/O thread pool.
+
+    :param function: (function) the blocking function
+    :return: (function) a coroutine function taking the same arguments
+    """
+    @wraps(function)
+    async def run(*args, **kwargs):
+        return await run_blocking(function, *args, **kwargs)
+
+    return run
+
+
+schedule_routine_async = _async_version(schedule_routine_main)
+report_scheduled_async = _async_version(report_scheduled_main)
+report_unscheduled_async = _async_version(report_unscheduled_main)
+edit_workout_async = _async_version(edit_workout_main)
+edit_report_async = _async_version(edit_report_main)
+view_report_async = _async_version(view_report_main)
+view_workout_async = _async_version(view_workout_main)
+delete_report_async = _async_version(delete_report_main)
+delete_workout_async = _async_version(delete_workout_main)
+stats_async = _async_version(stats_main)
+adherence_async = _async_version(adherence_main)
+leaderboard_async = _async_version(leaderboard_main)
+export_async = _async_version(export_main)
+import_async = _async_version(import_main)
+reminder_async = _async_version(reminder_main)
+
+reports_years_quickfetch_async = _async_version(reports_years_quickfetch)
+reports_months_quickfetch_async = _async_version(reports_months_quickfetch)
+reports_days_quickfetch_async = _async_version(reports_days_quickfetch)
+reports_by_day_quickfetch_async = _async_version(reports_by_day_quickfetch)
+fields_in_report_quickfetch_async = _async_version(fields_in_report_quickfetch)
+workouts_quickfetch_async = _async_version(workouts_quickfetch)
@@ -1,20 +1,360 @@
-import json
+import atexit
+import threading
+import time
+import traceback
+from collections.abc import Mapping
+from concurrent.futures import Future
+from contextlib import contextmanager
 from datetime import datetime
+from types import MappingProxyType
+
 from decouple import config
 
+from workout_adherence import compute_adherence, schedule_mask
+from workout_archive import Archive, archivable
+from workout_indexes import ReportTimeIndex, ReportWorkoutIndex, WorkoutSearchIndex, CalendarIndex
+from workout_leaderboard import Leaderboard, RANKINGS
+from workout_metrics import metrics, instrumented
+from workout_models import (User, ScheduledWorkout, UnscheduledWorkout, Report, ScheduledReportView,
+                            decode_database)
+from workout_reminders import ReminderScheduler
+from workout_stats import WorkoutStats, SKIPPED
+from workout_storage import open_engine, lookup_path
+
+# The whole database lives in memory once load_store() has run. Every read is served from _store. Every write changes
+# _store in place and then queues the change, along with a future for it, for the writer thread. The writer drains
+# the whole queue at once and persists it as one batch, so a burst of commands costs one write and one fsync instead
+# of one per command, and a command never waits on the disk unless it asks to by waiting on its future.
+_store = None
+_store_lock = threading.RLock()
+_engine = None
+_pending = []
+_pending_futures = []
+_writer = None
+_writer_wakeup = threading.Condition(_store_lock)
+_flush_requested = threading.Event()
+_stopping = False
+# The future of the most recent change, which resolves once everything queued up to it is durable
+_last_future = None
+# The thread start_archiver() started, if any
+_archiver = None
+# The transaction in progress, if any. Only one thread can be in a transaction at a time, since it holds the lock
+_transaction = None
+# The paths whose archived reports the change being made outside of a transaction has made obsolete
+_dropped_paths = []
+
+# Functions that are called with (op, path, old_value, new_value) after every change to the resident database, so that
+# indexes can be kept up to date incrementally. Loading the database counts as setting the path ().
+_listeners = []
+# Reports older than ARCHIVE_AFTER_DAYS are moved out of the resident database into the archive. The indexes count
+# them, and a year of them is only paged in when one is looked at
+_archive = Archive(config("ARCHIVE_CACHE_YEARS", default=8, cast=int))
+_report_time_index = ReportTimeIndex(_archive)
+_report_workout_index = ReportWorkoutIndex(_archive)
+_calendar_index = CalendarIndex(_archive)
+_workout_name_index = WorkoutSearchIndex()
+_workout_stats = WorkoutStats(_archive)
+_leaderboard = Leaderboard(_archive)
+# The next reminder for every scheduled workout, kept up to date as schedules change once start_reminders() has run
+_reminder_scheduler = ReminderScheduler(config("REMINDER_HOUR", default=9, cast=int))
+
+
+@instrumented('backend')
+def load_store():
+    """Load the database into memory. This is called once from on_ready, but it is also done lazily by the first
+    read or write so that scripts can use the backend without starting the bot.
+
+    :return: (dict) the resident copy of the database
+    """
+    global _store, _engine
+    with _store_lock:
+        if _engine is None:
+            _engine = open_engine()
+            _archive.open(config("ARCHIVE_DIRECTORY", default='archive'))
+        with metrics.timer('storage', 'load'):
+            _store = decode_database(_engine.load())
+        _notify('set', (), None, _store)
+
+    return _store
+
+
+def add_listener(listener):
+    """Register a function to be called with (op, path, old_value, new_value) after every change to the resident
+    database. It is called while the database is locked, so it has to be quick and must not write to the database.
+
+    :param listener: (function) the function to be called
+    """
+    _listeners.append(listener)
+
+
+def _notify(op, path, old_value, new_value):
+    """Tell every listener about a change to the resident database."""
+    for listener in _listeners:
+        listener(op, path, old_value, new_value)
+
+
+@instrumented('backend')
+def flush_store():
+    """Wait until every change made to the resident database so far is durable, without waiting out the rest of the
+    batching window. Must not be called while holding the database lock, since the writer thread needs it.
+    """
+    with _store_lock:
+        future = _last_future
+    if future is None:
+        return
+    _flush_requested.set()
+    future.result()
+
+
+def _get_store():
+    """Return the resident database, loading it from disk first if that hasn't happened yet.
+
+    :return: (dict) the resident copy of the database
+    """
+    if _store is None:
+        load_store()
+    return _store
+
+
+def _set(path, value, notify=True):
+    """Set the value at the end of a path of keys in the resident database and queue it to be persisted.
+
+    :param path: (tuple) the keys leading to the value, ex: ('users', '1234', 'username')
+    :param value: (any) the new value
+    :param notify: (bool) whether to tell the listeners. Only moving reports between the archive and the resident
+                   database skips this, since the reports themselves don't change
+    :return: (Future) resolves once the change is durable
+    """
+    with _store_lock:
+        node = _get_store()
+        for key in path[:-1]:
+            node = node[key]
+        existed = path[-1] in node
+        old_value = node.get(path[-1])
+        node[path[-1]] = value
+        if _transaction is not None:
+            _transaction.undo.append((path, existed, old_value, notify))
+        if notify:
+            _notify('set', path, old_value, value)
+        return _queue_mutation('set', path, value)
+
+
+def _delete(path, notify=True):
+    """Delete the value at the end of a path of keys in the resident database and queue it to be persisted.
+
+    :param path: (tuple) the keys leading to the value to be deleted
+    :param notify: (bool) whether to tell the listeners, like in _set()
+    :return: (Future) resolves once the change is durable
+    """
+    with _store_lock:
+        node = _get_store()
+        for key in path[:-1]:
+            node = node[key]
+        old_value = node.pop(path[-1])
+        if _transaction is not None:
+            _transaction.undo.append((path, True, old_value, notify))
+        if notify:
+            _notify('delete', path, old_value, None)
+        return _queue_mutation('delete', path, None)
+
+
+def _queue_mutation(op, path, value):
+    """Hand a change that has been made to the resident database to the writer thread, starting it if need be. Must be
+    called while holding the database lock, so the queue is in the same order as the changes.
+
+    :param op: (str) 'set' or 'delete'
+    :param path: (tuple) the keys leading to the changed value
+    :param value: (any) the new value, or None for a delete
+    :return: (Future) resolves once the change is durable
+    """
+    global _writer, _last_future, _dropped_paths
+    future = Future()
+    _pending.append((op, path, value))
+    _pending_futures.append(future)
+    _last_future = future
+    if _dropped_paths:
+        _drop_archived_once_durable(future, _dropped_paths)
+        _dropped_paths = []
+    if _writer is None:
+        _writer = threading.Thread(target=_write_batches, name='workout-writer', daemon=True)
+        _writer.start()
+    _writer_wakeup.notify()
+    return future
+
+
+def _write_batches():
+    """The writer thread. Waits for changes to be queued, gives more of them WRITE_BEHIND_SECONDS to pile up, then
+    persists everything in the queue as one batch and resolves the batch's futures. Changes queued while a batch is
+    being written go into the next one, so batches grow by themselves when writes come in faster than the disk."""
+    global _pending, _pending_futures
+    window = config("WRITE_BEHIND_SECONDS", default=2.0, cast=float)
+    while True:
+        with _store_lock:
+            while not _pending and not _stopping:
+                _writer_wakeup.wait()
+            if not _pending:
+                return
+
+        if not _stopping:
+            _flush_requested.wait(window)
+        _flush_requested.clear()
+
+        # The batch is prepared while the database is locked, but written with it unlocked, so commands carry on
+        # while the engine waits on the disk
+        with _store_lock:
+            mutations, futures = _pending, _pending_futures
+            _pending, _pending_futures = [], []
+            try:
+                with metrics.timer('storage', 'prepare'):
+                    batch = _engine.prepare(_store, mutations)
+            except Exception as error:
+                _fail_batch(futures, error)
+                continue
+
+        try:
+            with metrics.timer('storage', 'write'):
+                _engine.write(batch)
+        except Exception as error:
+            _fail_batch(futures, error)
+            continue
+        for future in futures:
+            future.set_result(None)
+
+
+def _fail_batch(futures, error):
+    """Report a batch that couldn't be persisted, and pass the error on to everybody waiting for it."""
+    traceback.print_exception(type(error), error, error.__traceback__)
+    for future in futures:
+        future.set_exception(error)
+
+
+@instrumented('backend')
+def close_store():
+    """Write out everything that is still queued, stop the writer thread and let the storage engine finish its work."""
+    global _engine, _writer, _stopping, _last_future
+    with _store_lock:
+        if _engine is None:
+            return
+        _stopping = True
+        _writer_wakeup.notify()
+        writer = _writer
+    _flush_requested.set()
+    if writer is not None:
+        writer.join()
+
+    with _store_lock:
+        _engine.close()
+        _engine = None
+        _archive.close()
+        _writer = None
+        _stopping = False
+        # Every change has been written or has failed by now, so flush_store() has nothing left to wait for
+        _last_future = None
+        _flush_requested.clear()
+
 
+# Make sure nothing that is still queued for the writer thread is lost when the bot shuts down
+atexit.register(close_store)
+
+
+@instrumented('backend')
 def read_json():
-    """Read all data from a JSON file.
+    """Read all data from the database. The returned dict is the resident copy, so treat it as read-only.
 
     :return: (dict) all the data that was in the JSON file
     """
-    filename = config("FILENAME")
-    with open(filename, 'r') as file:
-        json_data = json.load(file)
+    return _get_store()
+
+
+class _Transaction:
+    """What a transaction needs to commit or roll back: the changes it has made and the archive work held back until
+    it commits."""
+    __slots__ = ('undo', 'dropped_paths', 'hidden', 'pending_start', 'last_future')
+
+    def __init__(self):
+        # (path, whether the path held a value before, the value before, whether the listeners were told) for every
+        # change, in order
+        self.undo = []
+        # The paths whose archived reports are to be deleted, which can't be undone, so it waits until the
+        # transaction's changes are durable
+        self.dropped_paths = []
+        # The archived reports that were hidden before the transaction. Nothing is dropped from the archive while the
+        # transaction holds the lock, so rolling back just puts this back
+        self.hidden = {user_id: set(report_ids) for user_id, report_ids in _archive.hidden.items()}
+        # Where the transaction's changes start in the writer thread's queue, and the last future from before them
+        self.pending_start = len(_pending)
+        self.last_future = _last_future
+
+
+@contextmanager
+def transaction():
+    """Make several reads and changes as one. The database stays locked throughout, so what is read is a consistent
+    snapshot that no other command changes midway, and the changes all go out to disk together in one write. If an
+    exception escapes the block, every change made in it is undone, in memory and in the indexes, before any of them
+    reach the disk, and the exception carries on. A transaction inside another one is part of the outer one.
+
+    Don't wait on a future or call flush_store() inside a transaction, since the writer thread can't write anything
+    until the database is unlocked.
+
+    :return: (dict) the resident copy of the database, to read from while the transaction is open
+    """
+    global _transaction
+    with _store_lock:
+        if _transaction is not None:
+            yield _get_store()
+            return
 
-    return json_data
+        store = _get_store()
+        _transaction = _Transaction()
+        try:
+            yield store
+        except BaseException as error:
+            _rollback(_transaction, error)
+            raise
+        else:
+            if _transaction.dropped_paths:
+                _drop_archived_once_durable(_last_future, _transaction.dropped_paths)
+        finally:
+            _transaction = None
 
 
+def _rollback(rolled_back, error):
+    """Undo every change a transaction has made, newest first, and take them back out of the writer thread's queue.
+    Must be called while holding the database lock, before the transaction has ended.
+
+    :param rolled_back: (_Transaction) the transaction
+    :param error: (BaseException) what went wrong, which is passed on to everybody waiting on the changes' futures
+    """
+    global _last_future
+    for path, existed, old_value, notify in reversed(rolled_back.undo):
+        node = _store
+        for key in path[:-1]:
+            node = node[key]
+        new_value = node.get(path[-1])
+        if existed:
+            node[path[-1]] = old_value
+            if notify:
+                _notify('set', path, new_value, old_value)
+        else:
+            del node[path[-1]]
+            if notify:
+                _notify('delete', path, new_value, None)
+    # The archived reports of anything the transaction deleted are still there, but they may have been hidden, and the
+    # indexes may have been rebuilt without them
+    _archive.hidden = rolled_back.hidden
+    for user_id in {path[1] for path in rolled_back.dropped_paths}:
+        _forget_indexes(user_id)
+
+    # Nothing else can have been queued since the transaction started, since it has held the lock all along
+    futures = _pending_futures[rolled_back.pending_start:]
+    del _pending[rolled_back.pending_start:]
+    del _pending_futures[rolled_back.pending_start:]
+    _last_future = rolled_back.last_future
+    for future in futures:
+        future.set_exception(error)
+
+
+@instrumented('backend')
 def edit_value(user_id, field, new_value,
                scheduled_or_unscheduled=None, workout_unixid=None, report_unixid=None):
     """Edit a value for a particular user in the JSON file.
@@ -25,45 +365,40 @@ def edit_value(user_id, field, new_value,
     :param scheduled_or_unscheduled: (str) 'scheduled_workout' or 'unscheduled_workout' depending on which is needed
     :param workout_unixid: (float) if it's something inside a workout that needs to be changed, the workout's unix time
     :param report_unixid: (float) if it's something inside a report that needs to be changed, the report's unix time
+    :return: (Future) resolves once the change is durable
     """
-    filename = config("FILENAME")
     user_id = str(user_id)
-    with open(filename, 'r') as file:
-        json_data = json.load(file)
     if not scheduled_or_unscheduled:
-        json_data['users'][user_id][field] = new_value
+        path = ('users', user_id, field)
     else:
         if scheduled_or_unscheduled != 'scheduled_workout' and scheduled_or_unscheduled != 'unscheduled_workout':
             raise ValueError('In edit_value, scheduled_or_unscheduled must be either None or '
                              '"scheduled_workout" or "unscheduled_workout".')
         if not report_unixid:
-            json_data['users'][user_id][scheduled_or_unscheduled][workout_unixid][field] = new_value
+            path = ('users', user_id, scheduled_or_unscheduled, workout_unixid, field)
         elif not workout_unixid:
-            json_data['users'][user_id][scheduled_or_unscheduled][report_unixid][field] = new_value
+            path = ('users', user_id, scheduled_or_unscheduled, report_unixid, field)
         else:
-            json_data['users'][user_id][scheduled_or_unscheduled][workout_unixid]['reports'][report_unixid][field] \
-                = new_value
+            path = ('users', user_id, scheduled_or_unscheduled, workout_unixid, 'reports', report_unixid, field)
 
-    with open(filename, 'w') as file:
-        json.dump(json_data, file, indent=4)
+    with _store_lock:
+        if report_unixid:
+            _thaw(user_id, report_unixid)
+        return _set(path, new_value)
 
 
+@instrumented('backend')
 def add_user(user_id, user_nick):
     """Adds to the json a user that is reporting/scheduling their first workout.
 
     :param user_id: (int) the Discord ID of the new user
     :param user_nick: (str) the Discord display name of the new user
+    :return: (Future) resolves once the change is durable
     """
-    filename = config("FILENAME")
-    with open(filename, 'r') as file:
-        json_data = json.load(file)
-
-    json_data['users'][str(user_id)] = {'username': user_nick, 'unscheduled_workout': {}, 'scheduled_workout': {}}
-
-    with open(filename, 'w') as file:
-        json.dump(json_data, file, indent=4)
+    return _set(('users', str(user_id)), User(username=user_nick, unscheduled_workout={}, scheduled_workout={}))
 
 
+@instrumented('backend')
 def add_scheduled_workout(user_id, workout_name, days_scheduled, muscle_group=None, weights_used=None,
                           tutorial_url=None, img_url=None):
     """Adds a scheduled workout to the scheduled_workout dict within the user's entry in the users dict in the json.
@@ -75,25 +410,21 @@ def add_scheduled_workout(user_id, workout_name, days_scheduled, muscle_group=No
     :param weights_used: (str) a description of the weights used in this workout, if any
     :param tutorial_url: (str) a link to a tutorial that shows how to do this workout properly
     :param img_url: (str) a link to an image that can be used in messages about this workout
+    :return: (Future) resolves once the change is durable
     """
-    filename = config("FILENAME")
-    time_now = datetime.now().timestamp()
-
-    with open(filename, 'r') as file:
-        json_data = json.load(file)
+    # Ids are kept as strings in memory, exactly the way they come back out of the JSON file
+    time_now = str(datetime.now().timestamp())
 
-    json_data['users'][str(user_id)]['scheduled_workout'][time_now] = {'workout_name': workout_name,
-                                                                       'days_scheduled': days_scheduled,
-                                                                       'muscle_group': muscle_group,
-                                                                       'weights_used': weights_used,
-                                                                       'tutorial_url': tutorial_url,
-                                                                       'img_url': img_url,
-                                                                       'reports': {}}
-
-    with open(filename, 'w') as file:
-        json.dump(json_data, file, indent=4)
+    return _set(('users', str(user_id), 'scheduled_workout', time_now), ScheduledWorkout(workout_name=workout_name,
+                                                                                         days_scheduled=days_scheduled,
+                                                                                         muscle_group=muscle_group,
+                                                                                         weights_used=weights_used,
+                                                                                         tutorial_url=tutorial_url,
+                                                                                         img_url=img_url,
+                                                                                         reports={}))
 
 
+@instrumented('backend')
 def add_unscheduled_workout(user_id, workout_name, muscle_group=None, weights_used=None,
                             tutorial_url=None, img_url=None, preset_report_id=None, comment=None):
     """Adds an impromptu workout to the unscheduled_workout dict within the user's entry in the users dict in the json.
@@ -106,59 +437,88 @@ def add_unscheduled_workout(user_id, workout_name, muscle_group=None, weights_us
     :param img_url: (str) a link to an image that can be used in messages about this workout
     :param preset_report_id: (str) if this is not None, use this value as the report_id
     :param comment: (str) any comment about the workout optionally left by the user
+    :return: (Future) resolves once the change is durable
     """
-    filename = config("FILENAME")
     if preset_report_id:
-        time_now = preset_report_id
+        time_now = str(preset_report_id)
     else:
-        time_now = datetime.now().timestamp()
-
-    with open(filename, 'r') as file:
-        json_data = json.load(file)
+        time_now = str(datetime.now().timestamp())
 
-    json_data['users'][str(user_id)]['unscheduled_workout'][time_now] = {'workout_name': workout_name,
-                                                                         'muscle_group': muscle_group,
-                                                                         'weights_used': weights_used,
-                                                                         'tutorial_url': tutorial_url,
-                                                                         'img_url': img_url,
-                                                                         'comment': comment}
-
-    with open(filename, 'w') as file:
-        json.dump(json_data, file, indent=4)
+    return _set(('users', str(user_id), 'unscheduled_workout', time_now), UnscheduledWorkout(workout_name=workout_name,
+                                                                                             muscle_group=muscle_group,
+                                                                                             weights_used=weights_used,
+                                                                                             tutorial_url=tutorial_url,
+                                                                                             img_url=img_url,
+                                                                                             comment=comment))
 
 
+@instrumented('backend')
 def add_report(user_id, completion, workout_name=None, workout_id=None, comment=None):
     """Adds a report for a scheduled workout in the users dict in the json.
     Workout can be accessed by referring to either its name or its id.
 
     :param user_id: (int) the Discord ID of the user reporting the workout
     :param completion: (str) whether the workout was skipped or completed, and to what degree. Options constrained
-    :param workout_name: (str) the name of the reported workout
+    :param workout_name: (str) the name of the reported workout, matched ignoring case and spacing. A name that more
+                         than one workout has raises a ValueError
     :param workout_id: (str) the id (also unix time of creation) for the specified workout
     :param comment: (str) a comment about how the workout went
+    :return: (Future) resolves once the change is durable
     """
-    filename = config("FILENAME")
-    time_now = datetime.now().timestamp()
+    if not workout_name and not workout_id:
+        raise ValueError("add_report must be provided either workout_id or workout_name, but got neither.")
 
-    with open(filename, 'r') as file:
-        json_data = json.load(file)
+    time_now = str(datetime.now().timestamp())
 
-    if workout_name:
-        # Find the dict with the desired workout_name
-        scheduled = json_data['users'][str(user_id)]['scheduled_workout']
-        workout_id = [workout for workout in scheduled if scheduled[workout]['workout_name'] == workout_name][0]
+    with _store_lock:
+        if workout_name:
+            workout_id = find_workout_id(user_id, workout_name)
 
-    # Add the report to the reports dict
-    json_data['users'][str(user_id)]['scheduled_workout'][workout_id]["reports"][time_now] = {'completion': completion,
-                                                                                              'comment': comment}
+        # Add the report to the reports dict
+        return _set(('users', str(user_id), 'scheduled_workout', workout_id, 'reports', time_now),
+                    Report(completion=completion, comment=comment))
 
-    if not workout_name and not workout_id:
-        raise ValueError("add_report must be provided either workout_id or workout_name, but got neither.")
 
-    with open(filename, 'w') as file:
-        json.dump(json_data, file, indent=4)
+@instrumented('backend')
+def find_workout_id(user_id, workout_name):
+    """Find the scheduled workout with a name, ignoring case and spacing. This is a dict lookup in an index that is
+    kept up to date as workouts are added, renamed and deleted.
+
+    :param user_id: (int) the Discord ID of the user
+    :param workout_name: (str) the name of the workout
+    :return: (str) the id of the workout
+    """
+    user_id = str(user_id)
+    with _store_lock:
+        _workout_name_index.build(user_id, _get_store()['users'][user_id])
+        workout_ids = _workout_name_index.workout_ids_named(user_id, workout_name)
+
+    if not workout_ids:
+        raise ValueError(f"You don't have a scheduled workout called '{workout_name}'.")
+    if len(workout_ids) > 1:
+        raise ValueError(f"You have {len(workout_ids)} scheduled workouts called '{workout_name}'. Pick the workout "
+                         f"you mean by its id instead.")
+    return workout_ids[0]
+
+
+@instrumented('backend')
+def search_workouts(userid, text='', limit=25):
+    """Find the user's scheduled workouts that best match what they have typed so far, for autocomplete. Names are
+    matched ignoring case and spacing, by prefix first, then by the start of a word, then anywhere in the name, then
+    by shared trigrams, so small typos still match.
+
+    :param userid: (int) the Discord id of the user who used the slash command
+    :param text: (str) what the user has typed so far. With nothing typed, the newest workouts come back
+    :param limit: (int) the most workouts to return. Discord shows at most 25 choices
+    :return: (list of tuples) (workout_id, workout_name) for the best matches, best first
+    """
+    userid = str(userid)
+    with _store_lock:
+        _workout_name_index.build(userid, read_json()['users'][userid])
+        return _workout_name_index.search(userid, text, limit)
 
 
+@instrumented('backend')
 def delete_from_dict(user_id, workout_unixid=None, report_unixid=None):
     """Delete a workout or report from the json file. If workout_unixid is given but not report_unixid, the selected
     scheduled workout will be deleted. If report_unixid is given but not workout_unixid, the selected unscheduled
@@ -167,52 +527,715 @@ def delete_from_dict(user_id, workout_unixid=None, report_unixid=None):
     :param user_id: (int) the Discord ID of the person whose information is being updated
     :param workout_unixid: (float) the scheduled workout's unix time
     :param report_unixid: (float) the report's unix time
+    :return: (Future) resolves once the change is durable
     """
-    filename = config("FILENAME")
     user_id = str(user_id)
-    with open(filename, 'r') as file:
-        json_data = json.load(file)
 
     # Make sure enough info is given to make specifying a key to remove possible
     if not workout_unixid and not report_unixid:
         raise ValueError("Please provide at least one of workout_unixid or report_unixid to specify what to delete.")
 
+    # An archived report is brought back first, so that it's deleted like any other
+    if report_unixid:
+        with _store_lock:
+            _thaw(user_id, report_unixid)
+
     # Remove unscheduled workout report if only report id is provided
-    elif not workout_unixid:
-        del json_data['users'][user_id]['unscheduled_workout'][report_unixid]
+    if not workout_unixid:
+        return _delete(('users', user_id, 'unscheduled_workout', report_unixid))
 
     # Remove scheduled workout routine if only workout id is provided
     elif not report_unixid:
-        del json_data['users'][user_id]['scheduled_workout'][workout_unixid]
+        return _delete(('users', user_id, 'scheduled_workout', workout_unixid))
 
     # Remove scheduled workout report if both report id and workout id are provided
     else:
-        del json_data['users'][user_id]['scheduled_workout'][workout_unixid][report_unixid]
+        return _delete(('users', user_id, 'scheduled_workout', workout_unixid, 'reports', report_unixid))
+
+
+@instrumented('backend')
+def apply_mutations(operations):
+    """Apply a list of changes to the database all at once, as one transaction(). Nothing else can see them half done,
+    they all go out in the same write, and if one of them fails, none of them are made.
+
+    :param operations: (list of tuples) (name, kwargs) for every change, in the order they should be made. name is
+                       one of 'edit_value', 'add_user', 'add_scheduled_workout', 'add_unscheduled_workout',
+                       'add_report' or 'delete_from_dict', and kwargs are the keyword arguments of that function,
+                       ex: ('delete_from_dict', {'user_id': 1234, 'workout_unixid': '1646880978.1'})
+    :return: (Future) resolves once every change is durable, or None if there were no changes
+    """
+    # Check every operation before making any change, so a typo doesn't cost a rollback
+    for name, kwargs in operations:
+        if name not in _MUTATIONS:
+            raise ValueError(f"apply_mutations can't apply '{name}'. The operations it can apply are "
+                             f"{', '.join(_MUTATIONS)}.")
 
-    with open(filename, 'w') as file:
-        json.dump(json_data, file, indent=4)
+    # If one of them fails, the ones before it are rolled back
+    future = None
+    with transaction():
+        for name, kwargs in operations:
+            future = _MUTATIONS[name](**kwargs)
+    return future
 
 
+# The functions apply_mutations() can apply, by name
+_MUTATIONS = {'edit_value': edit_value,
+              'add_user': add_user,
+              'add_scheduled_workout': add_scheduled_workout,
+              'add_unscheduled_workout': add_unscheduled_workout,
+              'add_report': add_report,
+              'delete_from_dict': delete_from_dict}
+
+
+class ReportsView(Mapping):
+    """A read-only view of all of a user's reports, both scheduled and unscheduled, keyed by report id. Nothing is
+    merged or copied up front: looking a report up by id is a dict lookup, and scheduled reports come back as views
+    with their workout's id and name added on. The view always shows the resident data as it is now.
+
+    Archived reports are in the view too. Looking one up pages in its year, while listing or counting them only takes
+    their ids.
+    """
+    __slots__ = ('user_id',)
+
+    def __init__(self, user_id):
+        self.user_id = str(user_id)
+        # Fail straight away for users who don't exist, the same way the autocompletes expect
+        with _store_lock:
+            _get_store()['users'][self.user_id]
+
+    def __getitem__(self, report_id):
+        with _store_lock:
+            user = _get_store()['users'][self.user_id]
+            if report_id in user.unscheduled_workout:
+                return MappingProxyType(user.unscheduled_workout[report_id])
+
+            _report_workout_index.build(self.user_id, user)
+            workout_id = _report_workout_index.workout_id(self.user_id, report_id)
+            if workout_id is not None and report_id in user.scheduled_workout[workout_id].reports:
+                workout = user.scheduled_workout[workout_id]
+                return ScheduledReportView(workout.reports[report_id], workout_id, workout)
+            return _archived_report(user, self.user_id, report_id)
+
+    def __contains__(self, report_id):
+        with _store_lock:
+            user = _get_store()['users'][self.user_id]
+            if report_id in user.unscheduled_workout:
+                return True
+            _report_workout_index.build(self.user_id, user)
+            return (_report_workout_index.workout_id(self.user_id, report_id) is not None
+                    or _archive.contains(self.user_id, report_id))
+
+    def __iter__(self):
+        # Only the ids are gathered while the database is locked, so a write from another thread can't change the
+        # dicts while they're being walked. Unscheduled reports come first, then the reports of each workout, then
+        # the archived reports
+        with _store_lock:
+            user = _get_store()['users'][self.user_id]
+            report_ids = list(user.unscheduled_workout)
+            for workout in user.scheduled_workout.values():
+                report_ids.extend(workout.reports)
+            report_ids.extend(_archive.report_ids(self.user_id, user))
+        return iter(report_ids)
+
+    def __len__(self):
+        with _store_lock:
+            user = _get_store()['users'][self.user_id]
+            return (len(user.unscheduled_workout) + sum(len(workout.reports)
+                                                        for workout in user.scheduled_workout.values())
+                    + len(_archive.report_ids(self.user_id, user)))
+
+    def times(self, start=None, end=None):
+        """Get the creation time of every report made between start and end.
+
+        :param start: (float) unix time of the start of the range, inclusive. None means no lower bound
+        :param end: (float) unix time of the end of the range, exclusive. None means no upper bound
+        :return: (list of floats) the sorted report times
+        """
+        return get_report_times(self.user_id, start, end)
+
+    def between(self, start=None, end=None):
+        """Get every report made between start and end, sorted by time.
+
+        :param start: (float) unix time of the start of the range, inclusive. None means no lower bound
+        :param end: (float) unix time of the end of the range, exclusive. None means no upper bound
+        :return: (list of tuples) (report_id, report) for every report in the range
+        """
+        with _store_lock:
+            user = _get_store()['users'][self.user_id]
+            _report_time_index.build(self.user_id, user)
+            report_times, entries = _report_time_index.range(self.user_id, start, end)
+
+            reports = []
+            for report_id, workout_id, workout_name in entries:
+                if workout_id is None and report_id in user.unscheduled_workout:
+                    reports.append((report_id, MappingProxyType(user.unscheduled_workout[report_id])))
+                elif workout_id is not None and report_id in user.scheduled_workout[workout_id].reports:
+                    workout = user.scheduled_workout[workout_id]
+                    reports.append((report_id, ScheduledReportView(workout.reports[report_id], workout_id, workout)))
+                else:
+                    reports.append((report_id, _archived_report(user, self.user_id, report_id)))
+
+        return reports
+
+
+def _archived_report(user, user_id, report_id):
+    """Look up an archived report the way ReportsView hands reports out, paging in its year if need be. Must be called
+    while holding the database lock.
+
+    :param user: (User) the user's resident data
+    :param user_id: (str) the Discord ID of the user
+    :param report_id: (str) the id of the report
+    :return: (Mapping) a read-only view of the report
+    """
+    row = _archive.get(user_id, report_id)
+    if row is None:
+        raise KeyError(report_id)
+    workout_id, report = row
+    if workout_id is None:
+        return MappingProxyType(report)
+    if workout_id not in user.scheduled_workout:
+        raise KeyError(report_id)
+    return ScheduledReportView(report, workout_id, user.scheduled_workout[workout_id])
+
+
+@instrumented('backend')
 def get_all_reports(userid):
-    """Get a list of all the reports, both scheduled and unscheduled, for the given user
+    """Get a read-only view of all the reports, both scheduled and unscheduled, for the given user. Scheduled reports
+    have their workout_id and workout_name added on.
+
+    :param userid: (int) the Discord id of the user who used the slash command
+    :return: (ReportsView) all the reports the user has ever submitted, keyed by report id
+    """
+    return ReportsView(userid)
+
+
+@instrumented('backend')
+def get_workout_reports(userid, workout_id):
+    """Get every report on a scheduled workout, archived ones included. Only the years the workout has archived
+    reports in are paged in.
+
+    :param userid: (int) the Discord id of the user who used the slash command
+    :param workout_id: (str) the id of the workout
+    :return: (list of tuples) (report_id, report) for every report on the workout, sorted by time. The reports are
+             the resident data or the archive's, so treat them as read-only
+    """
+    userid = str(userid)
+    with _store_lock:
+        reports = dict(read_json()['users'][userid].scheduled_workout[workout_id].reports)
+        for report_id, report in _archive.workout_reports(userid, workout_id).items():
+            reports.setdefault(report_id, MappingProxyType(report))
+
+    return sorted(reports.items(), key=lambda item: float(item[0]))
+
+
+@instrumented('backend')
+def get_workout_report_page(userid, workout_id, page=0, page_size=5, newest_first=True):
+    """Get one page of the reports on a scheduled workout, archived ones included. The page is sliced out of the
+    workout's sorted report ids, so only the reports on it are looked up, and only their years are paged in.
+
+    :param userid: (int) the Discord id of the user who used the slash command
+    :param workout_id: (str) the id of the workout
+    :param page: (int) which page to get, counting from 0
+    :param page_size: (int) how many reports are on a page
+    :param newest_first: (bool) whether the first page holds the newest reports or the oldest
+    :return: (tuple) the (report_id, report) of every report on the page, in the order they're paged in, and the
+             number of reports the workout has altogether. The reports are the resident data or the archive's, so
+             treat them as read-only
+    """
+    userid = str(userid)
+    with _store_lock:
+        user = read_json()['users'][userid]
+        resident_reports = user.scheduled_workout[workout_id].reports
+        _report_workout_index.build(userid, user)
+        report_ids = _report_workout_index.report_ids(userid, workout_id)
+        num_reports = len(report_ids)
+        if newest_first:
+            end = max(num_reports - page * page_size, 0)
+            page_ids = report_ids[max(end - page_size, 0):end][::-1]
+        else:
+            page_ids = report_ids[page * page_size:(page + 1) * page_size]
+
+        reports = []
+        for report_time, report_id in page_ids:
+            if report_id in resident_reports:
+                reports.append((report_id, resident_reports[report_id]))
+            else:
+                reports.append((report_id, MappingProxyType(_archive.get(userid, report_id)[1])))
+
+    return reports, num_reports
+
+
+@instrumented('backend')
+def get_report_times(userid, start=None, end=None):
+    """Get the creation time of every report, both scheduled and unscheduled, that the user made between start and
+    end. This is a bisection of the user's sorted report times, so it costs O(log n + k) for k reports.
+
+    :param userid: (int) the Discord id of the user who used the slash command
+    :param start: (float) unix time of the start of the range, inclusive. None means no lower bound
+    :param end: (float) unix time of the end of the range, exclusive. None means no upper bound
+    :return: (list of floats) the sorted report times
+    """
+    userid = str(userid)
+    with _store_lock:
+        _report_time_index.build(userid, read_json()['users'][userid])
+        report_times, entries = _report_time_index.range(userid, start, end)
+
+    return report_times
+
+
+@instrumented('backend')
+def get_next_report_time(userid, start, end=None):
+    """Get the time of the first report, scheduled or unscheduled, that the user made at or after start.
+
+    :param userid: (int) the Discord id of the user who used the slash command
+    :param start: (float) unix time to search from, inclusive
+    :param end: (float) unix time to stop searching at, exclusive. None means no upper bound
+    :return: (float) the report time, or None if there are no reports in that range
+    """
+    userid = str(userid)
+    with _store_lock:
+        _report_time_index.build(userid, read_json()['users'][userid])
+        return _report_time_index.next_time(userid, start, end)
+
+
+@instrumented('backend')
+def get_report_entries(userid, start=None, end=None):
+    """Get the time, id and workout name of every report, scheduled or unscheduled, that the user made between start
+    and end, straight from the user's sorted report times.
+
+    :param userid: (int) the Discord id of the user who used the slash command
+    :param start: (float) unix time of the start of the range, inclusive. None means no lower bound
+    :param end: (float) unix time of the end of the range, exclusive. None means no upper bound
+    :return: (list of tuples) (report_time, report_id, workout_name), sorted by time
+    """
+    userid = str(userid)
+    with _store_lock:
+        _report_time_index.build(userid, read_json()['users'][userid])
+        report_times, entries = _report_time_index.range(userid, start, end)
+
+    return [(report_time, entry[0], entry[2]) for report_time, entry in zip(report_times, entries)]
+
+
+@instrumented('backend')
+def get_reports_between(userid, start=None, end=None):
+    """Get every report, both scheduled and unscheduled, that the user made between start and end, in the same form
+    as the reports handed out by get_all_reports.
+
+    :param userid: (int) the Discord id of the user who used the slash command
+    :param start: (float) unix time of the start of the range, inclusive. None means no lower bound
+    :param end: (float) unix time of the end of the range, exclusive. None means no upper bound
+    :return: (list of tuples) (report_id, report) for every report in the range, sorted by time
+    """
+    return ReportsView(userid).between(start, end)
+
+
+@instrumented('backend')
+def get_report_calendar(userid, year=None, month=None):
+    """Look up one level of the user's report calendar: the years they made reports in, the months of a year, or the
+    days of a month. Each level is a dict lookup in a tree that is kept up to date as reports come and go.
+
+    :param userid: (int) the Discord id of the user who used the slash command
+    :param year: (int) the year to look in, or None to get the years
+    :param month: (int) the month of that year to look in, or None to get the months
+    :return: (dict) {year: number of reports} without a year, {month: number of reports} with only a year, or
+             {day: set of report ids} with both
+    """
+    userid = str(userid)
+    with _store_lock:
+        _calendar_index.build(userid, read_json()['users'][userid])
+        if year is None:
+            return _calendar_index.years(userid)
+        if month is None:
+            return _calendar_index.months(userid, year)
+        return _calendar_index.days(userid, year, month)
+
+
+@instrumented('backend')
+def get_stats(userid, now=None):
+    """Get the user's statistics: sessions, completion rates for each scheduled workout, weekly volume, streaks and
+    the time of their last session, archived reports included. The totals are kept up to date as reports come and go,
+    so this never reads the reports themselves.
+
+    :param userid: (int) the Discord id of the user who used the slash command
+    :param now: (float) unix time to measure the current streak and weekly volume from. None means right now
+    :return: (dict) the statistics, as described in WorkoutStats.summary()
+    """
+    userid = str(userid)
+    with _store_lock:
+        _workout_stats.build(userid, read_json()['users'][userid])
+        return _workout_stats.summary(userid, now)
+
+
+@instrumented('backend')
+def get_leaderboard(userid, count=10):
+    """Get the top of every leaderboard ranking: sessions this week, this month and of all time, and current streaks
+    of weeks in a row with a session. The rankings are kept sorted as reports come and go, so this costs O(count)
+    however many users there are, apart from counting everybody's sessions the first time.
+
+    :param userid: (int) the Discord id of the user who used the slash command, whose own places are looked up too
+    :param count: (int) how many users to get from the top of each ranking
+    :return: (dict) {ranking: {'top': list of (user_id, username, score), highest first, 'place': the user's place,
+             or None if they aren't ranked, 'score': the user's score}} for each ranking in RANKINGS
+    """
+    userid = str(userid)
+    with _store_lock:
+        users = _get_store()['users']
+        _leaderboard.build(users)
+        leaderboard = {}
+        for ranking in RANKINGS:
+            place, score = _leaderboard.rank(ranking, userid)
+            top = [(user_id, users[user_id].get('username'), user_score)
+                   for user_id, user_score in _leaderboard.top(ranking, count)]
+            leaderboard[ranking] = {'top': top, 'place': place, 'score': score}
+
+    return leaderboard
+
+
+@instrumented('backend')
+def get_adherence(userid, now=None):
+    """Compare each of the user's scheduled workouts' days_scheduled with the days it was actually done on, archived
+    reports included. Only the session times are gathered while the database is locked; the comparison itself is done
+    on NumPy arrays for all the workouts at once.
 
     :param userid: (int) the Discord id of the user who used the slash command
-    :return: (dict of dicts) all the reports the user has ever submitted
+    :param now: (float) unix time to measure up to. None means right now
+    :return: (dict) the figures described in compute_adherence(), with each workout's 'workout_id' and
+             'workout_name' added, oldest workout first
     """
-    json_data = read_json()
     userid = str(userid)
+    with _store_lock:
+        user = read_json()['users'][userid]
+        workout_ids = sorted(user.scheduled_workout, key=float)
+        positions = {workout_id: position for position, workout_id in enumerate(workout_ids)}
+        names = [user.scheduled_workout[workout_id].workout_name for workout_id in workout_ids]
+        schedules = [schedule_mask(user.scheduled_workout[workout_id].days_scheduled) for workout_id in workout_ids]
+
+        # Every report that wasn't skipped is a session. Their ids are turned into times along with the rest
+        report_ids = []
+        report_workouts = []
+        for position, workout_id in enumerate(workout_ids):
+            sessions = [report_id for report_id, report in user.scheduled_workout[workout_id].reports.items()
+                        if getattr(report, 'completion', None) != SKIPPED]
+            report_ids.extend(sessions)
+            report_workouts.extend([position] * len(sessions))
+        for report_id, workout_id, completion in _archive.completions(userid, user):
+            if workout_id is not None and completion != SKIPPED:
+                report_ids.append(report_id)
+                report_workouts.append(positions[workout_id])
+
+    adherence = compute_adherence(schedules, [float(workout_id) for workout_id in workout_ids], report_ids,
+                                  report_workouts, now)
+    for workout_id, workout_name, figures in zip(workout_ids, names, adherence['workouts']):
+        figures['workout_id'] = workout_id
+        figures['workout_name'] = workout_name
+    return adherence
+
+
+def iter_records(userid):
+    """Go through all of the user's scheduled workouts and then all of their reports, oldest first, archived ones
+    included, one record at a time. The database is only locked while each record is copied, so an export of a long
+    history never holds up other commands or has more than one record in memory.
+
+    :param userid: (int) the Discord id of the user
+    :return: (generator of dicts) the records, with the fields in workout_export.EXPORT_FIELDS that apply to them
+    """
+    userid = str(userid)
+    with _store_lock:
+        workout_ids = sorted(_get_store()['users'][userid].scheduled_workout, key=float)
+
+    for workout_id in workout_ids:
+        with _store_lock:
+            workout = _get_store()['users'][userid].scheduled_workout.get(workout_id)
+            if workout is None:
+                continue
+            record = dict(workout.items(), type='scheduled_workout', id=workout_id)
+            del record['reports']
+        yield record
+
+    reports = ReportsView(userid)
+    for report_time, report_id, workout_name in get_report_entries(userid):
+        report = reports.get(report_id)
+        if report is None:
+            continue
+        record_type = 'report' if 'workout_id' in report else 'unscheduled_workout'
+        yield dict(report.items(), type=record_type, id=report_id)
+
+
+@instrumented('backend')
+def import_records(userid, records, batch_size=500):
+    """Add records from an export to a user's history, in batches. Each batch is a transaction(), and so goes out in
+    one write, and the next batch isn't read until that write is durable. A record with the same id as an existing one
+    replaces it, except that a scheduled workout keeps the reports it already has.
+
+    :param userid: (int) the Discord id of the user, who must already exist
+    :param records: (iterable of dicts) the records, ex: from workout_export.read_records(). Scheduled workouts must
+                    come before their reports, which they do in exports
+    :param batch_size: (int) how many records to apply at a time
+    :return: (tuple) the number of records imported, and the number skipped because their workout doesn't exist
+    """
+    userid = str(userid)
+    imported = 0
+    skipped = 0
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= batch_size:
+            batch_imported, batch_skipped = _import_batch(userid, batch)
+            imported += batch_imported
+            skipped += batch_skipped
+            batch = []
+    if batch:
+        batch_imported, batch_skipped = _import_batch(userid, batch)
+        imported += batch_imported
+        skipped += batch_skipped
+    return imported, skipped
+
+
+def _import_batch(userid, batch):
+    """Apply one batch of import_records() and wait until it is durable.
+
+    :return: (tuple) the number of records imported, and the number skipped
+    """
+    imported = 0
+    future = None
+    with transaction() as store:
+        user = store['users'][userid]
+        for record in batch:
+            if record['type'] == 'scheduled_workout':
+                path = ('users', userid, 'scheduled_workout', record['id'])
+                fields = {field: record.get(field) for field in ScheduledWorkout.FIELDS if field != 'reports'}
+                fields['days_scheduled'] = fields['days_scheduled'] or []
+                # An existing workout has its fields set one by one, since replacing it would drop its reports
+                if record['id'] in user.scheduled_workout:
+                    for field, value in fields.items():
+                        if user.scheduled_workout[record['id']].get(field) != value:
+                            future = _set(path + (field,), value)
+                    imported += 1
+                    continue
+                value = ScheduledWorkout(reports={}, **fields)
+            elif record['type'] == 'report':
+                if record['workout_id'] not in user.scheduled_workout:
+                    continue
+                path = ('users', userid, 'scheduled_workout', record['workout_id'], 'reports', record['id'])
+                value = Report(**{field: record.get(field) for field in Report.FIELDS})
+            else:
+                path = ('users', userid, 'unscheduled_workout', record['id'])
+                value = UnscheduledWorkout(**{field: record.get(field) for field in UnscheduledWorkout.FIELDS})
+            future = _set(path, value)
+            imported += 1
+
+    if future is not None:
+        future.result()
+    return imported, len(batch) - imported
+
+
+@instrumented('backend')
+def archive_old_reports(max_age_days=None):
+    """Move every report older than max_age_days out of the resident database and into the archive. Each user's
+    reports are written to their archive files, which are durable before the resident copies are deleted, so a crash
+    part way through can't lose anything. The database is only locked to copy one user's reports and then to delete
+    them, not while the archive files are read and written, and a report that changed or went away in the meantime
+    is left for the next time.
+
+    :param max_age_days: (float) how old a report has to be to be archived, or None for the ARCHIVE_AFTER_DAYS config
+                         key. 0 archives nothing
+    :return: (int) how many reports were archived
+    """
+    if max_age_days is None:
+        max_age_days = config("ARCHIVE_AFTER_DAYS", default=0, cast=float)
+    if not max_age_days:
+        return 0
+    cutoff = datetime.now().timestamp() - max_age_days * 86400
+
+    with _store_lock:
+        user_ids = list(_get_store()['users'])
+
+    num_archived = 0
+    for user_id in user_ids:
+        with _store_lock:
+            user = _get_store()['users'].get(user_id)
+            if user is None:
+                continue
+
+            # Gather copies of the old reports by year, along with the path each one is deleted at and the resident
+            # report it was copied from
+            rows_by_year = {}
+            reports_by_year = {}
+            for report_id, report in user.unscheduled_workout.items():
+                if float(report_id) < cutoff and archivable(report_id, report):
+                    year = datetime.fromtimestamp(float(report_id)).year
+                    copy = type(report).from_dict(dict(report.items()))
+                    rows_by_year.setdefault(year, []).append((report_id, None, copy))
+                    reports_by_year.setdefault(year, []).append(
+                        (('users', user_id, 'unscheduled_workout', report_id), report, copy))
+            for workout_id, workout in user.scheduled_workout.items():
+                for report_id, report in workout.reports.items():
+                    if float(report_id) < cutoff and archivable(report_id, report):
+                        year = datetime.fromtimestamp(float(report_id)).year
+                        copy = type(report).from_dict(dict(report.items()))
+                        rows_by_year.setdefault(year, []).append((report_id, workout_id, copy))
+                        reports_by_year.setdefault(year, []).append(
+                            (('users', user_id, 'scheduled_workout', workout_id, 'reports', report_id), report, copy))
+            adding = [_archive.start_add(user_id, year, rows) for year, rows in rows_by_year.items()]
+
+        written = [_archive.write_add(add) for add in adding]
+
+        with _store_lock:
+            for year, year_written in zip(rows_by_year, written):
+                reports = reports_by_year[year]
+                unchanged = all(lookup_path(_get_store(), path) is report and report == copy
+                                for path, report, copy in reports)
+                if not unchanged:
+                    _archive.cancel_add(year_written)
+                    continue
+                if not _archive.finish_add(year_written):
+                    continue
+                # The reports haven't gone anywhere as far as the indexes are concerned, so nobody is told about this
+                for path, report, copy in reports:
+                    _delete(path, notify=False)
+                num_archived += len(reports)
+
+    return num_archived
+
+
+def start_archiver():
+    """Archive old reports now and then every ARCHIVE_INTERVAL_HOURS on a background thread, if ARCHIVE_AFTER_DAYS is
+    set. If the thread is already running (ex: when the bot reconnects and on_ready runs again), it is left to carry on
+    instead of a second one being started.
+
+    :return: (Thread) the archiver thread, or None if archiving is off
+    """
+    global _archiver
+    if not config("ARCHIVE_AFTER_DAYS", default=0, cast=float):
+        return None
+    interval = config("ARCHIVE_INTERVAL_HOURS", default=24.0, cast=float) * 3600
+
+    def archive_periodically():
+        while True:
+            try:
+                archive_old_reports()
+            except Exception as error:
+                traceback.print_exception(type(error), error, error.__traceback__)
+            time.sleep(interval)
+
+    with _store_lock:
+        if _archiver is None or not _archiver.is_alive():
+            _archiver = threading.Thread(target=archive_periodically, name='workout-archiver', daemon=True)
+            _archiver.start()
+        return _archiver
+
+
+def start_reminders(send):
+    """Remind users of their scheduled workouts on the days they're scheduled, at REMINDER_HOUR, from a background
+    thread that sleeps until the next reminder is due, unless REMINDERS is off. Every workout's next reminder is worked
+    out from scratch, so calling this again (ex: when the bot reconnects) starts over from the current database.
+
+    :param send: (function) called with (user_id, workout_id) on the scheduler's thread for every reminder that comes
+                 due. It should hand the work off rather than block
+    :return: (Thread) the scheduler's thread, or None if reminders are off
+    """
+    if not config("REMINDERS", default=True, cast=bool):
+        return None
+    _reminder_scheduler.stop()
+    with _store_lock:
+        _reminder_scheduler.rebuild(_get_store()['users'])
+    return _reminder_scheduler.start(send)
+
+
+def _thaw(user_id, report_id):
+    """Bring an archived report back into the resident database so that it can be edited or deleted. Its archived
+    copy is deleted once the report is durable again. Must be called while holding the database lock.
+
+    :param user_id: (str) the Discord ID of the user
+    :param report_id: (str) the id of the report
+    """
+    user = _get_store()['users'][user_id]
+    if report_id in user.unscheduled_workout or not _archive.contains(user_id, report_id):
+        return
+    workout_id, report = _archive.get(user_id, report_id)
+    if workout_id is None:
+        path = ('users', user_id, 'unscheduled_workout', report_id)
+    elif workout_id in user.scheduled_workout:
+        if report_id in user.scheduled_workout[workout_id].reports:
+            return
+        path = ('users', user_id, 'scheduled_workout', workout_id, 'reports', report_id)
+    else:
+        return
+
+    # The resident database gets its own copy, since the archive's is shared with everybody paging in the same year
+    future = _set(path, type(report).from_dict(dict(report.items())), notify=False)
+
+    def drop_archived_copy(done):
+        if done.exception() is None:
+            with _store_lock:
+                _archive.drop(user_id, lambda archived_id, archived_workout_id: archived_id == report_id)
+
+    future.add_done_callback(drop_archived_copy)
+
+
+def _drop_archived_reports(op, path, old_value, new_value):
+    """Listener that deletes the archived reports of whatever was just deleted or replaced, ex: the archived reports
+    of a deleted workout. That waits until the change is durable, since until then the database on disk still needs
+    them, and inside a transaction it waits for the commit too, since the archive can't be rolled back."""
+    if len(path) < 2 or not _archive.has_user(path[1]):
+        return
+    # Meanwhile a deleted report is hidden, so it doesn't come back from the archive. A report that's set again, ex:
+    # by a rollback, is shown again
+    if path[2:3] == ('unscheduled_workout',) and len(path) == 4 or path[4:5] == ('reports',) and len(path) == 6:
+        if new_value is None:
+            _archive.hide(path[1], path[-1])
+        else:
+            _archive.unhide(path[1], path[-1])
+    if old_value is None:
+        return
+    # Meanwhile the indexes would still list the archived reports of a deleted user or workout, so they're rebuilt
+    # from the resident database and the archive, which leaves out reports whose workout is gone
+    if len(path) <= 3 or (path[2] == 'scheduled_workout' and path[4:] in ((), ('reports',))):
+        _forget_indexes(path[1])
+    if _transaction is not None:
+        _transaction.dropped_paths.append(path)
+    else:
+        _dropped_paths.append(path)
+
+
+def _drop_archived_once_durable(future, paths):
+    """Delete the archived reports under some paths once a change is durable, like _thaw() does for the copy it
+    replaces. Nothing is deleted if the change couldn't be persisted.
+
+    :param future: (Future) the future of the change, or of the last change of a transaction
+    :param paths: (list of tuples) the paths whose archived reports are to be deleted
+    """
+    def drop_archived_copies(done):
+        if done.exception() is None:
+            with _store_lock:
+                for path in paths:
+                    _drop_archived(path)
+
+    future.add_done_callback(drop_archived_copies)
+
 
-    # Get all unscheduled reports and put them into the reports dict
-    reports = json_data['users'][userid]['unscheduled_workout']
+def _drop_archived(path):
+    """Delete the archived reports under a path. If any were deleted, the user's indexes are rebuilt the next time
+    they're needed, since the indexes only hear about the resident reports that went."""
+    if _archive.drop_path(path):
+        _forget_indexes(path[1])
 
-    # Add all scheduled reports to the reports dict
-    scheduled = json_data['users'][userid]['scheduled_workout']
-    for workout_id in scheduled:
-        for report_id, report_data in scheduled[workout_id]['reports'].items():
-            reports[report_id] = report_data
-            reports[report_id]['workout_id'] = workout_id  # add the workout id to report data for clarity
-            reports[report_id]['workout_name'] = scheduled[workout_id]['workout_name']  # the workout's name, too
 
-    return reports
+def _forget_indexes(user_id):
+    """Rebuild a user's indexes the next time they're needed."""
+    _report_time_index.forget(user_id)
+    _report_workout_index.forget(user_id)
+    _calendar_index.forget(user_id)
+    _workout_stats.forget(user_id)
+    _leaderboard.recount(user_id, _get_store()['users'].get(user_id))
 
 
+# Keep the indexes, statistics and reminders up to date as the database changes, and the archive in step with it
+add_listener(_report_time_index.update)
+add_listener(_report_workout_index.update)
+add_listener(_calendar_index.update)
+add_listener(_workout_name_index.update)
+add_listener(_workout_stats.update)
+add_listener(_leaderboard.update)
+add_listener(_reminder_scheduler.update)
+add_listener(_drop_archived_reports)
@@ -0,0 +1,365 @@
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from types import SimpleNamespace
+from decouple import config
+
+import workout_backend
+import workout_main
+import workout_quickfetches
+from workout_cache import quickfetch_cache
+from workout_codecs import convert_database
+
+COMPLETIONS = ('complete', 'partially complete', 'skipped')
+DAYS = ('Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday')
+MUSCLE_GROUPS = ('chest', 'back', 'legs', 'arms', 'shoulders', 'core')
+# Synthetic users get ids in the same range as real Discord ids
+FIRST_USER_ID = 100000000000000000
+# How many users report at once in the report_burst benchmark
+BURST_SIZE = 20
+
+
+def generate_dataset(num_users, workouts_per_user, reports_per_workout, unscheduled_per_user, years=3, seed=0):
+    """Generate a database laid out the same way as the real one, with every report made at a random time over the
+    last few years.
+
+    :param num_users: (int) how many users to generate
+    :param workouts_per_user: (int) how many scheduled workouts each user has
+    :param reports_per_workout: (int) how many reports each scheduled workout has
+    :param unscheduled_per_user: (int) how many unscheduled workout reports each user has
+    :param years: (int) how many years back the reports go
+    :param seed: (int) the seed for the random generator, so the same arguments always give the same database
+    :return: (dict) the database, ready to be dumped to FILENAME
+    """
+    rng = random.Random(seed)
+    end = datetime.now().timestamp()
+    start = end - years * 365 * 24 * 60 * 60
+
+    json_data = {'users': {}}
+    for user_number in range(num_users):
+        used_ids = set()
+        user = {'username': f"user{user_number}", 'unscheduled_workout': {}, 'scheduled_workout': {}}
+
+        for workout_number in range(workouts_per_user):
+            # Workouts are created in the first quarter of the time span, so they have time to collect reports
+            workout_id = _unique_id(rng, used_ids, start, start + (end - start) / 4)
+            user['scheduled_workout'][workout_id] = {'workout_name': f"Workout {workout_number}",
+                                                     'days_scheduled': rng.sample(DAYS, rng.randint(1, 3)),
+                                                     'muscle_group': rng.choice(MUSCLE_GROUPS),
+                                                     'weights_used': None,
+                                                     'tutorial_url': None,
+                                                     'img_url': None,
+                                                     'reports': {}}
+            for _ in range(reports_per_workout):
+                report_id = _unique_id(rng, used_ids, float(workout_id), end)
+                user['scheduled_workout'][workout_id]['reports'][report_id] = {'completion': rng.choice(COMPLETIONS),
+                                                                               'comment': None}
+
+        for report_number in range(unscheduled_per_user):
+            report_id = _unique_id(rng, used_ids, start, end)
+            user['unscheduled_workout'][report_id] = {'workout_name': f"Extra {report_number % 10}",
+                                                      'muscle_group': rng.choice(MUSCLE_GROUPS),
+                                                      'weights_used': None,
+                                                      'tutorial_url': None,
+                                                      'img_url': None,
+                                                      'comment': None}
+
+        json_data['users'][str(FIRST_USER_ID + user_number)] = user
+
+    return json_data
+
+
+def _unique_id(rng, used_ids, low, high):
+    """Draw a random unix time id between low and high that hasn't been used yet by the user."""
+    while True:
+        unixid = str(rng.uniform(low, high))
+        if unixid not in used_ids:
+            used_ids.add(unixid)
+            return unixid
+
+
+def _measure(prepare_call, repeats):
+    """Time an operation, then measure its peak memory with one more call under tracemalloc. Tracing slows everything
+    down, so it's kept out of the timed calls.
+
+    :param prepare_call: (function) called with the iteration number before each call, outside the timing. Returns
+                         the function to be timed, or None if there is nothing left to call it on
+    :param repeats: (int) how many timed calls to make
+    :return: (dict) the number of calls, p50, p99 and max latency in milliseconds, and peak memory in KiB
+    """
+    timings = []
+    for iteration in range(repeats):
+        call = prepare_call(iteration)
+        if call is None:
+            break
+        started = time.perf_counter()
+        call()
+        timings.append((time.perf_counter() - started) * 1000)
+
+    peak_kib = None
+    call = prepare_call(repeats)
+    if call is not None:
+        tracemalloc.start()
+        call()
+        peak_kib = tracemalloc.get_traced_memory()[1] / 1024
+        tracemalloc.stop()
+
+    timings.sort()
+    return {'calls': len(timings),
+            'p50_ms': _percentile(timings, 0.50),
+            'p99_ms': _percentile(timings, 0.99),
+            'max_ms': timings[-1] if timings else None,
+            'peak_kib': peak_kib}
+
+
+def _percentile(sorted_timings, fraction):
+    """Get a percentile of a sorted list by the nearest rank method, or None if the list is empty."""
+    if not sorted_timings:
+        return None
+    return sorted_timings[min(len(sorted_timings) - 1, int(fraction * len(sorted_timings)))]
+
+
+class _Sampler:
+    """Picks users, workouts and reports from the resident database for the benchmarked calls to work on."""
+
+    def __init__(self, seed):
+        self.rng = random.Random(seed)
+
+    def user(self):
+        """Pick a user that has at least one scheduled workout and one report left.
+
+        :return: (SimpleNamespace) a stand-in for the Discord user object, or None if there are none left
+        """
+        users = workout_backend.read_json()['users']
+        user_ids = [user_id for user_id in users if users[user_id]['scheduled_workout']
+                    and any(workout['reports'] for workout in users[user_id]['scheduled_workout'].values())]
+        if not user_ids:
+            return None
+        user_id = self.rng.choice(user_ids)
+        return SimpleNamespace(id=int(user_id), display_name=users[user_id]['username'])
+
+    def workout_id(self, user):
+        """Pick one of a user's scheduled workouts."""
+        return self.rng.choice(list(workout_backend.read_json()['users'][str(user.id)]['scheduled_workout']))
+
+    def report_id(self, user, scheduled_only=False):
+        """Pick one of a user's reports, optionally only from their scheduled workouts."""
+        reports = workout_backend.get_all_reports(user.id)
+        if scheduled_only:
+            return self.rng.choice([report_id for report_id in reports if 'completion' in reports[report_id]])
+        return self.rng.choice(list(reports))
+
+    def report_date(self, user):
+        """Pick the year, month and day of one of a user's reports, as the strings the report pickers pass around."""
+        date = datetime.fromtimestamp(float(self.report_id(user)))
+        return str(date.year), str(date.month), str(date.day)
+
+
+def _operations(sampler):
+    """List every entry point that gets benchmarked. Each one comes with a function that prepares a call to it, so
+    that picking its arguments isn't part of the timing. Operations that change the database come last, and the
+    deletes come at the very end, so every operation runs against a database of the generated size.
+
+    :param sampler: (_Sampler) where the arguments come from
+    :return: (list of tuples) (name, prepare_call) for every operation
+    """
+    def call_with_user(function, *get_args, cache=None):
+        """Make a prepare_call for function(*args). Each argument is either a value, or a function that picks the
+        value for a randomly chosen user. cache is 'cold' to empty the quickfetch cache before each call, or 'warm' to
+        make the same call once beforehand so the timed call is a cache hit."""
+        def prepare_call(iteration):
+            user = sampler.user()
+            if user is None:
+                return None
+            args = [get_arg(user) if callable(get_arg) else get_arg for get_arg in get_args]
+            if cache == 'cold':
+                quickfetch_cache.clear()
+            elif cache == 'warm':
+                function(*args)
+            return lambda: function(*args)
+        return prepare_call
+
+    def user_id(user):
+        return user.id
+
+    def user_as_is(user):
+        return user
+
+    def report_burst(iteration):
+        """Make a call that adds a report for each of BURST_SIZE users, the way everybody reports right after a group
+        class, and waits until they're all durable. They go out together in one batch, so this shows how the cost of a
+        batch grows with the size of the database."""
+        reports = []
+        for _ in range(BURST_SIZE):
+            user = sampler.user()
+            if user is None:
+                return None
+            reports.append((user.id, sampler.workout_id(user)))
+
+        def call():
+            for user_id, workout_id in reports:
+                workout_backend.add_report(user_id, 'complete', workout_id=workout_id)
+            workout_backend.flush_store()
+        return call
+
+    quickfetches = workout_quickfetches
+    operations = [
+        ('get_all_reports', call_with_user(workout_backend.get_all_reports, user_id)),
+        ('reports_years_quickfetch', call_with_user(quickfetches.reports_years_quickfetch, user_id,
+                                                    cache='cold')),
+        ('reports_months_quickfetch', call_with_user(lambda user, date: quickfetches.reports_months_quickfetch(
+            user.id, date[0]), user_as_is, sampler.report_date, cache='cold')),
+        ('reports_days_quickfetch', call_with_user(lambda user, date: quickfetches.reports_days_quickfetch(
+            user.id, date[0], date[1]), user_as_is, sampler.report_date, cache='cold')),
+        ('reports_by_day_quickfetch', call_with_user(lambda user, date: quickfetches.reports_by_day_quickfetch(
+            user.id, *date), user_as_is, sampler.report_date, cache='cold')),
+        ('fields_in_report_quickfetch', call_with_user(lambda user, report_id: quickfetches.fields_in_report_quickfetch(
+            user.id, report_id), user_as_is, sampler.report_id, cache='cold')),
+        ('workouts_quickfetch', call_with_user(quickfetches.workouts_quickfetch, user_id, cache='cold')),
+        ('workouts_quickfetch (cached)', call_with_user(quickfetches.workouts_quickfetch, user_id, cache='warm')),
+        ('view_report_main', call_with_user(workout_main.view_report_main, user_as_is, sampler.report_id)),
+        ('view_workout_main', call_with_user(workout_main.view_workout_main, user_as_is, sampler.workout_id)),
+
+        ('add_report', call_with_user(lambda user, workout_id: workout_backend.add_report(
+            user.id, 'complete', workout_id=workout_id), user_as_is, sampler.workout_id)),
+        ('edit_value', call_with_user(lambda user, workout_id: workout_backend.edit_value(
+            user.id, 'muscle_group', 'legs', 'scheduled_workout', workout_id), user_as_is, sampler.workout_id)),
+        ('schedule_routine_main', call_with_user(workout_main.schedule_routine_main, user_as_is, 'New workout', 'legs',
+                                                 None, None, None, 'Monday', 'Thursday', None, None, None, None, None)),
+        ('report_scheduled_main', call_with_user(workout_main.report_scheduled_main, user_as_is, sampler.workout_id,
+                                                 'complete', None)),
+        ('report_unscheduled_main', call_with_user(workout_main.report_unscheduled_main, user_as_is, 'Run', 'legs',
+                                                   None, None, None, None)),
+        ('edit_workout_main', call_with_user(workout_main.edit_workout_main, user_as_is, sampler.workout_id,
+                                             'weights_used', '10kg', None, None, None, None, None, None, None)),
+        ('edit_report_main', call_with_user(workout_main.edit_report_main, user_as_is, sampler.report_id, 'comment',
+                                            'Felt good')),
+        ('flush_store', lambda iteration: workout_backend.flush_store),
+        ('report_burst', report_burst),
+
+        ('delete_report_main', call_with_user(workout_main.delete_report_main, user_as_is,
+                                              lambda user: sampler.report_id(user, scheduled_only=True))),
+        ('delete_workout_main', call_with_user(workout_main.delete_workout_main, user_as_is, sampler.workout_id,
+                                               'False')),
+    ]
+    return operations
+
+
+def run_scale(num_users, workouts_per_user, reports_per_workout, unscheduled_per_user, years=3, repeats=50,
+              engine='json', seed=0, codec='json'):
+    """Generate a database of one size, point the backend at it and benchmark every entry point against it.
+
+    :param num_users: (int) how many users to generate
+    :param workouts_per_user: (int) how many scheduled workouts each user has
+    :param reports_per_workout: (int) how many reports each scheduled workout has
+    :param unscheduled_per_user: (int) how many unscheduled workout reports each user has
+    :param years: (int) how many years back the reports go
+    :param repeats: (int) how many timed calls to make to each entry point
+    :param engine: (str) the STORAGE_ENGINE to benchmark
+    :param seed: (int) the seed for the dataset and for picking arguments
+    :param codec: (str) the FILE_CODEC to write the database with
+    :return: (dict) the size of the database and the results for every entry point
+    """
+    directory = tempfile.mkdtemp(prefix='workout-benchmark-')
+    try:
+        filename = os.path.join(directory, 'workouts.json')
+        with open(filename, 'w') as file:
+            json.dump(generate_dataset(num_users, workouts_per_user, reports_per_workout, unscheduled_per_user,
+                                       years, seed), file, indent=4)
+        convert_database(filename, codec)
+        database_bytes = os.path.getsize(filename)
+
+        # The backend reads its settings from the environment when it opens the engine, so this points it at the
+        # generated database
+        os.environ['FILENAME'] = filename
+        os.environ['STORAGE_ENGINE'] = engine
+        os.environ['FILE_CODEC'] = codec
+        os.environ['SHARD_DIRECTORY'] = os.path.join(directory, 'shards')
+        os.environ['SQLITE_FILENAME'] = os.path.join(directory, 'workouts.sqlite3')
+        if engine == 'sharded':
+            from workout_shards import split_json_file
+            split_json_file(filename, os.environ['SHARD_DIRECTORY'], config("SHARD_BUCKETS", default=0, cast=int))
+        elif engine == 'sqlite':
+            from workout_sqlite import migrate_json_to_sqlite
+            migrate_json_to_sqlite(filename, os.environ['SQLITE_FILENAME'])
+
+        workout_backend.close_store()
+        results = {'load_store': _measure(lambda iteration: workout_backend.load_store, max(1, repeats // 10))}
+        for name, prepare_call in _operations(_Sampler(seed)):
+            results[name] = _measure(prepare_call, repeats)
+        workout_backend.close_store()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    return {'users': num_users,
+            'workouts_per_user': workouts_per_user,
+            'reports_per_workout': reports_per_workout,
+            'unscheduled_per_user': unscheduled_per_user,
+            'years': years,
+            'database_bytes': database_bytes,
+            'results': results}
+
+
+def run_benchmark(user_counts, workouts_per_user=5, reports_per_workout=50, unscheduled_per_user=20, years=3,
+                  repeats=50, engine='json', seed=0, label=None, codec='json'):
+    """Benchmark every entry point at several database sizes.
+
+    :param user_counts: (list of ints) the number of users at each size
+    :param workouts_per_user: (int) how many scheduled workouts each user has
+    :param reports_per_workout: (int) how many reports each scheduled workout has
+    :param unscheduled_per_user: (int) how many unscheduled workout reports each user has
+    :param years: (int) how many years back the reports go
+    :param repeats: (int) how many timed calls to make to each entry point at each size
+    :param engine: (str) the STORAGE_ENGINE to benchmark
+    :param seed: (int) the seed for the datasets and for picking arguments
+    :param label: (str) a name for this run, ex: a version number or commit, to tell results apart when comparing
+    :param codec: (str) the FILE_CODEC to write the databases with
+    :return: (dict) the results, ready to be dumped as JSON
+    """
+    return {'label': label,
+            'date': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'engine': engine,
+            'codec': codec,
+            'repeats': repeats,
+            'seed': seed,
+            'scales': [run_scale(num_users, workouts_per_user, reports_per_workout, unscheduled_per_user, years,
+                                 repeats, engine, seed, codec)
+                       for num_users in user_counts]}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the workout bot against generated databases of several "
+                                                 "sizes and print the results as JSON.")
+    parser.add_argument('--users', type=int, nargs='+', default=[10, 100, 1000],
+                        help="the number of users at each size to benchmark (default: 10 100 1000)")
+    parser.add_argument('--workouts', type=int, default=5, help="scheduled workouts per user (default: 5)")
+    parser.add_argument('--reports', type=int, default=50, help="reports per scheduled workout (default: 50)")
+    parser.add_argument('--unscheduled', type=int, default=20, help="unscheduled reports per user (default: 20)")
+    parser.add_argument('--years', type=int, default=3, help="how many years back the reports go (default: 3)")
+    parser.add_argument('--repeats', type=int, default=50, help="timed calls per entry point (default: 50)")
+    parser.add_argument('--engine', default=None,
+                        help="the storage engine to benchmark (defaults to the STORAGE_ENGINE config key)")
+    parser.add_argument('--codec', default=None,
+                        help="the file format to benchmark (defaults to the FILE_CODEC config key)")
+    parser.add_argument('--seed', type=int, default=0, help="seed for the generated data (default: 0)")
+    parser.add_argument('--label', default=None, help="a name for this run, ex: the version being benchmarked")
+    parser.add_argument('--output', default=None, help="write the results to this file instead of printing them")
+    args = parser.parse_args()
+
+    benchmark = run_benchmark(args.users, args.workouts, args.reports, args.unscheduled, args.years, args.repeats,
+                              args.engine or config("STORAGE_ENGINE", default='json'), args.seed, args.label,
+                              args.codec or config("FILE_CODEC", default='json'))
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(benchmark, file, indent=4)
+    else:
+        print(json.dumps(benchmark, indent=4))
@@ -0,0 +1,156 @@
+import inspect
+import threading
+from collections import OrderedDict
+from functools import wraps
+from decouple import config
+
+from workout_backend import add_listener
+from workout_metrics import metrics
+
+
+class QuickfetchCache:
+    """A bounded LRU cache of quickfetch results, keyed by the quickfetch, the user and the other arguments.
+
+    Every entry belongs to one user. The backend tells the cache about every change to the resident database, and all
+    the entries of the user whose data changed are dropped, so a cached result is never out of date.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        # user_id -> set of the keys of that user's entries, so a user's entries can be dropped without a scan
+        self.user_keys = {}
+        self.lock = threading.Lock()
+        # Bumped whenever a user's entries are dropped, so a result computed from data that changed while it was
+        # being computed is never cached. The None entry is bumped when everything is dropped
+        self.generations = {None: 0}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        """Look up a cached result, marking it as the most recently used.
+
+        :param key: (tuple) (quickfetch name, user_id, other arguments...)
+        :return: (tuple) (True, result) on a hit, or (False, None) on a miss
+        """
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return True, self.entries[key]
+            self.misses += 1
+            return False, None
+
+    def generation(self, user_id):
+        """Get a token that changes whenever the user's cached results are dropped.
+
+        :param user_id: (str) the Discord ID of the user
+        :return: (tuple) the token
+        """
+        with self.lock:
+            return self.generations[None], self.generations.get(user_id, 0)
+
+    def put(self, key, result, generation):
+        """Cache a result, evicting the least recently used entry if the cache is full.
+
+        :param key: (tuple) (quickfetch name, user_id, other arguments...)
+        :param result: (any) the quickfetch's result
+        :param generation: (tuple) the user's generation() from before the result was computed. If it has changed
+                           since, the user's data changed in the meantime and the result isn't cached
+        """
+        with self.lock:
+            if (self.generations[None], self.generations.get(key[1], 0)) != generation:
+                return
+            self.entries[key] = result
+            self.entries.move_to_end(key)
+            self.user_keys.setdefault(key[1], set()).add(key)
+            while len(self.entries) > self.max_size:
+                old_key, old_result = self.entries.popitem(last=False)
+                self._forget_key(old_key)
+                self.evictions += 1
+
+    def invalidate_user(self, user_id):
+        """Drop every cached result for a user.
+
+        :param user_id: (str) the Discord ID of the user
+        """
+        with self.lock:
+            self.generations[user_id] = self.generations.get(user_id, 0) + 1
+            for key in self.user_keys.pop(user_id, ()):
+                del self.entries[key]
+                self.invalidations += 1
+
+    def clear(self):
+        """Drop every cached result."""
+        with self.lock:
+            self.generations[None] += 1
+            self.invalidations += len(self.entries)
+            self.entries.clear()
+            self.user_keys.clear()
+
+    def update(self, op, path, old_value, new_value):
+        """Backend listener: drop the cached results of the user whose data just changed.
+
+        :param op: (str) 'set' or 'delete'
+        :param path: (tuple) the keys leading to the value that changed
+        :param old_value: (any) the value before the change
+        :param new_value: (any) the value after the change
+        """
+        if len(path) < 2:
+            self.clear()
+        else:
+            self.invalidate_user(path[1])
+
+    def stats(self):
+        """Get the cache's counters, for sizing it.
+
+        :return: (dict) hits, misses, evictions, invalidations, the hit rate, the current size and the maximum size
+        """
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'evictions': self.evictions,
+                    'invalidations': self.invalidations,
+                    'hit_rate': self.hits / lookups if lookups else 0.0,
+                    'size': len(self.entries),
+                    'max_size': self.max_size}
+
+    def _forget_key(self, key):
+        """Remove a key from its user's set of keys."""
+        keys = self.user_keys.get(key[1])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self.user_keys[key[1]]
+
+
+quickfetch_cache = QuickfetchCache(config("QUICKFETCH_CACHE_SIZE", default=1024, cast=int))
+add_listener(quickfetch_cache.update)
+metrics.add_gauges('workout_quickfetch_cache', quickfetch_cache.stats)
+
+
+def cached_quickfetch(quickfetch):
+    """Decorator that puts quickfetch_cache in front of a quickfetch. The quickfetch's first argument has to be the
+    user id, and its result must not be changed by whoever calls it, because the same object is handed out on hits.
+
+    :param quickfetch: (function) the quickfetch to be cached
+    :return: (function) the cached quickfetch
+    """
+    signature = inspect.signature(quickfetch)
+
+    @wraps(quickfetch)
+    def cached(*args, **kwargs):
+        arguments = list(signature.bind(*args, **kwargs).arguments.values())
+        key = (quickfetch.__name__,) + tuple(str(argument) for argument in arguments)
+        hit, result = quickfetch_cache.get(key)
+        if hit:
+            return result
+        generation = quickfetch_cache.generation(key[1])
+        result = quickfetch(*args, **kwargs)
+        quickfetch_cache.put(key, result, generation)
+        return result
+
+    return cached
@@ -0,0 +1,341 @@
+import argparse
+import json
+import os
+import struct
+from collections.abc import Mapping
+from decouple import config
+
+from workout_metrics import metrics
+from workout_models import encode_record
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+class Codec:
+    """Base class for the formats the database file can be written in. Every codec turns the resident database into
+    bytes and back without changing its layout, so a database can be converted between them at any time.
+    """
+    name = None
+
+    def dumps(self, json_data):
+        """Serialize the database.
+
+        :param json_data: (dict) the database, which may contain records
+        :return: (bytes) the serialized database
+        """
+        raise NotImplementedError
+
+    def loads(self, data):
+        """Parse a serialized database.
+
+        :param data: (bytes) the serialized database
+        :return: (dict) the database as plain dicts and lists
+        """
+        raise NotImplementedError
+
+    def dumps_map(self, items):
+        """Serialize a dict whose values have already been serialized, so that a large document can be put back
+        together from the parts that didn't change instead of being serialized from scratch. The result is the same as
+        dumps() of the whole dict.
+
+        :param items: (list of tuples) (key, value) for every entry, where value is the entry's value from dumps()
+        :return: (bytes) the serialized dict
+        """
+        raise NotImplementedError
+
+
+class JSONCodec(Codec):
+    """Compact JSON through the standard library. The file stays readable, at about half the size of the indented JSON
+    the bot used to write."""
+    name = 'json'
+
+    def dumps(self, json_data):
+        return json.dumps(json_data, separators=(',', ':'), default=encode_record).encode()
+
+    def loads(self, data):
+        return json.loads(data)
+
+    def dumps_map(self, items):
+        return _join_json_map(self, items)
+
+
+class OrjsonCodec(Codec):
+    """Compact JSON through orjson, which writes exactly the same files as the json codec, only faster. Needs
+    orjson to be installed."""
+    name = 'orjson'
+
+    def __init__(self):
+        if orjson is None:
+            raise ValueError("FILE_CODEC is 'orjson', but orjson isn't installed. Run: pip install orjson")
+
+    def dumps(self, json_data):
+        return orjson.dumps(json_data, default=encode_record)
+
+    def loads(self, data):
+        return orjson.loads(data)
+
+    def dumps_map(self, items):
+        return _join_json_map(self, items)
+
+
+class MsgpackCodec(Codec):
+    """The MessagePack binary format, which is the smallest and doesn't have to escape or parse any text. The msgpack
+    package is used if it's installed, otherwise the built-in packer below, which writes the same bytes."""
+    name = 'msgpack'
+
+    def dumps(self, json_data):
+        if msgpack is not None:
+            return msgpack.packb(json_data, default=encode_record)
+        chunks = []
+        _pack(json_data, chunks)
+        return b''.join(chunks)
+
+    def loads(self, data):
+        if msgpack is not None:
+            return msgpack.unpackb(data, strict_map_key=False)
+        value, offset = _unpack(data, 0)
+        if offset != len(data):
+            raise ValueError(f"{len(data) - offset} bytes were left over after the end of the MessagePack data.")
+        return value
+
+    def dumps_map(self, items):
+        chunks = [_map_header(len(items))]
+        for key, value in items:
+            chunks.append(self.dumps(key))
+            chunks.append(value)
+        return b''.join(chunks)
+
+
+def _join_json_map(codec, items):
+    """Put a compact JSON object together from its serialized values, for the JSON codecs' dumps_map()."""
+    return b'{' + b','.join(codec.dumps(key) + b':' + value for key, value in items) + b'}'
+
+
+CODECS = {codec.name: codec for codec in (JSONCodec, OrjsonCodec, MsgpackCodec)}
+
+
+def get_codec(name=None):
+    """Create a codec by name.
+
+    :param name: (str) 'json', 'orjson' or 'msgpack', or None for the one named by the FILE_CODEC config key
+        ('json' by default)
+    :return: (Codec) the codec
+    """
+    name = name or config("FILE_CODEC", default='json')
+    if name not in CODECS:
+        raise ValueError(f"FILE_CODEC must be 'json', 'orjson' or 'msgpack', but got '{name}'.")
+    return CODECS[name]()
+
+
+def detect_codec(data):
+    """Work out which codec a serialized database was written with. JSON always starts with an opening brace, after
+    any whitespace, and MessagePack never does, since a map's first byte is 0x80-0x8f, 0xde or 0xdf.
+
+    :param data: (bytes) the serialized database
+    :return: (Codec) a codec that can read it, preferring orjson for JSON when it's installed
+    """
+    if data.lstrip()[:1] == b'{':
+        return OrjsonCodec() if orjson is not None else JSONCodec()
+    return MsgpackCodec()
+
+
+def read_database(filename):
+    """Read a database file written with any codec.
+
+    :param filename: (str) the path of the file
+    :return: (dict) the database as plain dicts and lists
+    """
+    with open(filename, 'rb') as file:
+        data = file.read()
+    metrics.count_bytes('read', len(data))
+    return detect_codec(data).loads(data)
+
+
+def write_database(filename, data):
+    """Write a serialized database to a file and wait until it is durable. The data goes to a temporary file that is
+    swapped in, so a crash mid-write never leaves a truncated file.
+
+    :param filename: (str) the path of the file
+    :param data: (bytes) the serialized database, from a codec's dumps()
+    """
+    temp_filename = filename + '.tmp'
+    with open(temp_filename, 'wb') as file:
+        file.write(data)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp_filename, filename)
+    metrics.count_bytes('written', len(data))
+
+
+def convert_database(filename, codec_name, output_filename=None):
+    """Rewrite a database file with another codec.
+
+    :param filename: (str) the path of the database to read, in any format
+    :param codec_name: (str) the codec to write it with
+    :param output_filename: (str) where to write the result, or None to replace the file in place
+    :return: (tuple) the sizes of the old and new files in bytes
+    """
+    old_size = os.path.getsize(filename)
+    data = get_codec(codec_name).dumps(read_database(filename))
+    write_database(output_filename or filename, data)
+    return old_size, len(data)
+
+
+# The built-in MessagePack packer and unpacker. Only the types the database holds are supported: dicts, lists, str,
+# int, float, bool and None, plus records, which are packed as maps
+def _pack(value, chunks):
+    """Append the MessagePack encoding of a value to a list of byte strings.
+
+    :param value: (any) the value to pack
+    :param chunks: (list of bytes) where the encoding goes
+    """
+    if value is None:
+        chunks.append(b'\xc0')
+    elif value is True:
+        chunks.append(b'\xc3')
+    elif value is False:
+        chunks.append(b'\xc2')
+    elif isinstance(value, str):
+        encoded = value.encode()
+        length = len(encoded)
+        if length < 32:
+            chunks.append(bytes((0xa0 | length,)))
+        elif length < 0x100:
+            chunks.append(struct.pack('>BB', 0xd9, length))
+        elif length < 0x10000:
+            chunks.append(struct.pack('>BH', 0xda, length))
+        else:
+            chunks.append(struct.pack('>BI', 0xdb, length))
+        chunks.append(encoded)
+    elif isinstance(value, int):
+        if 0 <= value < 0x80:
+            chunks.append(bytes((value,)))
+        elif -32 <= value < 0:
+            chunks.append(struct.pack('>b', value))
+        else:
+            for first, (format, size) in _INT_TYPES:
+                low, high = (0, 1 << (8 * size)) if first < 0xd0 else (-1 << (8 * size - 1), 1 << (8 * size - 1))
+                if low <= value < high:
+                    chunks.append(struct.pack('>B' + format[1:], first, value))
+                    break
+            else:
+                raise OverflowError(f"{value} is too big for MessagePack.")
+    elif isinstance(value, float):
+        chunks.append(struct.pack('>Bd', 0xcb, value))
+    elif isinstance(value, Mapping):
+        chunks.append(_map_header(len(value)))
+        for key, item in value.items():
+            _pack(key, chunks)
+            _pack(item, chunks)
+    elif isinstance(value, (list, tuple)):
+        length = len(value)
+        if length < 16:
+            chunks.append(bytes((0x90 | length,)))
+        elif length < 0x10000:
+            chunks.append(struct.pack('>BH', 0xdc, length))
+        else:
+            chunks.append(struct.pack('>BI', 0xdd, length))
+        for item in value:
+            _pack(item, chunks)
+    else:
+        raise TypeError(f"Object of type {type(value).__name__} can't be packed as MessagePack.")
+
+
+def _map_header(length):
+    """Get the MessagePack header of a map with some number of entries, which are laid out right after it.
+
+    :param length: (int) the number of entries
+    :return: (bytes) the header
+    """
+    if length < 16:
+        return bytes((0x80 | length,))
+    if length < 0x10000:
+        return struct.pack('>BH', 0xde, length)
+    return struct.pack('>BI', 0xdf, length)
+
+
+# Fixed-size types: first byte -> (struct format, size)
+_FIXED_TYPES = {0xca: ('>f', 4), 0xcb: ('>d', 8), 0xcc: ('>B', 1), 0xcd: ('>H', 2), 0xce: ('>I', 4), 0xcf: ('>Q', 8),
+                0xd0: ('>b', 1), 0xd1: ('>h', 2), 0xd2: ('>i', 4), 0xd3: ('>q', 8)}
+# The integer types, smallest first, in the order the packer tries them
+_INT_TYPES = [(first, _FIXED_TYPES[first]) for first in (0xcc, 0xd0, 0xcd, 0xd1, 0xce, 0xd2, 0xcf, 0xd3)]
+# Types that are followed by a length: first byte -> (kind, struct format of the length, size of the length)
+_SIZED_TYPES = {0xd9: ('str', '>B', 1), 0xda: ('str', '>H', 2), 0xdb: ('str', '>I', 4),
+                0xc4: ('bin', '>B', 1), 0xc5: ('bin', '>H', 2), 0xc6: ('bin', '>I', 4),
+                0xdc: ('array', '>H', 2), 0xdd: ('array', '>I', 4),
+                0xde: ('map', '>H', 2), 0xdf: ('map', '>I', 4)}
+
+
+def _unpack(data, offset):
+    """Decode the MessagePack value starting at an offset.
+
+    :param data: (bytes) the MessagePack data
+    :param offset: (int) where the value starts
+    :return: (tuple) the value, and the offset just past it
+    """
+    first = data[offset]
+    offset += 1
+    if first < 0x80:
+        return first, offset
+    if first >= 0xe0:
+        return first - 0x100, offset
+    if first == 0xc0:
+        return None, offset
+    if first == 0xc2:
+        return False, offset
+    if first == 0xc3:
+        return True, offset
+    if first in _FIXED_TYPES:
+        format, size = _FIXED_TYPES[first]
+        return struct.unpack_from(format, data, offset)[0], offset + size
+
+    if 0xa0 <= first <= 0xbf:
+        kind, length = 'str', first & 0x1f
+    elif 0x90 <= first <= 0x9f:
+        kind, length = 'array', first & 0x0f
+    elif 0x80 <= first <= 0x8f:
+        kind, length = 'map', first & 0x0f
+    elif first in _SIZED_TYPES:
+        kind, format, size = _SIZED_TYPES[first]
+        length = struct.unpack_from(format, data, offset)[0]
+        offset += size
+    else:
+        raise ValueError(f"Unsupported MessagePack type 0x{first:02x} at byte {offset - 1}.")
+
+    if kind == 'str':
+        return data[offset:offset + length].decode(), offset + length
+    if kind == 'bin':
+        return data[offset:offset + length], offset + length
+    if kind == 'array':
+        items = []
+        for _ in range(length):
+            item, offset = _unpack(data, offset)
+            items.append(item)
+        return items, offset
+
+    mapping = {}
+    for _ in range(length):
+        key, offset = _unpack(data, offset)
+        mapping[key], offset = _unpack(data, offset)
+    return mapping, offset
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert the workout database file to another format.")
+    parser.add_argument('codec', choices=sorted(CODECS), help="the format to convert the database to")
+    parser.add_argument('filename', nargs='?', default=None,
+                        help="the database to convert, in any format (defaults to the FILENAME config key)")
+    parser.add_argument('--output', default=None, help="write the result here instead of replacing the file")
+    args = parser.parse_args()
+
+    old_size, new_size = convert_database(args.filename or config("FILENAME"), args.codec, args.output)
+    print(f"Converted the database to {args.codec}: {old_size} bytes -> {new_size} bytes. "
+          f"Set FILE_CODEC={args.codec} to keep writing it that way.")
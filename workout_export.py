@@ -0,0 +1,85 @@
+import csv
+import io
+import json
+
+# Every record in an export has these fields, in this order, so CSV files have the same columns for every kind of
+# record. Fields a record doesn't use are empty. type is 'scheduled_workout', 'report' (a report on a scheduled
+# workout, whose workout_id says which) or 'unscheduled_workout'
+EXPORT_FIELDS = ('type', 'id', 'workout_id', 'workout_name', 'days_scheduled', 'muscle_group', 'weights_used',
+                 'tutorial_url', 'img_url', 'completion', 'comment')
+RECORD_TYPES = ('scheduled_workout', 'report', 'unscheduled_workout')
+EXPORT_FORMATS = ('ndjson', 'csv')
+
+
+def write_records(records, file, file_format='ndjson'):
+    """Write records to a file one at a time, so only one is ever held in memory.
+
+    :param records: (iterable of dicts) the records, ex: from the backend's iter_records()
+    :param file: (file) a file opened for writing bytes
+    :param file_format: (str) 'ndjson' for one JSON object per line, or 'csv' for a header row and then one row per
+                        record
+    :return: (int) how many records were written
+    """
+    if file_format not in EXPORT_FORMATS:
+        raise ValueError(f"The export format must be 'ndjson' or 'csv', but got '{file_format}'.")
+    text = io.TextIOWrapper(file, encoding='utf-8', newline='', write_through=True)
+    count = 0
+    try:
+        if file_format == 'ndjson':
+            for record in records:
+                text.write(json.dumps({field: record.get(field) for field in EXPORT_FIELDS}) + '\n')
+                count += 1
+        else:
+            writer = csv.writer(text)
+            writer.writerow(EXPORT_FIELDS)
+            for record in records:
+                writer.writerow([_csv_value(record.get(field)) for field in EXPORT_FIELDS])
+                count += 1
+    finally:
+        # Leave the file itself open for the caller
+        text.detach()
+    return count
+
+
+def read_records(file, file_format='ndjson'):
+    """Read records from a file one at a time.
+
+    :param file: (file) a file opened for reading bytes
+    :param file_format: (str) 'ndjson' or 'csv', the same as for write_records()
+    :return: (generator of dicts) the records, with every field in EXPORT_FIELDS. Empty fields are None, and
+             days_scheduled is a list
+    """
+    if file_format not in EXPORT_FORMATS:
+        raise ValueError(f"The import format must be 'ndjson' or 'csv', but got '{file_format}'.")
+    text = io.TextIOWrapper(file, encoding='utf-8-sig', newline='')
+    if file_format == 'ndjson':
+        rows = (json.loads(line) for line in text if line.strip())
+    else:
+        rows = csv.DictReader(text)
+
+    try:
+        for record_number, row in enumerate(rows, start=1):
+            record = {field: row.get(field) if row.get(field) != '' else None for field in EXPORT_FIELDS}
+            if record['type'] not in RECORD_TYPES:
+                raise ValueError(f"Record {record_number} has the type '{record['type']}', but it must be one of "
+                                 f"{', '.join(RECORD_TYPES)}.")
+            if record['id'] is None:
+                raise ValueError(f"Record {record_number} doesn't have an id.")
+            record['id'] = str(record['id'])
+            if record['workout_id'] is not None:
+                record['workout_id'] = str(record['workout_id'])
+            if isinstance(record['days_scheduled'], str):
+                record['days_scheduled'] = [day.strip() for day in record['days_scheduled'].split(',') if day.strip()]
+            yield record
+    finally:
+        # Leave the file itself open for the caller
+        text.detach()
+
+
+def _csv_value(value):
+    """Turn a field into the text of a CSV cell. Lists, like days_scheduled, are joined with commas."""
+    if value is None:
+        return ''
+    if isinstance(value, (list, tuple)):
+        return ','.join(str(item) for item in value)
+    return value
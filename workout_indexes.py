@@ -0,0 +1,711 @@
+from bisect import bisect_left, bisect_right, insort
+from collections.abc import Mapping
+from datetime import datetime
+from heapq import nlargest
+
+
+def report_entries(path, value, workout_name=None):
+    """List every report contained in a value of the database, along with the workout it belongs to. This is how the
+    indexes find out which reports appeared or disappeared when a whole user, workout or report was set or deleted.
+
+    :param path: (tuple) the keys leading to the value, ex: ('users', '1234', 'scheduled_workout', '1646880978.1')
+    :param value: (dict or Record) the value at the end of the path
+    :param workout_name: (str) the name of the scheduled workout, if the path leads inside one. The reports inside a
+                         scheduled workout don't hold its name themselves
+    :return: (list of tuples) (report_id, workout_id, workout_name) for every report. workout_id is None for
+             unscheduled reports
+    """
+    if not isinstance(value, Mapping) or len(path) < 2:
+        return []
+
+    if len(path) == 2:
+        entries = report_entries(path + ('unscheduled_workout',), value.get('unscheduled_workout', {}))
+        return entries + report_entries(path + ('scheduled_workout',), value.get('scheduled_workout', {}))
+
+    kind = path[2]
+    if kind == 'unscheduled_workout':
+        if len(path) == 3:
+            return [(report_id, None, report.get('workout_name')) for report_id, report in value.items()]
+        if len(path) == 4:
+            return [(path[3], None, value.get('workout_name'))]
+
+    elif kind == 'scheduled_workout':
+        if len(path) == 3:
+            entries = []
+            for workout_id, workout in value.items():
+                entries.extend(report_entries(path + (workout_id,), workout))
+            return entries
+        if len(path) == 4:
+            return [(report_id, path[3], value.get('workout_name')) for report_id in value.get('reports', {})]
+        if len(path) == 5 and path[4] == 'reports':
+            return [(report_id, path[3], workout_name) for report_id in value]
+        if len(path) == 6 and path[4] == 'reports':
+            return [(path[5], path[3], workout_name)]
+
+    return []
+
+
+class ReportTimeIndex:
+    """A sorted array of report times for every user, with the report id, workout id and workout name alongside, so
+    that time range lookups are bisections instead of scans of every report.
+
+    A user's array is built the first time it's needed and is then kept up to date by update(), which the backend
+    calls after every change to the resident database. Reports in the archive are built into the array along with the
+    resident ones.
+    """
+
+    def __init__(self, archive=None):
+        # Where older reports are kept, if anywhere
+        self.archive = archive
+        # user_id -> sorted list of report times, and the matching list of (report_id, workout_id, workout_name)
+        self.times = {}
+        self.entries = {}
+        # user_id -> {workout_id: workout_name}, for naming the reports that get added to a scheduled workout
+        self.workout_names = {}
+
+    def clear(self):
+        """Forget every user's array. They are rebuilt the next time they're needed."""
+        self.times = {}
+        self.entries = {}
+        self.workout_names = {}
+
+    def forget(self, user_id):
+        """Forget one user's array. It is rebuilt the next time it's needed.
+
+        :param user_id: (str) the Discord ID of the user
+        """
+        self.times.pop(user_id, None)
+        self.entries.pop(user_id, None)
+        self.workout_names.pop(user_id, None)
+
+    def build(self, user_id, user):
+        """Build a user's array from scratch if it hasn't been built yet.
+
+        :param user_id: (str) the Discord ID of the user
+        :param user: (dict) the user's resident data
+        """
+        if user_id in self.times:
+            return
+        entries = report_entries(('users', user_id), user)
+        if self.archive is not None:
+            entries += self.archive.entries(user_id, user)
+        entries.sort(key=lambda entry: float(entry[0]))
+        self.times[user_id] = [float(entry[0]) for entry in entries]
+        self.entries[user_id] = entries
+        self.workout_names[user_id] = {workout_id: workout['workout_name']
+                                       for workout_id, workout in user['scheduled_workout'].items()}
+
+    def update(self, op, path, old_value, new_value):
+        """Bring the arrays up to date after a change to the resident database. Users whose arrays haven't been built
+        yet are skipped, since they'll be built from the up-to-date data anyway.
+
+        :param op: (str) 'set' or 'delete'
+        :param path: (tuple) the keys leading to the value that changed
+        :param old_value: (any) the value before the change, or None if there wasn't one
+        :param new_value: (any) the value after the change, or None if it was deleted
+        """
+        if len(path) < 2:
+            self.clear()
+            return
+        user_id = path[1]
+        if user_id not in self.times:
+            return
+
+        # When a whole user or one of their dicts of workouts is replaced, it's simplest to rebuild their array later
+        if len(path) == 2 or (len(path) == 3 and path[2] in ('scheduled_workout', 'unscheduled_workout')):
+            self.forget(user_id)
+            return
+
+        # A workout or an unscheduled report being renamed changes the name stored next to its reports
+        if path[-1] == 'workout_name' and len(path) == 5:
+            if path[2] == 'scheduled_workout':
+                self.workout_names[user_id][path[3]] = new_value
+                self._rename(user_id, lambda entry: entry[1] == path[3], new_value)
+            elif path[2] == 'unscheduled_workout':
+                self._rename(user_id, lambda entry: entry[1] is None and entry[0] == path[3], new_value)
+            return
+
+        workout_name = self.workout_names[user_id].get(path[3]) if len(path) > 4 else None
+        for entry in report_entries(path, old_value, workout_name):
+            self._remove(user_id, entry[0])
+        for entry in report_entries(path, new_value, workout_name):
+            self._insert(user_id, entry)
+
+        # Keep track of the names of scheduled workouts as they come and go
+        if len(path) == 4 and path[2] == 'scheduled_workout':
+            if new_value is None:
+                self.workout_names[user_id].pop(path[3], None)
+            else:
+                self.workout_names[user_id][path[3]] = new_value['workout_name']
+
+    def range(self, user_id, start=None, end=None):
+        """Get the entries for every report made between start and end.
+
+        :param user_id: (str) the Discord ID of the user
+        :param start: (float) unix time of the start of the range, inclusive. None means no lower bound
+        :param end: (float) unix time of the end of the range, exclusive. None means no upper bound
+        :return: (tuple) the sorted list of report times and the matching list of (report_id, workout_id, workout_name)
+        """
+        times = self.times[user_id]
+        low = 0 if start is None else bisect_left(times, start)
+        high = len(times) if end is None else bisect_left(times, end)
+        return times[low:high], self.entries[user_id][low:high]
+
+    def next_time(self, user_id, start, end=None):
+        """Get the time of the first report made at or after start (and before end, if given).
+
+        :param user_id: (str) the Discord ID of the user
+        :param start: (float) unix time to search from, inclusive
+        :param end: (float) unix time to stop searching at, exclusive. None means no upper bound
+        :return: (float) the report time, or None if there are no reports in that range
+        """
+        times = self.times[user_id]
+        position = bisect_left(times, start)
+        if position == len(times) or (end is not None and times[position] >= end):
+            return None
+        return times[position]
+
+    def _insert(self, user_id, entry):
+        """Insert one report into a user's array, keeping it sorted."""
+        report_time = float(entry[0])
+        times = self.times[user_id]
+        position = bisect_right(times, report_time)
+        times.insert(position, report_time)
+        self.entries[user_id].insert(position, entry)
+
+    def _remove(self, user_id, report_id):
+        """Remove one report from a user's array."""
+        report_time = float(report_id)
+        times = self.times[user_id]
+        entries = self.entries[user_id]
+        position = bisect_left(times, report_time)
+        while position < len(times) and times[position] == report_time:
+            if entries[position][0] == report_id:
+                del times[position]
+                del entries[position]
+                return
+            position += 1
+
+    def _rename(self, user_id, matches, new_name):
+        """Change the workout name stored next to every report that matches."""
+        entries = self.entries[user_id]
+        for position, entry in enumerate(entries):
+            if matches(entry):
+                entries[position] = (entry[0], entry[1], new_name)
+
+
+class ReportWorkoutIndex:
+    """A dict of every user's scheduled reports to the id of the workout each one belongs to, so a report can be found
+    by its id alone without a scan of every workout, and the reverse: every workout's reports, sorted by time, so a
+    page of a long history can be sliced out of it. Unscheduled reports aren't in it, since they can be looked up by
+    id directly.
+
+    Like the other indexes, a user's dict is built the first time it's needed, archived reports included, and then
+    kept up to date by update().
+    """
+
+    def __init__(self, archive=None):
+        # Where older reports are kept, if anywhere
+        self.archive = archive
+        # user_id -> {report_id: workout_id}
+        self.workout_ids = {}
+        # user_id -> {workout_id: sorted list of (report time, report_id)}
+        self.workout_reports = {}
+
+    def clear(self):
+        """Forget every user's dict. They are rebuilt the next time they're needed."""
+        self.workout_ids = {}
+        self.workout_reports = {}
+
+    def forget(self, user_id):
+        """Forget one user's dict. It is rebuilt the next time it's needed.
+
+        :param user_id: (str) the Discord ID of the user
+        """
+        self.workout_ids.pop(user_id, None)
+        self.workout_reports.pop(user_id, None)
+
+    def build(self, user_id, user):
+        """Build a user's dict from scratch if it hasn't been built yet.
+
+        :param user_id: (str) the Discord ID of the user
+        :param user: (dict) the user's resident data
+        """
+        if user_id in self.workout_ids:
+            return
+        workout_ids = {report_id: workout_id for workout_id, workout in user['scheduled_workout'].items()
+                       for report_id in workout['reports']}
+        if self.archive is not None:
+            workout_ids.update((report_id, workout_id) for report_id, workout_id, workout_name
+                               in self.archive.entries(user_id, user) if workout_id is not None)
+        self.workout_ids[user_id] = workout_ids
+
+        workout_reports = {}
+        for report_id, workout_id in workout_ids.items():
+            workout_reports.setdefault(workout_id, []).append((float(report_id), report_id))
+        for reports in workout_reports.values():
+            reports.sort()
+        self.workout_reports[user_id] = workout_reports
+
+    def update(self, op, path, old_value, new_value):
+        """Bring the dicts up to date after a change to the resident database. Users whose dicts haven't been built
+        yet are skipped, since they'll be built from the up-to-date data anyway.
+
+        :param op: (str) 'set' or 'delete'
+        :param path: (tuple) the keys leading to the value that changed
+        :param old_value: (any) the value before the change, or None if there wasn't one
+        :param new_value: (any) the value after the change, or None if it was deleted
+        """
+        if len(path) < 2:
+            self.clear()
+            return
+        user_id = path[1]
+        if user_id not in self.workout_ids:
+            return
+
+        # When a whole user or one of their dicts of workouts is replaced, it's simplest to rebuild their dict later
+        if len(path) == 2 or (len(path) == 3 and path[2] in ('scheduled_workout', 'unscheduled_workout')):
+            self.forget(user_id)
+            return
+
+        workout_ids = self.workout_ids[user_id]
+        workout_reports = self.workout_reports[user_id]
+        for report_id, workout_id, workout_name in report_entries(path, old_value):
+            if workout_id is not None and workout_ids.pop(report_id, None) is not None:
+                reports = workout_reports[workout_id]
+                del reports[bisect_left(reports, (float(report_id), report_id))]
+                if not reports:
+                    del workout_reports[workout_id]
+        for report_id, workout_id, workout_name in report_entries(path, new_value):
+            if workout_id is not None and report_id not in workout_ids:
+                workout_ids[report_id] = workout_id
+                insort(workout_reports.setdefault(workout_id, []), (float(report_id), report_id))
+
+    def workout_id(self, user_id, report_id):
+        """Get the id of the scheduled workout a report belongs to.
+
+        :param user_id: (str) the Discord ID of the user
+        :param report_id: (str) the id of the report
+        :return: (str) the workout's id, or None if the report isn't a scheduled report
+        """
+        return self.workout_ids[user_id].get(report_id)
+
+    def report_ids(self, user_id, workout_id):
+        """Get the ids of every report on a scheduled workout.
+
+        :param user_id: (str) the Discord ID of the user
+        :param workout_id: (str) the id of the workout
+        :return: (list of tuples) (report time, report_id) for every report on the workout, sorted by time. The list
+                 belongs to the index, so treat it as read-only
+        """
+        return self.workout_reports[user_id].get(workout_id, [])
+
+
+def normalize_workout_name(workout_name):
+    """Normalize a workout name for lookups, so that names differing only in case or spacing match.
+
+    :param workout_name: (str) the name, ex: '  Leg   Day'
+    :return: (str) the normalized name, ex: 'leg day'
+    """
+    return ' '.join(str(workout_name).split()).casefold()
+
+
+def _trigrams(text):
+    """Get the set of three-character substrings of a string."""
+    return {text[position:position + 3] for position in range(len(text) - 2)}
+
+
+def name_match_score(query, name):
+    """Score how well a name matches what the user has typed so far, for ranking autocomplete choices. Both should be
+    normalized with normalize_workout_name() first.
+
+    :param query: (str) what the user has typed, ex: 'sq'
+    :param name: (str) the name, ex: 'front squats'
+    :return: (float) 4 for the same name, 3 if the name starts with the query, 2 if one of its words does, 1.5 if the
+             query is anywhere in it, the share of the query's trigrams found in the name if that's at least a third
+             (so typos still match), or 0 for no match
+    """
+    if name == query:
+        return 4
+    if name.startswith(query):
+        return 3
+    if any(word.startswith(query) for word in name.split()):
+        return 2
+    if query in name:
+        return 1.5
+    if len(query) < 3:
+        return 0
+    query_trigrams = _trigrams(query)
+    similarity = len(query_trigrams & _trigrams('  ' + name + ' ')) / len(query_trigrams)
+    return similarity if similarity >= 1 / 3 else 0
+
+
+class WorkoutNameIndex:
+    """A dict of every user's normalized scheduled workout names to the ids of the workouts with that name, so a
+    workout can be found by name without a scan of every workout, and two workouts sharing a name are noticed instead
+    of one of them being picked at random.
+
+    Like the other indexes, a user's dict is built the first time it's needed and then kept up to date by update(),
+    which sees workouts being added, renamed and deleted.
+    """
+
+    def __init__(self):
+        # user_id -> {normalized workout name: set of workout ids}
+        self.workout_ids = {}
+
+    def clear(self):
+        """Forget every user's dict. They are rebuilt the next time they're needed."""
+        self.workout_ids = {}
+
+    def forget(self, user_id):
+        """Forget one user's dict. It is rebuilt the next time it's needed.
+
+        :param user_id: (str) the Discord ID of the user
+        """
+        self.workout_ids.pop(user_id, None)
+
+    def build(self, user_id, user):
+        """Build a user's dict from scratch if it hasn't been built yet.
+
+        :param user_id: (str) the Discord ID of the user
+        :param user: (dict) the user's resident data
+        """
+        if user_id in self.workout_ids:
+            return
+        self.workout_ids[user_id] = {}
+        for workout_id, workout in user['scheduled_workout'].items():
+            self._add(user_id, workout.get('workout_name'), workout_id)
+
+    def update(self, op, path, old_value, new_value):
+        """Bring the dicts up to date after a change to the resident database. Users whose dicts haven't been built
+        yet are skipped, since they'll be built from the up-to-date data anyway.
+
+        :param op: (str) 'set' or 'delete'
+        :param path: (tuple) the keys leading to the value that changed
+        :param old_value: (any) the value before the change, or None if there wasn't one
+        :param new_value: (any) the value after the change, or None if it was deleted
+        """
+        if len(path) < 2:
+            self.clear()
+            return
+        user_id = path[1]
+        if user_id not in self.workout_ids:
+            return
+
+        # When a whole user or their dict of workouts is replaced, it's simplest to rebuild their dict later
+        if len(path) == 2 or (len(path) == 3 and path[2] == 'scheduled_workout'):
+            self.forget(user_id)
+            return
+        if path[2] != 'scheduled_workout':
+            return
+
+        # A whole workout being added, replaced or deleted
+        if len(path) == 4:
+            if isinstance(old_value, Mapping):
+                self._remove(user_id, old_value.get('workout_name'), path[3])
+            if isinstance(new_value, Mapping):
+                self._add(user_id, new_value.get('workout_name'), path[3])
+
+        # A workout being renamed
+        elif len(path) == 5 and path[4] == 'workout_name':
+            self._remove(user_id, old_value, path[3])
+            if op == 'set':
+                self._add(user_id, new_value, path[3])
+
+    def workout_ids_named(self, user_id, workout_name):
+        """Get the ids of every workout with a name, ignoring case and spacing.
+
+        :param user_id: (str) the Discord ID of the user
+        :param workout_name: (str) the name of the workout
+        :return: (list of strs) the ids of the workouts with that name, oldest first. More than one means the name is
+                 ambiguous
+        """
+        workout_ids = self.workout_ids[user_id].get(normalize_workout_name(workout_name), ())
+        return sorted(workout_ids, key=float)
+
+    def _add(self, user_id, workout_name, workout_id):
+        """Add one workout to a user's dict."""
+        if workout_name is None:
+            return
+        self.workout_ids[user_id].setdefault(normalize_workout_name(workout_name), set()).add(workout_id)
+
+    def _remove(self, user_id, workout_name, workout_id):
+        """Remove one workout from a user's dict, dropping names that no workout has any more."""
+        if workout_name is None:
+            return
+        name = normalize_workout_name(workout_name)
+        workout_ids = self.workout_ids[user_id].get(name)
+        if workout_ids is None:
+            return
+        workout_ids.discard(workout_id)
+        if not workout_ids:
+            del self.workout_ids[user_id][name]
+
+
+class WorkoutSearchIndex(WorkoutNameIndex):
+    """A WorkoutNameIndex that can also search workout names by what the user has typed so far, for autocomplete.
+    Every user's normalized names and the words in them are kept sorted, so names and words starting with the query
+    are found with a bisection, and each name's trigrams are kept in posting lists, so names the query is in or
+    nearly matches (ex: a typo) are found without a scan.
+    """
+
+    def __init__(self):
+        super().__init__()
+        # user_id -> {workout_id: workout name as it was entered}, and the same with the names normalized
+        self.names = {}
+        self.normalized_names = {}
+        # user_id -> sorted list of (normalized name, workout_id), and the same for every word of every name
+        self.sorted_names = {}
+        self.sorted_words = {}
+        # user_id -> {trigram: set of the ids of the workouts whose normalized name contains it}
+        self.trigram_postings = {}
+
+    def clear(self):
+        super().clear()
+        self.names = {}
+        self.normalized_names = {}
+        self.sorted_names = {}
+        self.sorted_words = {}
+        self.trigram_postings = {}
+
+    def forget(self, user_id):
+        super().forget(user_id)
+        self.names.pop(user_id, None)
+        self.normalized_names.pop(user_id, None)
+        self.sorted_names.pop(user_id, None)
+        self.sorted_words.pop(user_id, None)
+        self.trigram_postings.pop(user_id, None)
+
+    def build(self, user_id, user):
+        if user_id in self.workout_ids:
+            return
+        self.names[user_id] = {}
+        self.normalized_names[user_id] = {}
+        self.sorted_names[user_id] = []
+        self.sorted_words[user_id] = []
+        self.trigram_postings[user_id] = {}
+        super().build(user_id, user)
+
+    def search(self, user_id, query, limit=25):
+        """Find the workouts that best match what the user has typed so far.
+
+        :param user_id: (str) the Discord ID of the user
+        :param query: (str) what the user has typed. With nothing typed, the newest workouts come back
+        :param limit: (int) the most workouts to return
+        :return: (list of tuples) (workout_id, workout_name) for the best matches, best first. Ties go to the newest
+                 workout
+        """
+        names = self.names[user_id]
+        query = normalize_workout_name(query)
+        if not query:
+            newest = sorted(names, key=float, reverse=True)[:limit]
+            return [(workout_id, names[workout_id]) for workout_id in newest]
+
+        # Score the workouts the same way name_match_score() does, starting with the names and then the words that
+        # start with the query, which are next to each other in the sorted lists
+        scores = {}
+        for sorted_keys, score in ((self.sorted_names[user_id], 3), (self.sorted_words[user_id], 2)):
+            position = bisect_left(sorted_keys, (query,))
+            while position < len(sorted_keys) and sorted_keys[position][0].startswith(query):
+                key, workout_id = sorted_keys[position]
+                if workout_id not in scores:
+                    scores[workout_id] = 4 if score == 3 and key == query else score
+                position += 1
+
+        # Then count the query's trigrams in every other name, unless there are already enough better matches. A name
+        # with all of them might have the query in it, and a name with at least a third of them is a near miss
+        query_trigrams = _trigrams(query)
+        if query_trigrams and len(scores) < limit:
+            postings = self.trigram_postings[user_id]
+            counts = {}
+            for trigram in query_trigrams:
+                for workout_id in postings.get(trigram, ()):
+                    counts[workout_id] = counts.get(workout_id, 0) + 1
+            normalized_names = self.normalized_names[user_id]
+            for workout_id, count in counts.items():
+                if workout_id in scores:
+                    continue
+                if count == len(query_trigrams) and query in normalized_names[workout_id]:
+                    scores[workout_id] = 1.5
+                elif count >= len(query_trigrams) / 3:
+                    scores[workout_id] = count / len(query_trigrams)
+
+        best = nlargest(limit, scores, key=lambda workout_id: (scores[workout_id], float(workout_id)))
+        return [(workout_id, names[workout_id]) for workout_id in best]
+
+    def _add(self, user_id, workout_name, workout_id):
+        super()._add(user_id, workout_name, workout_id)
+        if workout_name is None:
+            return
+        name = normalize_workout_name(workout_name)
+        self.names[user_id][workout_id] = workout_name
+        self.normalized_names[user_id][workout_id] = name
+        insort(self.sorted_names[user_id], (name, workout_id))
+        for word in set(name.split()):
+            insort(self.sorted_words[user_id], (word, workout_id))
+        postings = self.trigram_postings[user_id]
+        for trigram in _trigrams('  ' + name + ' '):
+            postings.setdefault(trigram, set()).add(workout_id)
+
+    def _remove(self, user_id, workout_name, workout_id):
+        super()._remove(user_id, workout_name, workout_id)
+        if workout_name is None:
+            return
+        name = normalize_workout_name(workout_name)
+        self.names[user_id].pop(workout_id, None)
+        self.normalized_names[user_id].pop(workout_id, None)
+        _remove_sorted(self.sorted_names[user_id], (name, workout_id))
+        for word in set(name.split()):
+            _remove_sorted(self.sorted_words[user_id], (word, workout_id))
+        postings = self.trigram_postings[user_id]
+        for trigram in _trigrams('  ' + name + ' '):
+            workout_ids = postings.get(trigram)
+            if workout_ids is not None:
+                workout_ids.discard(workout_id)
+                if not workout_ids:
+                    del postings[trigram]
+
+
+def _remove_sorted(sorted_list, item):
+    """Remove an item from a sorted list, if it's there."""
+    position = bisect_left(sorted_list, item)
+    if position < len(sorted_list) and sorted_list[position] == item:
+        del sorted_list[position]
+
+
+class CalendarIndex:
+    """A year -> month -> day tree of every user's reports, with the number of reports at each level and the ids of the
+    reports made on each day. The report pickers walk this tree one level at a time, so each level is a dict lookup.
+
+    Each day counts how many copies of every report id are in the database, since the same id can be there twice for
+    a moment, ex: when a deleted workout's reports are saved as unscheduled reports under their old ids. A report only
+    leaves the tree when its last copy goes.
+
+    Like ReportTimeIndex, a user's tree is built the first time it's needed and then kept up to date by update().
+    Levels that run out of reports are pruned, so deleted history doesn't leave empty branches behind. Archived reports
+    are counted too, which only takes their times, so listing an archived year doesn't page it in.
+    """
+
+    def __init__(self, archive=None):
+        # Where older reports are kept, if anywhere
+        self.archive = archive
+        # user_id -> {year: {'count': n, 'months': {month: {'count': n, 'days': {day: {report_id: copies}}}}}}
+        self.trees = {}
+
+    def clear(self):
+        """Forget every user's tree. They are rebuilt the next time they're needed."""
+        self.trees = {}
+
+    def forget(self, user_id):
+        """Forget one user's tree. It is rebuilt the next time it's needed.
+
+        :param user_id: (str) the Discord ID of the user
+        """
+        self.trees.pop(user_id, None)
+
+    def build(self, user_id, user):
+        """Build a user's tree from scratch if it hasn't been built yet.
+
+        :param user_id: (str) the Discord ID of the user
+        :param user: (dict) the user's resident data
+        """
+        if user_id in self.trees:
+            return
+        self.trees[user_id] = {}
+        for entry in report_entries(('users', user_id), user):
+            self._insert(user_id, entry[0])
+        if self.archive is not None:
+            for report_id in self.archive.report_ids(user_id, user):
+                self._insert(user_id, report_id)
+
+    def update(self, op, path, old_value, new_value):
+        """Bring the trees up to date after a change to the resident database. Users whose trees haven't been built
+        yet are skipped, since they'll be built from the up-to-date data anyway.
+
+        :param op: (str) 'set' or 'delete'
+        :param path: (tuple) the keys leading to the value that changed
+        :param old_value: (any) the value before the change, or None if there wasn't one
+        :param new_value: (any) the value after the change, or None if it was deleted
+        """
+        if len(path) < 2:
+            self.clear()
+            return
+        user_id = path[1]
+        if user_id not in self.trees:
+            return
+
+        # When a whole user or one of their dicts of workouts is replaced, it's simplest to rebuild their tree later
+        if len(path) == 2 or (len(path) == 3 and path[2] in ('scheduled_workout', 'unscheduled_workout')):
+            self.forget(user_id)
+            return
+
+        for entry in report_entries(path, old_value):
+            self._remove(user_id, entry[0])
+        for entry in report_entries(path, new_value):
+            self._insert(user_id, entry[0])
+
+    def years(self, user_id):
+        """Get every year the user made reports in.
+
+        :param user_id: (str) the Discord ID of the user
+        :return: (dict) {year: number of reports}
+        """
+        return {year: node['count'] for year, node in self.trees[user_id].items()}
+
+    def months(self, user_id, year):
+        """Get every month of a year that the user made reports in.
+
+        :param user_id: (str) the Discord ID of the user
+        :param year: (int) the year
+        :return: (dict) {month: number of reports}
+        """
+        year_node = self.trees[user_id].get(year, {'months': {}})
+        return {month: node['count'] for month, node in year_node['months'].items()}
+
+    def days(self, user_id, year, month):
+        """Get every day of a month that the user made reports on.
+
+        :param user_id: (str) the Discord ID of the user
+        :param year: (int) the year
+        :param month: (int) the month
+        :return: (dict) {day: set of the ids of the reports made that day}
+        """
+        year_node = self.trees[user_id].get(year, {'months': {}})
+        day_nodes = year_node['months'].get(month, {'days': {}})['days']
+        return {day: set(day_reports) for day, day_reports in day_nodes.items()}
+
+    def _insert(self, user_id, report_id):
+        """Add one report to a user's tree, creating the levels it needs."""
+        date = datetime.fromtimestamp(float(report_id))
+        year_node = self.trees[user_id].setdefault(date.year, {'count': 0, 'months': {}})
+        month_node = year_node['months'].setdefault(date.month, {'count': 0, 'days': {}})
+        day_reports = month_node['days'].setdefault(date.day, {})
+        day_reports[report_id] = day_reports.get(report_id, 0) + 1
+        if day_reports[report_id] > 1:
+            return
+        month_node['count'] += 1
+        year_node['count'] += 1
+
+    def _remove(self, user_id, report_id):
+        """Remove one report from a user's tree, pruning any level that is left empty."""
+        date = datetime.fromtimestamp(float(report_id))
+        year_node = self.trees[user_id].get(date.year)
+        if year_node is None or date.month not in year_node['months']:
+            return
+        month_node = year_node['months'][date.month]
+        day_reports = month_node['days'].get(date.day)
+        if day_reports is None or report_id not in day_reports:
+            return
+
+        day_reports[report_id] -= 1
+        if day_reports[report_id]:
+            return
+        del day_reports[report_id]
+        month_node['count'] -= 1
+        year_node['count'] -= 1
+        if not day_reports:
+            del month_node['days'][date.day]
+        if not month_node['days']:
+            del year_node['months'][date.month]
+        if not year_node['months']:
+            del self.trees[user_id][date.year]
@@ -0,0 +1,129 @@
+import json
+import os
+import threading
+
+from workout_codecs import read_database, write_database
+from workout_metrics import metrics
+from workout_models import encode_record
+from workout_storage import StorageEngine, apply_mutation
+
+
+class JournalEngine(StorageEngine):
+    """Keeps the database as a snapshot file plus an append-only journal of the mutations made since the snapshot.
+
+    Every batch is appended to the journal as one compact JSON line per mutation, with a single fsync, so the cost of
+    a write only depends on the size of the change. Once the journal grows past compact_bytes it is set aside, a fresh
+    journal is started, and a background thread folds the old journal into a new snapshot.
+
+    The snapshot is written with the codec named by FILE_CODEC, and read with whichever codec it was written with. The
+    journal is always JSON lines, so that a torn last line can be told apart and cut off.
+
+    Files used, next to the snapshot (FILENAME):
+        FILENAME.journal             the journal that is currently being appended to
+        FILENAME.journal.compacting  a journal that is being folded into the snapshot
+    """
+
+    def __init__(self, filename, codec, compact_bytes=1048576):
+        self.filename = filename
+        self.codec = codec
+        self.journal_filename = filename + '.journal'
+        self.compacting_filename = filename + '.journal.compacting'
+        self.compact_bytes = compact_bytes
+        self.lock = threading.Lock()
+        self.journal = None
+        self.compactor = None
+
+    def load(self):
+        with self.lock:
+            # A journal left over from a compaction that didn't finish is folded in before anything else
+            if os.path.isfile(self.compacting_filename):
+                self._compact()
+
+            json_data = _read_snapshot(self.filename)
+            good_bytes = _replay(json_data, self.journal_filename)
+
+            # Cut off a torn last line so that new records don't get appended onto the end of it
+            self.journal = open(self.journal_filename, 'a')
+            self.journal.truncate(good_bytes)
+
+        return json_data
+
+    def prepare(self, json_data, mutations):
+        return ''.join(json.dumps({'op': op, 'path': path, 'value': value}, separators=(',', ':'),
+                                  default=encode_record) + '\n'
+                       for op, path, value in mutations)
+
+    def write(self, batch):
+        with self.lock:
+            self.journal.write(batch)
+            self.journal.flush()
+            os.fsync(self.journal.fileno())
+            metrics.count_bytes('written', len(batch))
+
+            if self.journal.tell() >= self.compact_bytes and self.compactor is None:
+                # Set the full journal aside and start a new one, then fold the old one in on another thread
+                self.journal.close()
+                os.replace(self.journal_filename, self.compacting_filename)
+                self.journal = open(self.journal_filename, 'a')
+                self.compactor = threading.Thread(target=self._compact_in_background, daemon=True)
+                self.compactor.start()
+
+    def close(self):
+        if self.compactor is not None:
+            self.compactor.join()
+        with self.lock:
+            if self.journal is not None:
+                self.journal.close()
+                self.journal = None
+
+    def _compact_in_background(self):
+        """Run a compaction, then let the next full journal start another one."""
+        try:
+            self._compact()
+        finally:
+            self.compactor = None
+
+    def _compact(self):
+        """Fold the journal that was set aside into a new snapshot, then delete it. Only the files are used, never the
+        resident data, so commands carry on while this runs."""
+        json_data = _read_snapshot(self.filename)
+        _replay(json_data, self.compacting_filename)
+
+        write_database(self.filename, self.codec.dumps(json_data))
+        os.remove(self.compacting_filename)
+
+
+def _read_snapshot(filename):
+    """Read a snapshot file, or start an empty database if there isn't one yet.
+
+    :param filename: (str) the path of the snapshot
+    :return: (dict) the database as of the snapshot
+    """
+    if not os.path.isfile(filename):
+        return {'users': {}}
+    return read_database(filename)
+
+
+def _replay(json_data, journal_filename):
+    """Apply every mutation in a journal file to the database. A torn last line from a crash mid-append is ignored.
+
+    :param json_data: (dict) the database to apply the journal to
+    :param journal_filename: (str) the path of the journal
+    :return: (int) how many bytes at the start of the journal hold complete records
+    """
+    good_bytes = 0
+    if not os.path.isfile(journal_filename):
+        return good_bytes
+    with open(journal_filename, 'rb') as file:
+        for line in file:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                break
+            if not line.endswith(b'\n'):
+                break
+            apply_mutation(json_data, record['op'], tuple(record['path']), record['value'])
+            good_bytes += len(line)
+
+    metrics.count_bytes('read', good_bytes)
+    return good_bytes
@@ -0,0 +1,255 @@
+import time
+from bisect import bisect_left, insort
+from datetime import datetime
+
+from workout_stats import SKIPPED, report_completions, week_of
+
+# The rankings kept by the leaderboard: sessions this week, this month and of all time, and current weekly streaks
+RANKINGS = ('week', 'month', 'all_time', 'streak')
+
+
+def month_of(timestamp):
+    """Number the calendar month a time falls in, in local time, so that consecutive months get consecutive numbers.
+
+    :param timestamp: (float) unix time
+    :return: (int) the month number
+    """
+    date = datetime.fromtimestamp(timestamp)
+    return date.year * 12 + date.month - 1
+
+
+class Ranking:
+    """Every user's score in one ranking, along with the users sorted by score, so the top K can be sliced off the
+    front and a user's rank is a bisection. Users with a score of 0 are left out.
+    """
+
+    def __init__(self):
+        # user_id -> score
+        self.scores = {}
+        # (-score, user_id) for every user with a score, sorted, so the highest scores come first
+        self.order = []
+
+    def add(self, user_id, amount):
+        """Change a user's score by an amount.
+
+        :param user_id: (str) the Discord ID of the user
+        :param amount: (int) how much to add, or a negative number to take away
+        """
+        self.set(user_id, self.scores.get(user_id, 0) + amount)
+
+    def set(self, user_id, score):
+        """Set a user's score.
+
+        :param user_id: (str) the Discord ID of the user
+        :param score: (int) the new score
+        """
+        old_score = self.scores.get(user_id, 0)
+        if score == old_score:
+            return
+        if old_score:
+            del self.order[bisect_left(self.order, (-old_score, user_id))]
+        if score:
+            self.scores[user_id] = score
+            insort(self.order, (-score, user_id))
+        else:
+            del self.scores[user_id]
+
+    def top(self, count):
+        """Get the users with the highest scores.
+
+        :param count: (int) how many users to get
+        :return: (list of tuples) (user_id, score), highest first. Ties are broken by user id
+        """
+        return [(user_id, -negative_score) for negative_score, user_id in self.order[:count]]
+
+    def rank(self, user_id):
+        """Get a user's place in the ranking.
+
+        :param user_id: (str) the Discord ID of the user
+        :return: (int) 1 for first place, or None if the user has no score
+        """
+        score = self.scores.get(user_id)
+        if score is None:
+            return None
+        return bisect_left(self.order, (-score, user_id)) + 1
+
+
+class Leaderboard:
+    """Rankings of every user by sessions (reports that weren't skipped) this week, this month and of all time, and by
+    their current streak of weeks in a row with a session, counted the same way as in WorkoutStats.
+
+    The rankings are built from every user at once the first time they're needed, archived reports included, and are
+    then kept up to date by update(), which the backend calls after every change to the resident database. When a new
+    week or month starts, its ranking starts over empty and the streaks that ended with the old week are dropped, so
+    time passing costs nothing until a ranking is read or changed.
+    """
+
+    def __init__(self, archive=None, clock=time.time):
+        # Where older reports are kept, if anywhere
+        self.archive = archive
+        # Returns the current unix time. Tests can pass a fake clock to move between weeks and months
+        self.clock = clock
+        self.rankings = {ranking: Ranking() for ranking in RANKINGS}
+        # The week and month the 'week' and 'month' rankings are counting
+        self.week = None
+        self.month = None
+        # user_id -> {week number: number of sessions}, for every week the user had a session in
+        self.weeks = {}
+        # week number -> set of user_ids whose current streak ends with that week, so streaks can be dropped when the
+        # week after it goes by without a session, and user_id -> that week
+        self.streaks_ending = {}
+        self.streak_end = {}
+        self.built = False
+
+    def build(self, users):
+        """Count every user's sessions from scratch if that hasn't been done yet.
+
+        :param users: (dict) the resident database's users, {user_id: user}
+        """
+        if self.built:
+            return
+        self.rankings = {ranking: Ranking() for ranking in RANKINGS}
+        self.weeks = {}
+        self.streaks_ending = {}
+        self.streak_end = {}
+        self.week = week_of(self.clock())
+        self.month = month_of(self.clock())
+        for user_id, user in users.items():
+            self._count_user(user_id, user)
+        self.built = True
+
+    def recount(self, user_id, user):
+        """Count one user's sessions from scratch, ex: after some of their archived reports were deleted, which
+        update() doesn't hear about.
+
+        :param user_id: (str) the Discord ID of the user
+        :param user: (User) the user's resident data, or None if the user is gone
+        """
+        if not self.built:
+            return
+        for ranking in self.rankings.values():
+            ranking.set(user_id, 0)
+        self.weeks.pop(user_id, None)
+        self._set_streak_end(user_id, None)
+        if user is not None:
+            self._count_user(user_id, user)
+
+    def update(self, op, path, old_value, new_value):
+        """Bring the rankings up to date after a change to the resident database. Nothing is done until the rankings
+        have been built, since they'll be built from the up-to-date data anyway.
+
+        :param op: (str) 'set' or 'delete'
+        :param path: (tuple) the keys leading to the value that changed
+        :param old_value: (any) the value before the change, or None if there wasn't one
+        :param new_value: (any) the value after the change, or None if it was deleted
+        """
+        if not self.built:
+            return
+        if len(path) < 2:
+            self.built = False
+            return
+        self.expire()
+        user_id = path[1]
+
+        # A scheduled report's completion being edited can turn it into a session or out of one
+        if len(path) == 7 and path[4] == 'reports' and path[6] == 'completion':
+            self._count(user_id, path[5], int(new_value != SKIPPED) - int(old_value != SKIPPED))
+            return
+
+        for report_id, workout_id, completion in report_completions(path, old_value):
+            if completion != SKIPPED:
+                self._count(user_id, report_id, -1)
+        for report_id, workout_id, completion in report_completions(path, new_value):
+            if completion != SKIPPED:
+                self._count(user_id, report_id, 1)
+
+    def expire(self):
+        """Start the week and month rankings over if a new week or month has begun since they were last looked at, and
+        end the streaks of users who went a whole week without a session."""
+        now = self.clock()
+        week = week_of(now)
+        month = month_of(now)
+        if month != self.month:
+            self.month = month
+            self.rankings['month'] = Ranking()
+        if week == self.week:
+            return
+        self.week = week
+        self.rankings['week'] = Ranking()
+        # A streak is still current if it ended last week
+        for streak_week in [streak_week for streak_week in self.streaks_ending if streak_week < week - 1]:
+            for user_id in list(self.streaks_ending[streak_week]):
+                self.rankings['streak'].set(user_id, 0)
+                self._set_streak_end(user_id, None)
+
+    def top(self, ranking, count):
+        """Get the users at the top of a ranking.
+
+        :param ranking: (str) one of RANKINGS
+        :param count: (int) how many users to get
+        :return: (list of tuples) (user_id, score), highest first
+        """
+        self.expire()
+        return self.rankings[ranking].top(count)
+
+    def rank(self, ranking, user_id):
+        """Get a user's place and score in a ranking.
+
+        :param ranking: (str) one of RANKINGS
+        :param user_id: (str) the Discord ID of the user
+        :return: (tuple) (place, score), where place is 1 for first place, or None if the user has no score
+        """
+        self.expire()
+        return self.rankings[ranking].rank(user_id), self.rankings[ranking].scores.get(user_id, 0)
+
+    def _count_user(self, user_id, user):
+        """Count all of a user's sessions, resident and archived, into the rankings."""
+        completions = report_completions(('users', user_id), user)
+        if self.archive is not None:
+            completions += self.archive.completions(user_id, user)
+        for report_id, workout_id, completion in completions:
+            if completion != SKIPPED:
+                self._count(user_id, report_id, 1)
+
+    def _count(self, user_id, report_id, amount):
+        """Add or take away one session from the rankings."""
+        if not amount:
+            return
+        report_time = float(report_id)
+        week = week_of(report_time)
+        self.rankings['all_time'].add(user_id, amount)
+        if week == self.week:
+            self.rankings['week'].add(user_id, amount)
+        if month_of(report_time) == self.month:
+            self.rankings['month'].add(user_id, amount)
+
+        weeks = self.weeks.setdefault(user_id, {})
+        weeks[week] = weeks.get(week, 0) + amount
+        if weeks[week] <= 0:
+            del weeks[week]
+
+        # Only a session from the weeks of the current streak, or from next to them, can change it
+        first_week = self.streak_end.get(user_id, self.week) - self.rankings['streak'].scores.get(user_id, 0) + 1
+        if week >= min(first_week, self.week) - 1:
+            self._update_streak(user_id)
+
+    def _update_streak(self, user_id):
+        """Work out a user's current streak by walking back through their weeks from this week or last week."""
+        weeks = self.weeks.get(user_id, {})
+        last_week = self.week if self.week in weeks else self.week - 1
+        streak = 0
+        while last_week - streak in weeks:
+            streak += 1
+        self.rankings['streak'].set(user_id, streak)
+        self._set_streak_end(user_id, last_week if streak else None)
+
+    def _set_streak_end(self, user_id, week):
+        """Record the week a user's current streak ends with, or None if they don't have one."""
+        old_week = self.streak_end.pop(user_id, None)
+        if old_week is not None:
+            self.streaks_ending[old_week].discard(user_id)
+            if not self.streaks_ending[old_week]:
+                del self.streaks_ending[old_week]
+        if week is not None:
+            self.streak_end[user_id] = week
+            self.streaks_ending.setdefault(week, set()).add(user_id)
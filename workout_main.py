@@ -1,5 +1,25 @@
-from workout_backend import (read_json, edit_value, add_user, add_scheduled_workout,
-                             add_unscheduled_workout, add_report, get_all_reports, delete_from_dict)
+import os
+import tempfile
+from datetime import datetime
+
+from workout_backend import (read_json, transaction, edit_value, add_user, add_scheduled_workout,
+                             add_unscheduled_workout, add_report, get_all_reports, get_workout_reports,
+                             get_workout_report_page, delete_from_dict, get_stats, get_adherence,
+                             get_reports_between, get_leaderboard, iter_records, import_records, apply_mutations)
+from workout_adherence import WEEKDAYS, RECENT_WEEKS
+from workout_export import write_records, read_records
+
+# The most scheduled workouts listed by stats_main and adherence_main, so the message fits in one Discord post
+MAX_STATS_WORKOUTS = 10
+# How many reports view_workout_main shows on each page, and the longest message Discord will send
+REPORTS_PER_PAGE = 5
+MESSAGE_LIMIT = 2000
+# How many users are listed from the top of each leaderboard ranking, and the heading of each ranking
+LEADERBOARD_SIZE = 5
+LEADERBOARD_HEADINGS = {'week': 'Sessions this week',
+                        'month': 'Sessions this month',
+                        'all_time': 'Sessions of all time',
+                        'streak': 'Weeks in a row with a session'}
 
 
 def schedule_routine_main(user, workout_name, muscle_group, weights_used, tutorial_url, image_url, workout_day_1,
@@ -27,19 +47,19 @@ def schedule_routine_main(user, workout_name, muscle_group, weights_used, tutori
                     workout_day_4, workout_day_5, workout_day_6, workout_day_7]
     days_scheduled = [day for day in workout_days if day is not None]
 
-    # If the user isn't already in the json, add them
-    json_data = read_json()
-    if str(user_id) not in json_data['users']:
-        add_user(user_id, user.display_name)
-
-    # Add the workout to the json
-    add_scheduled_workout(user_id=user_id,
-                          workout_name=workout_name,
-                          days_scheduled=days_scheduled,
-                          muscle_group=muscle_group,
-                          weights_used=weights_used,
-                          tutorial_url=tutorial_url,
-                          img_url=image_url)
+    with transaction() as json_data:
+        # If the user isn't already in the json, add them
+        if str(user_id) not in json_data['users']:
+            add_user(user_id, user.display_name)
+
+        # Add the workout to the json
+        add_scheduled_workout(user_id=user_id,
+                              workout_name=workout_name,
+                              days_scheduled=days_scheduled,
+                              muscle_group=muscle_group,
+                              weights_used=weights_used,
+                              tutorial_url=tutorial_url,
+                              img_url=image_url)
 
     # Create a sentence about the workout's schedule if one was entered
     sched_msg = ''
@@ -83,12 +103,12 @@ def report_scheduled_main(user, workout_id, completion, comment):
     :return: (str) a confirmation message to be sent back to Discord
     """
     user_id = int(user.id)
-    # Add the report to the json database
-    add_report(user_id, completion, comment=comment, workout_id=workout_id)
+    with transaction() as json_data:
+        # Add the report to the json database
+        add_report(user_id, completion, comment=comment, workout_id=workout_id)
 
-    # Get the workout's name
-    json_data = read_json()
-    workout_name = json_data['users'][str(user_id)]['scheduled_workout'][workout_id]['workout_name']
+        # Get the workout's name
+        workout_name = json_data['users'][str(user_id)].scheduled_workout[workout_id].workout_name
 
     # Create the message to be sent back to Discord
     message = (f"Your report for this scheduled workout, {workout_name}, has been logged:\n"
@@ -112,13 +132,14 @@ def report_unscheduled_main(user, workout_name, muscle_group, weights_used, tuto
     """
     user_id = int(user.id)
 
-    # If the user isn't already in the json, add them
-    json_data = read_json()
-    if str(user_id) not in json_data['users']:
-        add_user(user_id, user.display_name)
+    with transaction() as json_data:
+        # If the user isn't already in the json, add them
+        if str(user_id) not in json_data['users']:
+            add_user(user_id, user.display_name)
 
-    # Add the report to the json database
-    add_unscheduled_workout(user_id, workout_name, muscle_group, weights_used, tutorial_url, image_url, comment=comment)
+        # Add the report to the json database
+        add_unscheduled_workout(user_id, workout_name, muscle_group, weights_used, tutorial_url, image_url,
+                                comment=comment)
 
     message = (f"Your report for this unscheduled workout has been logged:\n"
                f"Workout name: {workout_name}\n"
@@ -161,17 +182,16 @@ def edit_workout_main(user, workout_id, field, new_value,
     if field == 'workout_name' and len(new_value) > 79:
         raise ValueError("Your new workout name is too long. The maximum length is 79 characters.")
 
-    # Make the requested change
-    if new_value:
-        edit_value(user_id, field, new_value, scheduled_or_unscheduled='scheduled_workout', workout_unixid=workout_id)
-
-    # Change the schedule, too, if requested
-    if len(days_scheduled) > 0:
-        edit_value(user_id, 'days_scheduled', days_scheduled, 'scheduled_workout', workout_unixid=workout_id)
+    # Make the requested change, and the schedule change too, if requested, as one. Either both are made or neither
+    with transaction() as json_data:
+        if new_value:
+            edit_value(user_id, field, new_value, scheduled_or_unscheduled='scheduled_workout',
+                       workout_unixid=workout_id)
+        if len(days_scheduled) > 0:
+            edit_value(user_id, 'days_scheduled', days_scheduled, 'scheduled_workout', workout_unixid=workout_id)
+        workout_name = json_data['users'][str(user_id)].scheduled_workout[workout_id].workout_name
 
     # Create a sentence about the workout's new schedule if it was changed
-    json_data = read_json()
-    workout_name = json_data['users'][str(user_id)]['scheduled_workout'][workout_id]['workout_name']
     sched_msg = ''
     if len(days_scheduled) > 0:
         if len(days_scheduled) > 1:
@@ -211,20 +231,20 @@ def edit_report_main(user, report_id, field, new_value):
         raise ValueError("Completion can only be one of 'complete', 'partially complete', or 'skipped'.")
 
     # Figure out if it's scheduled or unscheduled, then edit the value
-    all_reports = get_all_reports(user_id)
-    full_report = all_reports[report_id]
-    if 'completion' in full_report:
-        workout_id = full_report['workout_id']
-        edit_value(user_id, field, new_value, 'scheduled_workout',
-                   workout_unixid=workout_id, report_unixid=report_id)
-        scheduled_or_unscheduled = 'scheduled'
-    else:
-        edit_value(user_id, field, new_value, 'unscheduled_workout', report_unixid=report_id)
-        scheduled_or_unscheduled = 'unscheduled'
+    with transaction():
+        full_report = get_all_reports(user_id)[report_id]
+        workout_name = full_report['workout_name']
+        if 'completion' in full_report:
+            workout_id = full_report['workout_id']
+            edit_value(user_id, field, new_value, 'scheduled_workout',
+                       workout_unixid=workout_id, report_unixid=report_id)
+            scheduled_or_unscheduled = 'scheduled'
+        else:
+            edit_value(user_id, field, new_value, 'unscheduled_workout', report_unixid=report_id)
+            scheduled_or_unscheduled = 'unscheduled'
 
     # Gather the information necessary to make the message we'll send back to Discord, then make the message
     timestamp = f'<t:{int(float(report_id))}:f>'
-    workout_name = full_report['workout_name']
     message = (f"The report for the {scheduled_or_unscheduled} workout {workout_name} made at {timestamp} has been "
                f"edited. The value for {field} has been changed to {new_value}")
 
@@ -252,7 +272,7 @@ def view_report_main(user, report_id):
 
     image_str = ''
     if scheduled_or_unscheduled == 'scheduled':
-        image = read_json()['users'][str(user.id)]['scheduled_workout'][report['workout_id']]['img_url']
+        image = read_json()['users'][str(user.id)].scheduled_workout[report['workout_id']].img_url
         if image:
             image_str = image
 
@@ -267,19 +287,29 @@ def view_report_main(user, report_id):
     return message
 
 
-def view_workout_main(user, workout_id):
-    """Given a specific report, gathers all the information about that report and returns it to Discord.
+def view_workout_main(user, workout_id, page=0, newest_first=True):
+    """Given a specific workout, gathers all the information about that workout and one page of its reports, and
+    returns it to Discord. Only the reports on the page are looked up and formatted.
 
     :param user: (object) a Discord object containing information about the person who used the slash command
     :param workout_id: (str) the id (also the unix time of creation) of the workout to be viewed
-    :return: (str) a message to be returned to Discord containing info about the specified workout and its reports
+    :param page: (int) which page of reports to show, counting from 0. Pages past the last show the last page
+    :param newest_first: (bool) whether the reports run from newest to oldest, or oldest to newest
+    :return: (tuple) a message to be returned to Discord containing info about the specified workout and a page of its
+             reports, the page that was shown, and how many pages there are
     """
-    # Get the workout and extract its reports and days scheduled
-    workout = read_json()['users'][str(user.id)]['scheduled_workout'][workout_id]
-    reports = workout['reports']
+    # Get a copy of the workout (the original is resident data)
+    workout = dict(read_json()['users'][str(user.id)].scheduled_workout[workout_id])
     del workout['reports']
     days_scheduled = workout['days_scheduled']
 
+    # Get just the reports on the page. If reports were deleted since the page was picked, show the last page instead
+    page_reports, num_reports = get_workout_report_page(user.id, workout_id, page, REPORTS_PER_PAGE, newest_first)
+    num_pages = max(-(-num_reports // REPORTS_PER_PAGE), 1)
+    if not 0 <= page < num_pages:
+        page = min(max(page, 0), num_pages - 1)
+        page_reports, num_reports = get_workout_report_page(user.id, workout_id, page, REPORTS_PER_PAGE, newest_first)
+
     # Create a sentence about the workout's schedule if one was entered
     if len(days_scheduled) > 0:
         if len(days_scheduled) > 1:
@@ -295,22 +325,44 @@ def view_workout_main(user, workout_id):
     workout['days_scheduled'] = workout_schedule_string
     workout_data = [f"{field}: {value}" for field, value in workout.items()]
 
-    # Compile the reports into strings, too
-    reports_list = [f"<t:{int(float(report))}:f>:\n"
-                    + '\n'.join([f"{field}: {value}" for field, value in reports[report].items()])
-                    for report in reports]
+    # Compile the reports on this page into strings, too
+    reports_list = [f"<t:{int(float(report_id))}:f>:\n"
+                    + '\n'.join([f"{field}: {value}" for field, value in report.items()])
+                    for report_id, report in page_reports]
 
     # Generate info needed to finish the message:
     workout_name = workout['workout_name']
     user_nick = user.display_name
     timestamp = f"<t:{int(float(workout_id))}:f>"
-    num_reports = len(reports)
+    order = 'newest first' if newest_first else 'oldest first'
 
-    message = ((f"Here is everything there is to know about the workout routine "
+    header = ((f"Here is everything there is to know about the workout routine "
                f"'{workout_name}' which was designed by {user_nick} on {timestamp}:\n") + '\n'.join(workout_data)
-               + f"\n\n**{num_reports}** Reports:\n" + '\n\n'.join(reports_list))
+              + f"\n\n**{num_reports}** Reports")
+    if num_reports:
+        header += f" (page {page + 1} of {num_pages}, {order}):\n"
+    else:
+        header += ":\n"
 
-    return message
+    # Share what room is left between the reports, so a page with long comments still fits in one message
+    if reports_list:
+        room = (MESSAGE_LIMIT - len(header)) // len(reports_list) - 2
+        reports_list = [_shorten(report_string, room) for report_string in reports_list]
+    message = _shorten(header + '\n\n'.join(reports_list), MESSAGE_LIMIT)
+
+    return message, page, num_pages
+
+
+def _shorten(text, length):
+    """Cut a string down to a length, marking where it was cut.
+
+    :param text: (str) the string
+    :param length: (int) the longest the string may be
+    :return: (str) the string, or as much of it as fits followed by an ellipsis
+    """
+    if len(text) <= length:
+        return text
+    return text[:max(length - 1, 0)] + '…'
 
 
 def delete_report_main(user, report_id):
@@ -321,26 +373,27 @@ def delete_report_main(user, report_id):
     :return: (str) a confirmation message to be sent to Discord
     """
     user_id = str(user.id)
-    # Get the report info so we can decide what to delete and how
-    report = get_all_reports(str(user.id))[report_id]
-
-    # Generate info:
-    workout_name = report['workout_name']
-    workout_id = report['workout_id']
-    if 'completion' in report:
-        scheduled_or_unscheduled = 'scheduled'
-    else:
-        scheduled_or_unscheduled = 'unscheduled'
-    user_nick = user.display_name
-    timestamp = f"<t:{int(float(report_id))}:f>"
-
-    if scheduled_or_unscheduled == 'unscheduled':
-        delete_from_dict(user_id, report_unixid=report_id)
-    elif scheduled_or_unscheduled == 'scheduled':
-        delete_from_dict(user_id, workout_unixid=workout_id, report_unixid=report_id)
-    else:
-        raise ValueError("Something went wrong. Make sure 'scheduled_or_unscheduled is either 'scheduled' or "
-                         "'unscheduled'.")
+    with transaction():
+        # Get the report info so we can decide what to delete and how
+        report = get_all_reports(str(user.id))[report_id]
+
+        # Generate info (only scheduled reports belong to a workout):
+        workout_name = report['workout_name']
+        workout_id = report.get('workout_id')
+        if 'completion' in report:
+            scheduled_or_unscheduled = 'scheduled'
+        else:
+            scheduled_or_unscheduled = 'unscheduled'
+        user_nick = user.display_name
+        timestamp = f"<t:{int(float(report_id))}:f>"
+
+        if scheduled_or_unscheduled == 'unscheduled':
+            delete_from_dict(user_id, report_unixid=report_id)
+        elif scheduled_or_unscheduled == 'scheduled':
+            delete_from_dict(user_id, workout_unixid=workout_id, report_unixid=report_id)
+        else:
+            raise ValueError("Something went wrong. Make sure 'scheduled_or_unscheduled is either 'scheduled' or "
+                             "'unscheduled'.")
 
     message = (f"The report for the {scheduled_or_unscheduled} workout session "
                f"'{workout_name}', which was done by {user_nick} on {timestamp}, has been successfully deleted.")
@@ -359,32 +412,232 @@ def delete_workout_main(user, workout_id, save):
     :return: (str) a confirmation message to be sent to Discord
     """
     user_id = str(user.id)
-    # Get the workout and all its data
-    workout = read_json()['users'][str(user.id)]['scheduled_workout'][workout_id]
-    reports = workout['reports']
-
-    # Generate info
-    workout_name = workout['workout_name']
-    user_nick = user.display_name
-    timestamp = f"<t:{int(float(workout_id))}:f>"
-
-    if save == 'True':
-        # Collect all the reports from the workout and save them as unscheduled workouts
-        for report_id in reports:
-            add_unscheduled_workout(user_id,
-                                    workout_name,
-                                    muscle_group=reports[report_id]['muscle_group'],
-                                    weights_used=reports[report_id]['weights_used'],
-                                    tutorial_url=reports[report_id]['tutorial_url'],
-                                    img_url=reports[report_id]['img_url'],
-                                    preset_report_id=report_id)
-
-    # Delete the workout from the json file
-    delete_from_dict(user_id, workout_unixid=workout_id)
+    with transaction() as json_data:
+        # Get the workout and all its data, archived reports included
+        workout = json_data['users'][user_id].scheduled_workout[workout_id]
+        reports = get_workout_reports(user_id, workout_id) if save == 'True' else []
+
+        # Generate info
+        workout_name = workout.workout_name
+        user_nick = user.display_name
+        timestamp = f"<t:{int(float(workout_id))}:f>"
+
+        # Delete the workout, then save its reports as unscheduled workouts under their old ids, all in one go. The
+        # delete comes first so that no report id is in the database twice at once. The reports only hold how the
+        # session went, so the rest of each unscheduled workout comes from the scheduled workout itself
+        operations = [('delete_from_dict', {'user_id': user_id, 'workout_unixid': workout_id})]
+        operations += [('add_unscheduled_workout', {'user_id': user_id,
+                                                    'workout_name': workout_name,
+                                                    'muscle_group': workout.muscle_group,
+                                                    'weights_used': workout.weights_used,
+                                                    'tutorial_url': workout.tutorial_url,
+                                                    'img_url': workout.img_url,
+                                                    'preset_report_id': report_id,
+                                                    'comment': report.get('comment')})
+                       for report_id, report in reports]
+        apply_mutations(operations)
 
     message = (f"The workout routine called '{workout_name}', which was designed by {user_nick} on {timestamp}, "
                f"has been successfully deleted.\n")
-    if save:
+    if save == 'True':
         message += "The workout reports have been saved as unscheduled reports."
 
     return message
+
+
+def stats_main(user):
+    """Sums up the user's workout history: their sessions, streak, weekly volume, time since their last session and
+    how often they complete each scheduled workout.
+
+    :param user: (object) a Discord object containing information about the person who used the slash command
+    :return: (str) a message to be returned to Discord containing the user's statistics
+    """
+    user_id = str(user.id)
+    user_nick = user.display_name
+    json_data = read_json()
+    if user_id not in json_data['users']:
+        return f"{user_nick} hasn't reported any workouts yet, so there are no stats to show."
+    workouts = json_data['users'][user_id].scheduled_workout
+    stats = get_stats(user_id)
+
+    # Sum up the sessions and streaks
+    if stats['last_session'] is None:
+        last_session = 'never'
+    else:
+        last_session = f"<t:{int(stats['last_session'])}:R>"
+    summary = [f"Sessions: **{stats['sessions']}** ({stats['unscheduled']} unscheduled), the last one {last_session}",
+               f"Weeks in a row with a session: **{stats['current_streak']}** "
+               f"(longest streak: {stats['longest_streak']})"]
+
+    # Chart the sessions in each of the last few weeks
+    volume_list = [f"`{week_start.strftime('%b %d')}` {'▇' * count} {count}"
+                   for week_start, count in stats['weekly_volume']]
+
+    # List the completion rates of the most reported workouts
+    completions = sorted(stats['completions'].items(), key=lambda item: sum(item[1].values()), reverse=True)
+    completion_list = []
+    for workout_id, counts in completions[:MAX_STATS_WORKOUTS]:
+        num_reports = sum(counts.values())
+        rates = ', '.join(f"{count / num_reports:.0%} {completion}" for completion, count
+                          in sorted(counts.items(), key=lambda item: item[1], reverse=True))
+        completion_list.append(f"{workouts[workout_id].workout_name}: {num_reports} reports, {rates}")
+    if len(completions) > MAX_STATS_WORKOUTS:
+        completion_list.append(f"...and {len(completions) - MAX_STATS_WORKOUTS} more workouts")
+    if not completion_list:
+        completion_list.append("No scheduled workouts have been reported yet.")
+
+    message = (f"Here are {user_nick}'s workout stats:\n" + '\n'.join(summary)
+               + "\n\n**Sessions per week:**\n" + '\n'.join(volume_list)
+               + "\n\n**Completion rates:**\n" + '\n'.join(completion_list))
+
+    return message
+
+
+def adherence_main(user):
+    """Compares each of the user's scheduled workouts' schedule with when they actually did it: how many of the
+    scheduled days they worked out on, how many sessions a week they do, how many are on other days, which weekdays
+    they tend to miss and whether they're getting better or worse at sticking to the schedule.
+
+    :param user: (object) a Discord object containing information about the person who used the slash command
+    :return: (str) a message to be returned to Discord containing the user's adherence to their schedules
+    """
+    user_id = str(user.id)
+    user_nick = user.display_name
+    if user_id not in read_json()['users']:
+        return f"{user_nick} hasn't scheduled any workouts yet, so there is no schedule to compare with."
+    adherence = get_adherence(user_id)
+    workouts = read_json()['users'][user_id].scheduled_workout
+    if not adherence['workouts']:
+        return f"{user_nick} hasn't scheduled any workouts yet, so there is no schedule to compare with."
+
+    # Describe each workout
+    workout_list = []
+    for figures in adherence['workouts'][:MAX_STATS_WORKOUTS]:
+        days_scheduled = ', '.join(workouts[figures['workout_id']].days_scheduled) or 'no days'
+        description = (f"**{figures['workout_name']}** ({days_scheduled}): {figures['actual_per_week']:.1f} a week "
+                       f"({figures['recent_per_week']:.1f} lately, {figures['expected_per_week']} scheduled)")
+        if figures['hit_rate'] is not None:
+            description += f", {figures['hit_rate']:.0%} of scheduled days done"
+        if figures['off_schedule'] is not None:
+            description += f", {figures['off_schedule']:.0%} off schedule"
+        if figures['drift'] is not None:
+            description += f", trend {figures['drift'] * 100:+.1f} points per {RECENT_WEEKS} weeks"
+        workout_list.append(description)
+    if len(adherence['workouts']) > MAX_STATS_WORKOUTS:
+        workout_list.append(f"...and {len(adherence['workouts']) - MAX_STATS_WORKOUTS} more workouts")
+
+    # List how often each weekday's sessions get done
+    weekday_list = [f"{weekday}: {hit_rate:.0%}" for weekday, hit_rate in zip(WEEKDAYS, adherence['weekday_hit_rates'])
+                    if hit_rate is not None]
+
+    message = (f"Here is how closely {user_nick} has kept to their workout schedules:\n" + '\n'.join(workout_list)
+               + "\n\n**Scheduled days done, by weekday:**\n" + ', '.join(weekday_list or ['Nothing scheduled']))
+
+    return message
+
+
+def leaderboard_main(user):
+    """Ranks everybody who uses the bot by their sessions this week, this month and of all time, and by their current
+    streak, and shows where the user who asked stands in each.
+
+    :param user: (object) a Discord object containing information about the person who used the slash command
+    :return: (str) a message to be returned to Discord containing the leaderboard
+    """
+    leaderboard = get_leaderboard(user.id, LEADERBOARD_SIZE)
+
+    rankings_list = []
+    for ranking, heading in LEADERBOARD_HEADINGS.items():
+        standings = leaderboard[ranking]
+        lines = [f"{place}. {username}: {score}"
+                 for place, (user_id, username, score) in enumerate(standings['top'], start=1)]
+        if not lines:
+            lines.append("Nobody yet!")
+        if standings['place'] is not None and standings['place'] > LEADERBOARD_SIZE:
+            lines.append(f"...\n{standings['place']}. {user.display_name} (you): {standings['score']}")
+        rankings_list.append(f"**{heading}:**\n" + '\n'.join(lines))
+
+    message = "Here is the leaderboard:\n\n" + '\n\n'.join(rankings_list)
+
+    return message
+
+
+def export_main(user, file_format):
+    """Writes the user's whole workout history to a temporary file, one record at a time, so it can be sent to them as
+    an attachment.
+
+    :param user: (object) a Discord object containing information about the person who used the slash command
+    :param file_format: (str) 'ndjson' or 'csv'
+    :return: (tuple) a message to be sent to Discord along with the file, and the path of the file. The caller
+             deletes the file once it has been sent
+    """
+    user_id = str(user.id)
+    if user_id not in read_json()['users']:
+        raise ValueError("You don't have any workouts or reports to export yet.")
+
+    # The file is written as the records come, instead of being built up in memory first
+    file_descriptor, filename = tempfile.mkstemp(prefix='workout_export_', suffix=f".{file_format}")
+    try:
+        with os.fdopen(file_descriptor, 'wb') as file:
+            num_records = write_records(iter_records(user_id), file, file_format)
+    except Exception:
+        os.remove(filename)
+        raise
+
+    message = f"Here is {user.display_name}'s workout history: {num_records} workouts and reports."
+
+    return message, filename
+
+
+def import_main(user, filename, file_format):
+    """Adds workouts and reports from an export file to a user's history. Records with the same id as existing ones
+    replace them.
+
+    :param user: (object) a Discord object for the person whose history the records are added to
+    :param filename: (str) the path of the export file
+    :param file_format: (str) 'ndjson' or 'csv'
+    :return: (str) a message to be sent to Discord reporting how the import went
+    """
+    user_id = str(user.id)
+
+    # If the user isn't already in the json, add them
+    with transaction() as json_data:
+        if user_id not in json_data['users']:
+            add_user(user_id, user.display_name)
+
+    # Each batch of records is a transaction of its own, so a big file doesn't lock the database the whole time
+    with open(filename, 'rb') as file:
+        imported, skipped = import_records(user_id, read_records(file, file_format))
+
+    message = f"{imported} workouts and reports have been imported into {user.display_name}'s history."
+    if skipped:
+        message += f" {skipped} reports were skipped, because the workout they belong to doesn't exist."
+
+    return message
+
+
+def reminder_main(user_id, workout_id):
+    """Writes the reminder that a scheduled workout is due today, unless it has already been reported today.
+
+    :param user_id: (str) the Discord ID of the user the reminder is for
+    :param workout_id: (str) the id (also the unix time of creation) of the workout that is due
+    :return: (str) a message to be sent to the user, or None if there is nothing to remind them of
+    """
+    user = read_json()['users'].get(str(user_id))
+    if user is None or workout_id not in user.scheduled_workout:
+        return None
+    workout = user.scheduled_workout[workout_id]
+
+    # Don't nag about a workout that has already been done (or skipped) today
+    start_of_today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0).timestamp()
+    todays_reports = get_reports_between(user_id, start_of_today)
+    if any(report.get('workout_id') == workout_id for report_id, report in todays_reports):
+        return None
+
+    message = f"Reminder: today is a day for your workout routine '{workout.workout_name}'."
+    if workout.muscle_group:
+        message += f" It works your {workout.muscle_group}."
+    if workout.tutorial_url:
+        message += f"\nTutorial: {workout.tutorial_url}"
+    message += "\nUse `/workout report_scheduled` once you're done."
+
+    return message
@@ -0,0 +1,292 @@
+import inspect
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from decouple import config
+
+# Upper bounds of the latency histogram buckets, in seconds. 3 is Discord's deadline for answering an interaction
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 3.0, 5.0, 10.0)
+AUTOCOMPLETE_DEADLINE_SECONDS = 3.0
+
+
+class Histogram:
+    """Counts how many observations fell into each latency bucket, along with their sum and the largest one."""
+
+    def __init__(self):
+        self.bucket_counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        """Add one observation.
+
+        :param seconds: (float) how long the call took
+        """
+        self.bucket_counts[bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+
+    def quantile(self, fraction):
+        """Estimate a quantile as the upper bound of the bucket it falls in.
+
+        :param fraction: (float) the quantile, ex: 0.99
+        :return: (float) the estimate in seconds, or the largest observation if it falls past the last bucket
+        """
+        rank = fraction * self.count
+        cumulative = 0
+        for bound, bucket_count in zip(BUCKETS, self.bucket_counts):
+            cumulative += bucket_count
+            if cumulative >= rank:
+                return min(bound, self.max)
+        return self.max
+
+
+class Metrics:
+    """Latency histograms for every instrumented function, bytes moved by the storage engines, and how often
+    autocomplete callbacks come close to or miss Discord's deadline.
+
+    Latencies are kept by kind and name, ex: ('command', 'view_report') or ('backend', 'add_report'). The kinds used are
+    'command' and 'autocomplete' for the handlers in workout_ui.py, 'backend' for the functions in workout_backend.py
+    and 'storage' for loading, serializing ('prepare') and writing the database.
+    """
+
+    def __init__(self, near_miss_seconds):
+        self.near_miss_seconds = near_miss_seconds
+        self.lock = threading.Lock()
+        # (kind, name) -> Histogram
+        self.latencies = {}
+        # 'read' or 'written' -> number of bytes
+        self.storage_bytes = {'read': 0, 'written': 0}
+        # (autocomplete name, 'near_miss' or 'miss') -> count
+        self.deadline_counts = {}
+        # (prefix, function) pairs. Each function returns a dict of numbers that are exported as gauges
+        self.gauge_sources = []
+
+    def observe(self, kind, name, seconds):
+        """Record how long a call took.
+
+        :param kind: (str) 'command', 'autocomplete', 'backend' or 'storage'
+        :param name: (str) the name of the function
+        :param seconds: (float) how long the call took
+        """
+        with self.lock:
+            histogram = self.latencies.get((kind, name))
+            if histogram is None:
+                histogram = self.latencies[(kind, name)] = Histogram()
+            histogram.observe(seconds)
+
+            if kind == 'autocomplete' and seconds >= self.near_miss_seconds:
+                outcome = 'miss' if seconds >= AUTOCOMPLETE_DEADLINE_SECONDS else 'near_miss'
+                self.deadline_counts[(name, outcome)] = self.deadline_counts.get((name, outcome), 0) + 1
+
+    @contextmanager
+    def timer(self, kind, name):
+        """Time the body of a with statement.
+
+        :param kind: (str) 'command', 'autocomplete', 'backend' or 'storage'
+        :param name: (str) what is being timed
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(kind, name, time.perf_counter() - started)
+
+    def count_bytes(self, direction, num_bytes):
+        """Record bytes read from or written to storage.
+
+        :param direction: (str) 'read' or 'written'
+        :param num_bytes: (int) how many bytes
+        """
+        with self.lock:
+            self.storage_bytes[direction] += num_bytes
+
+    def add_gauges(self, prefix, source):
+        """Export the numbers returned by a function as gauges, ex: the quickfetch cache's stats().
+
+        :param prefix: (str) the start of the name of every gauge, ex: 'workout_quickfetch_cache'
+        :param source: (function) returns a dict of {name: number}
+        """
+        self.gauge_sources.append((prefix, source))
+
+    def render_prometheus(self):
+        """Render everything in the Prometheus text exposition format.
+
+        :return: (str) the metrics, ready to be served or written to a textfile collector's directory
+        """
+        lines = ['# HELP workout_latency_seconds Time spent in instrumented functions.',
+                 '# TYPE workout_latency_seconds histogram']
+        with self.lock:
+            for (kind, name), histogram in sorted(self.latencies.items()):
+                labels = f'kind="{kind}",name="{name}"'
+                cumulative = 0
+                for bound, bucket_count in zip(BUCKETS, histogram.bucket_counts):
+                    cumulative += bucket_count
+                    lines.append(f'workout_latency_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f'workout_latency_seconds_bucket{{{labels},le="+Inf"}} {histogram.count}')
+                lines.append(f'workout_latency_seconds_sum{{{labels}}} {histogram.sum}')
+                lines.append(f'workout_latency_seconds_count{{{labels}}} {histogram.count}')
+
+            lines += ['# HELP workout_storage_bytes_total Bytes read from and written to storage.',
+                      '# TYPE workout_storage_bytes_total counter']
+            for direction, num_bytes in self.storage_bytes.items():
+                lines.append(f'workout_storage_bytes_total{{direction="{direction}"}} {num_bytes}')
+
+            lines += ['# HELP workout_autocomplete_deadline_total Autocomplete callbacks that came close to or missed '
+                      'the 3 second deadline.',
+                      '# TYPE workout_autocomplete_deadline_total counter']
+            for (name, outcome), count in sorted(self.deadline_counts.items()):
+                lines.append(f'workout_autocomplete_deadline_total{{name="{name}",outcome="{outcome}"}} {count}')
+
+        for prefix, source in self.gauge_sources:
+            for gauge_name, value in source().items():
+                lines.append(f'# TYPE {prefix}_{gauge_name} gauge')
+                lines.append(f'{prefix}_{gauge_name} {value}')
+
+        return '\n'.join(lines) + '\n'
+
+    def summary(self, max_length=1900):
+        """Summarize the metrics for a Discord message, slowest functions first.
+
+        :param max_length: (int) the summary is cut short before it gets longer than this
+        :return: (str) the summary
+        """
+        with self.lock:
+            rows = sorted(self.latencies.items(), key=lambda item: item[1].quantile(0.99), reverse=True)
+            lines = [f"Storage: {self.storage_bytes['read']} bytes read, {self.storage_bytes['written']} written",
+                     f"Autocomplete near misses: {self._deadline_total('near_miss')}, "
+                     f"misses: {self._deadline_total('miss')}",
+                     '',
+                     f"{'function':<40}{'calls':>7}{'mean ms':>9}{'p99 ms':>9}{'max ms':>9}"]
+            for (kind, name), histogram in rows:
+                lines.append(f"{kind + ':' + name:<40.40}{histogram.count:>7}"
+                             f"{histogram.sum / histogram.count * 1000:>9.1f}"
+                             f"{histogram.quantile(0.99) * 1000:>9.1f}{histogram.max * 1000:>9.1f}")
+
+        summary = ''
+        for line in lines:
+            if len(summary) + len(line) + 1 > max_length:
+                break
+            summary += line + '\n'
+        return summary
+
+    def _deadline_total(self, outcome):
+        """Add up the deadline counts of every autocomplete callback for one outcome."""
+        return sum(count for (name, counted_outcome), count in self.deadline_counts.items()
+                   if counted_outcome == outcome)
+
+
+metrics = Metrics(config("AUTOCOMPLETE_NEAR_MISS_SECONDS", default=2.0, cast=float))
+
+
+def instrumented(kind):
+    """Decorator that records the latency of every call to a function or coroutine function in metrics, under the
+    function's name.
+
+    :param kind: (str) 'command', 'autocomplete', 'backend' or 'storage'
+    :return: (function) the decorator
+    """
+    def decorator(function):
+        if inspect.iscoroutinefunction(function):
+            @wraps(function)
+            async def timed(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return await function(*args, **kwargs)
+                finally:
+                    metrics.observe(kind, function.__name__, time.perf_counter() - started)
+        else:
+            @wraps(function)
+            def timed(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    metrics.observe(kind, function.__name__, time.perf_counter() - started)
+
+        return timed
+
+    return decorator
+
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+    """Serves the metrics at /metrics."""
+
+    def do_GET(self):
+        if self.path != '/metrics':
+            self.send_error(404)
+            return
+        body = metrics.render_prometheus().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Scrapes would otherwise fill the console
+        pass
+
+
+def write_metrics_file(filename):
+    """Write the metrics to a file in the Prometheus text format, swapping it in so a scrape never sees half of it.
+
+    :param filename: (str) the path of the file
+    """
+    temp_filename = filename + '.tmp'
+    with open(temp_filename, 'w') as file:
+        file.write(metrics.render_prometheus())
+    os.replace(temp_filename, filename)
+
+
+# The exporters started by start_exporters(), so that starting them again (ex: when the bot reconnects and on_ready
+# runs again) doesn't bind the port twice or start a second file writer
+_exporters_lock = threading.Lock()
+_metrics_server = None
+_metrics_file_writer = None
+
+
+def start_exporters():
+    """Start whichever exporters are configured: an HTTP endpoint on METRICS_PORT, and a file at METRICS_FILE that is
+    rewritten every METRICS_INTERVAL seconds. Both are off unless their key is set. Exporters that are already running
+    are left as they are.
+
+    :return: (ThreadingHTTPServer) the HTTP server, or None if it isn't configured
+    """
+    global _metrics_server, _metrics_file_writer
+    with _exporters_lock:
+        port = config("METRICS_PORT", default=0, cast=int)
+        if port and _metrics_server is None:
+            _metrics_server = ThreadingHTTPServer((config("METRICS_HOST", default='127.0.0.1'), port),
+                                                  _MetricsRequestHandler)
+            threading.Thread(target=_metrics_server.serve_forever, name='workout-metrics-http', daemon=True).start()
+
+        filename = config("METRICS_FILE", default='')
+        if filename and _metrics_file_writer is None:
+            _metrics_file_writer = _start_file_writer(filename)
+
+        return _metrics_server
+
+
+def _start_file_writer(filename):
+    """Start the thread that rewrites the metrics file every METRICS_INTERVAL seconds.
+
+    :param filename: (str) the path of the file
+    :return: (Thread) the thread
+    """
+    interval = config("METRICS_INTERVAL", default=60.0, cast=float)
+
+    def write_periodically():
+        while True:
+            write_metrics_file(filename)
+            time.sleep(interval)
+
+    writer = threading.Thread(target=write_periodically, name='workout-metrics-file', daemon=True)
+    writer.start()
+    return writer
@@ -0,0 +1,203 @@
+from collections.abc import Mapping, MutableMapping
+
+
+class Record(MutableMapping):
+    """Base class for the records kept in the resident database. Every known field lives in a slot, so a record costs
+    a fraction of the memory of a dict with the same keys, and code that knows what it's holding can use plain
+    attribute access, ex: workout.workout_name.
+
+    Records also behave like the dicts they replace, so code that walks the database by key keeps working: known
+    fields are read and written through their slots, and any other key goes into the extra dict. A field that was
+    never set (or was deleted) is missing, just like a missing key, so a record encodes back to exactly the dict it was
+    decoded from.
+    """
+    __slots__ = ('extra',)
+    # The known fields, in the order they are laid out in on disk
+    FIELDS = ()
+
+    def __init__(self, **fields):
+        self.extra = None
+        for field, value in fields.items():
+            self[field] = value
+
+    def __getitem__(self, key):
+        if key in self.FIELDS:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        if self.extra is None:
+            raise KeyError(key)
+        return self.extra[key]
+
+    def __setitem__(self, key, value):
+        if key in self.FIELDS:
+            setattr(self, key, value)
+        else:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+
+    def __delitem__(self, key):
+        if key in self.FIELDS:
+            try:
+                delattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        else:
+            if self.extra is None:
+                raise KeyError(key)
+            del self.extra[key]
+
+    def __iter__(self):
+        for field in self.FIELDS:
+            if hasattr(self, field):
+                yield field
+        if self.extra:
+            yield from self.extra
+
+    def __len__(self):
+        return sum(1 for field in self.FIELDS if hasattr(self, field)) + len(self.extra or ())
+
+    def __contains__(self, key):
+        if key in self.FIELDS:
+            return hasattr(self, key)
+        return self.extra is not None and key in self.extra
+
+    def __repr__(self):
+        return f"{type(self).__name__}({dict(self.items())!r})"
+
+    @classmethod
+    def from_dict(cls, data):
+        """Decode a record from the dict it is stored as.
+
+        :param data: (dict) the record as it is stored on disk
+        :return: (Record) the record
+        """
+        return cls(**data)
+
+    def to_dict(self):
+        """Encode the record as the dict it is stored as, including the records inside it.
+
+        :return: (dict) the record as it is stored on disk
+        """
+        return {field: encode_value(value) for field, value in self.items()}
+
+
+class Report(Record):
+    """A report on one session of a scheduled workout."""
+    __slots__ = ('completion', 'comment')
+    FIELDS = ('completion', 'comment')
+
+
+class UnscheduledWorkout(Record):
+    """A workout that was done without being scheduled, which is its own report."""
+    __slots__ = ('workout_name', 'muscle_group', 'weights_used', 'tutorial_url', 'img_url', 'comment')
+    FIELDS = ('workout_name', 'muscle_group', 'weights_used', 'tutorial_url', 'img_url', 'comment')
+
+
+class ScheduledWorkout(Record):
+    """A workout routine with a weekly schedule, along with the reports on its sessions, keyed by report id."""
+    __slots__ = ('workout_name', 'days_scheduled', 'muscle_group', 'weights_used', 'tutorial_url', 'img_url',
+                 'reports')
+    FIELDS = ('workout_name', 'days_scheduled', 'muscle_group', 'weights_used', 'tutorial_url', 'img_url', 'reports')
+
+    @classmethod
+    def from_dict(cls, data):
+        workout = cls(**data)
+        if 'reports' in workout:
+            workout.reports = {report_id: Report.from_dict(report) for report_id, report in workout.reports.items()}
+        return workout
+
+
+class User(Record):
+    """Everything kept about one user: their name, their scheduled workouts and their unscheduled workouts, each keyed
+    by id."""
+    __slots__ = ('username', 'unscheduled_workout', 'scheduled_workout')
+    FIELDS = ('username', 'unscheduled_workout', 'scheduled_workout')
+
+    @classmethod
+    def from_dict(cls, data):
+        user = cls(**data)
+        if 'unscheduled_workout' in user:
+            user.unscheduled_workout = {report_id: UnscheduledWorkout.from_dict(report)
+                                        for report_id, report in user.unscheduled_workout.items()}
+        if 'scheduled_workout' in user:
+            user.scheduled_workout = {workout_id: ScheduledWorkout.from_dict(workout)
+                                      for workout_id, workout in user.scheduled_workout.items()}
+        return user
+
+
+class ScheduledReportView(Mapping):
+    """A read-only view of a scheduled report with its workout's id and name added on, the way reports are handed out
+    by get_all_reports. Nothing is copied, so it always shows the resident data as it is now.
+    """
+    __slots__ = ('report', 'workout_id', 'workout')
+
+    def __init__(self, report, workout_id, workout):
+        self.report = report
+        self.workout_id = workout_id
+        self.workout = workout
+
+    def __getitem__(self, key):
+        if key == 'workout_id':
+            return self.workout_id
+        if key == 'workout_name':
+            return self.workout['workout_name']
+        return self.report[key]
+
+    def __iter__(self):
+        for field in self.report:
+            if field not in ('workout_id', 'workout_name'):
+                yield field
+        yield 'workout_id'
+        yield 'workout_name'
+
+    def __len__(self):
+        return sum(1 for field in self)
+
+    def __contains__(self, key):
+        return key in ('workout_id', 'workout_name') or key in self.report
+
+    def __repr__(self):
+        return f"ScheduledReportView({dict(self.items())!r})"
+
+
+def decode_database(json_data):
+    """Turn the database as it is stored on disk into records, in place.
+
+    :param json_data: (dict) the database, laid out as {'users': {user_id: {...}}}
+    :return: (dict) the same dict, with every user, workout and report replaced by its record
+    """
+    users = json_data.setdefault('users', {})
+    for user_id, user in users.items():
+        users[user_id] = User.from_dict(user)
+    return json_data
+
+
+def encode_value(value):
+    """Turn a value from the resident database, which may be or contain records, back into plain dicts and lists.
+
+    :param value: (any) the value
+    :return: (any) the value the way it is stored on disk
+    """
+    if isinstance(value, Record):
+        return value.to_dict()
+    if isinstance(value, Mapping):
+        return {key: encode_value(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [encode_value(item) for item in value]
+    return value
+
+
+def encode_record(record):
+    """The default= hook for json.dump and json.dumps, so resident data can be serialized without converting it all
+    first. Only one level is converted at a time; json calls this again for the records inside.
+
+    :param record: (Record) a record json doesn't know how to serialize
+    :return: (dict) the record's fields
+    """
+    if isinstance(record, Record):
+        return dict(record.items())
+    raise TypeError(f"Object of type {type(record).__name__} is not JSON serializable")
+
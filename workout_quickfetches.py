@@ -1,7 +1,25 @@
-from workout_backend import read_json, get_all_reports
-from datetime import datetime
+from workout_backend import get_all_reports, get_report_calendar, get_report_entries, search_workouts
+from workout_cache import cached_quickfetch
+from workout_indexes import normalize_workout_name, name_match_score
+from datetime import datetime, timedelta
 
+# Discord shows at most this many autocomplete choices
+MAX_CHOICES = 25
 
+
+def _day_start(year, month, day):
+    """Get the unix time at which a day starts. Days past the end of the month (or before its start) roll over into
+    the next (or previous) month.
+
+    :param year: (int) the year
+    :param month: (int) the month
+    :param day: (int) the day of the month
+    :return: (float) the unix time of midnight at the start of that day
+    """
+    return (datetime(year, month, 1) + timedelta(days=day - 1)).timestamp()
+
+
+@cached_quickfetch
 def reports_years_quickfetch(userid):
     """Returns a list (in quickfetch form ready for autocomplete, so {'name': year, 'value': year}) of every year in
     which the user has submitted a report, whether scheduled or unscheduled.
@@ -9,21 +27,8 @@ def reports_years_quickfetch(userid):
     :param userid: (int) the Discord ID of the person who used the slash command
     :return: (list of dicts) {'name': year, 'value': year} for every year in which there is a report
     """
-    # Get all the reports the user has submitted
-    all_reports = get_all_reports(str(userid))
-    report_dates = [float(report_id) for report_id in all_reports]
-    report_dates.sort()
-
-    # Create a list of years that have reports in them
-    valid_years = []
-    year = 2020
-    next_year_start = datetime(year + 1, 1, 1).timestamp()
-    for unixtime in report_dates:
-        while unixtime > next_year_start:
-            year += 1
-            next_year_start = datetime(year+1, 1, 1).timestamp()
-        if year not in valid_years:
-            valid_years.append(year)
+    # Create a list of years that have reports in them, straight from the top level of the user's report calendar
+    valid_years = sorted(get_report_calendar(str(userid)))
 
     # Format the list of years the way autocomplete likes -- a list of dicts like so: {'name': name, 'value': value}
     year_strings = [str(year) for year in valid_years]
@@ -32,6 +37,7 @@ def reports_years_quickfetch(userid):
     return years_list
 
 
+@cached_quickfetch
 def reports_months_quickfetch(userid, year):
     """Returns a list (in quickfetch form ready for autocomplete) of every month within the selected year in which the
     user submitted a report, whether scheduled or unscheduled.
@@ -43,26 +49,9 @@ def reports_months_quickfetch(userid, year):
     months_hash = {1: 'January', 2: 'February', 3: 'March', 4: 'April', 5: 'May', 6: 'June', 7: 'July', 8: 'August',
                    9: 'September', 10: 'October', 11: 'November', 12: 'December'}
 
-    # Get bounds of this year
+    # Create a list of months in that year that have reports in them, straight from the user's report calendar
     year = int(year)
-    year_start = datetime(year, 1, 1).timestamp()
-    year_end = datetime(year+1, 1, 1).timestamp()
-
-    # Get all the reports the user has submitted this year
-    all_reports = get_all_reports(str(userid))
-    report_dates = [float(report_id) for report_id in all_reports if year_start <= float(report_id) < year_end]
-    report_dates.sort()
-
-    # Create a list of months in that year that have reports in them
-    valid_months = []
-    month = 1
-    month_end = datetime(year, month+1, 1).timestamp()
-    for unixtime in report_dates:
-        while unixtime > month_end:
-            month += 1
-            month_end = datetime(year, month+1, 1).timestamp()
-        if month not in valid_months:
-            valid_months.append(month)
+    valid_months = sorted(get_report_calendar(str(userid), year))
 
     # Format the list of months the way autocomplete likes -- a list of dicts like so: {'name': name, 'value': value}
     months_list = [{'name': f"{month} - {months_hash[month]}", 'value': str(month)} for month in valid_months]
@@ -70,6 +59,7 @@ def reports_months_quickfetch(userid, year):
     return months_list
 
 
+@cached_quickfetch
 def reports_days_quickfetch(userid, year, month):
     """Returns a list (in quickfetch form ready for autocomplete) of every day within the selected month on which the
     user submitted a report, whether scheduled or unscheduled.
@@ -83,27 +73,10 @@ def reports_days_quickfetch(userid, year, month):
     months_hash = {1: 'January', 2: 'February', 3: 'March', 4: 'April', 5: 'May', 6: 'June', 7: 'July', 8: 'August',
                    9: 'September', 10: 'October', 11: 'November', 12: 'December'}
 
-    # Get bounds of this month
+    # Create a list of days in that month that have reports in them, straight from the user's report calendar
     year = int(year)
     month = int(month)
-    month_start = datetime(year, month, 1).timestamp()
-    month_end = datetime(year, month+1, 1).timestamp()
-
-    # Get all the reports the user has submitted this month
-    all_reports = get_all_reports(str(userid))
-    report_dates = [float(report_id) for report_id in all_reports if month_start <= float(report_id) < month_end]
-    report_dates.sort()
-
-    # Create a list of days in that month that have reports in them
-    valid_days = []
-    day = 1
-    day_end = datetime(year, month, day+1).timestamp()
-    for unixtime in report_dates:
-        while unixtime > day_end:
-            day += 1
-            day_end = datetime(year, month, day+1).timestamp()
-        if day not in valid_days:
-            valid_days.append(day)
+    valid_days = sorted(get_report_calendar(str(userid), year, month))
 
     # Format the list of days the way autocomplete likes -- a list of dicts like so: {'name': name, 'value': value}
     days_list = [{'name': f"{day} - {months_hash[month]} {day}, {year}", 'value': str(day)} for day in valid_days]
@@ -111,14 +84,17 @@ def reports_days_quickfetch(userid, year, month):
     return days_list
 
 
-def reports_by_day_quickfetch(userid, year, month, day):
+@cached_quickfetch
+def reports_by_day_quickfetch(userid, year, month, day, text=''):
     """Returns a list (in quickfetch form ready for autocomplete) of all the reports the user submitted on the
-    specified day and the days directly before and after, whether scheduled or unscheduled.
+    specified day and the days directly before and after, whether scheduled or unscheduled. If the user has started
+    typing, the reports whose workout names match best come first.
 
         :param userid: (int) the Discord ID of the person who used the slash command
         :param year: (str) the year that is being queried to check for workouts
         :param month: (str) the month that is being queried to check for workouts
         :param day: (str) the day that is being queried to check for workouts
+        :param text: (str) what the user has typed into the option so far
         :return: (list of dicts) dict for every report made that day. The "value" is the report id (its unix timestamp)
                  ex: {'name': 'Push-ups', 'value': '1646880978.123'}
         """
@@ -129,28 +105,48 @@ def reports_by_day_quickfetch(userid, year, month, day):
     year = int(year)
     month = int(month)
     day = int(day)
-    range_start = datetime(year, month, day-1).timestamp()
-    day_start = datetime(year, month, day).timestamp()
-    day_end = datetime(year, month, day+1).timestamp()
-    range_end = datetime(year, month, day+2).timestamp()
+    range_start = _day_start(year, month, day - 1)
+    day_start = _day_start(year, month, day)
+    day_end = _day_start(year, month, day + 1)
+    range_end = _day_start(year, month, day + 2)
+    yesterday = datetime.fromtimestamp(range_start)
+    tomorrow = datetime.fromtimestamp(day_end)
 
-    # Get the dates of all the reports the user has submitted this month
-    all_reports = get_all_reports(str(userid))
-    report_dates = [float(report_id) for report_id in all_reports if range_start <= float(report_id) < range_end]
-    report_dates.sort()
+    # Get the time, id and workout name of every report from the day before to the day after, already sorted by time
+    entries = get_report_entries(str(userid), range_start, range_end)
 
     # Format the list of reports the way autocomplete likes -- a list of dicts like so: {'name': name, 'value': value}
-    yesterday_list = [{'name': f"{all_reports[str(report_id)]['workout_name']} - {months_hash[month]} {day-1}, {year}",
-                       'value': report_id} for report_id in report_dates if report_id < day_start]
-    today_list = [{'name': f"{all_reports[str(report_id)]['workout_name']} - {months_hash[month]} {day}, {year}",
-                   'value': report_id} for report_id in report_dates if day_start <= report_id < day_end]
-    tomorrow_list = [{'name': f"{all_reports[str(report_id)]['workout_name']} - {months_hash[month]} {day+1}, {year}",
-                      'value': report_id} for report_id in report_dates if day_end <= report_id]
+    yesterday_list = [{'name': f"{workout_name} - {months_hash[yesterday.month]} {yesterday.day}, {yesterday.year}",
+                       'value': report_time} for report_time, report_id, workout_name in entries
+                      if report_time < day_start]
+    today_list = [{'name': f"{workout_name} - {months_hash[month]} {day}, {year}",
+                   'value': report_time} for report_time, report_id, workout_name in entries
+                  if day_start <= report_time < day_end]
+    tomorrow_list = [{'name': f"{workout_name} - {months_hash[tomorrow.month]} {tomorrow.day}, {tomorrow.year}",
+                      'value': report_time} for report_time, report_id, workout_name in entries
+                     if day_end <= report_time]
     reports_list = yesterday_list + today_list + tomorrow_list
 
+    # Rank the reports against what the user has typed. There are only three days' worth, so they're scored directly
+    query = normalize_workout_name(text)
+    if query:
+        scores = {report_time: name_match_score(query, normalize_workout_name(workout_name))
+                  for report_time, report_id, workout_name in entries}
+        reports_list = [report for report in reports_list if scores[report['value']]]
+        reports_list.sort(key=lambda report: scores[report['value']], reverse=True)
+        return reports_list[:MAX_CHOICES]
+
+    # Otherwise, trim the surrounding days before cutting into the selected day
+    if len(reports_list) > MAX_CHOICES:
+        spare = max(MAX_CHOICES - len(today_list), 0)
+        tomorrow_list = tomorrow_list[:max(spare // 2, spare - len(yesterday_list))]
+        yesterday_list = yesterday_list[len(yesterday_list) - (spare - len(tomorrow_list)):]
+        reports_list = (yesterday_list + today_list + tomorrow_list)[:MAX_CHOICES]
+
     return reports_list
 
 
+@cached_quickfetch
 def fields_in_report_quickfetch(userid, report_id):
     """Return a list (in autocomplete format) of all the editable fields in the selected report.
 
@@ -176,16 +172,17 @@ def fields_in_report_quickfetch(userid, report_id):
     return fields_list
 
 
-def workouts_quickfetch(userid):
-    """Returns a list (in quickfetch form ready for autocomplete) of every workout schedule the user has created.
+@cached_quickfetch
+def workouts_quickfetch(userid, text=''):
+    """Returns a list (in quickfetch form ready for autocomplete) of the workout schedules the user has created that
+    best match what they have typed so far, up to the 25 Discord can show. With nothing typed, the newest come first.
 
     :param userid: (int) the Discord ID of the person who used the slash command
-    :return: (list of dicts) dict for every workout schedule the user has created.
-             ex: {'name': 'Push-ups', 'value': 'Push-ups'}
+    :param text: (str) what the user has typed into the option so far
+    :return: (list of dicts) dict for every matching workout schedule. ex: {'name': 'Push-ups', 'value': '1646880978.1'}
     """
-    workouts = read_json()['users'][str(userid)]['scheduled_workout']
+    workouts = search_workouts(userid, text, MAX_CHOICES)
 
-    workouts_list = [{'name': workouts[workout_id]['workout_name'], 'value': str(workout_id)}
-                     for workout_id in workouts]
+    workouts_list = [{'name': workout_name, 'value': str(workout_id)} for workout_id, workout_name in workouts]
 
     return workouts_list
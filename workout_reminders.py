@@ -0,0 +1,195 @@
+import heapq
+import threading
+import time
+import traceback
+from collections.abc import Mapping
+from datetime import datetime, timedelta
+
+from workout_adherence import schedule_mask
+
+
+def next_reminder_time(schedule, after, hour):
+    """Find the next time a workout should be done, at the reminder hour of one of its scheduled weekdays.
+
+    :param schedule: (list of bools) the workout's schedule, from schedule_mask()
+    :param after: (float) unix time to search from, exclusive
+    :param hour: (int) the hour of the day reminders go out at, in local time
+    :return: (float) unix time of the reminder, or None if the workout isn't scheduled on any day
+    """
+    first_day = datetime.fromtimestamp(after).date()
+    # Eight days, since today's reminder may already have gone out
+    for days_ahead in range(8):
+        day = first_day + timedelta(days=days_ahead)
+        if schedule[day.weekday()]:
+            reminder_time = datetime(day.year, day.month, day.day, hour).timestamp()
+            if reminder_time > after:
+                return reminder_time
+    return None
+
+
+class ReminderScheduler:
+    """Reminds users of their scheduled workouts on the days they're scheduled. The next reminder of every
+    (user, workout) pair is kept in a heap, so finding what's due is a peek at its top, and the scheduler's thread
+    sleeps until then instead of polling. Changing a workout's schedule pushes its new reminder time and leaves the old
+    one in the heap, where it is recognised as stale and skipped when it comes up.
+
+    The heap is rebuilt from the database by rebuild() and then kept up to date by update(), which the backend calls
+    after every change to the resident database, like the indexes.
+    """
+
+    def __init__(self, hour=9, clock=time.time):
+        # The hour of the day reminders go out at, in local time
+        self.hour = hour
+        # Returns the current unix time. Tests can pass a fake clock and call pop_due() instead of starting the thread
+        self.clock = clock
+        # (user_id, workout_id) -> (reminder time, days_scheduled) for every workout scheduled on at least one day
+        self.reminders = {}
+        # (reminder time, user_id, workout_id), including stale entries whose time no longer matches self.reminders
+        self.heap = []
+        # Nothing is tracked until the first rebuild()
+        self.built = False
+        self.condition = threading.Condition()
+        self.stopping = False
+        self.thread = None
+
+    def rebuild(self, users):
+        """Work out every workout's next reminder from scratch.
+
+        :param users: (dict) the resident database's users, {user_id: user}
+        """
+        now = self.clock()
+        # Workouts with the same schedule have the same next reminder, so each schedule is only worked out once
+        reminder_times = {}
+        with self.condition:
+            self.reminders = {}
+            for user_id, user in users.items():
+                for workout_id, workout in user.get('scheduled_workout', {}).items():
+                    days_scheduled = workout.get('days_scheduled')
+                    days = tuple(days_scheduled or ())
+                    if days not in reminder_times:
+                        reminder_times[days] = next_reminder_time(schedule_mask(days), now, self.hour)
+                    if reminder_times[days] is not None:
+                        self.reminders[(user_id, workout_id)] = (reminder_times[days], days_scheduled)
+            self.heap = [(reminder[0], key[0], key[1]) for key, reminder in self.reminders.items()]
+            heapq.heapify(self.heap)
+            self.built = True
+            self.condition.notify()
+
+    def update(self, op, path, old_value, new_value):
+        """Bring the reminders up to date after a change to the resident database.
+
+        :param op: (str) 'set' or 'delete'
+        :param path: (tuple) the keys leading to the value that changed
+        :param old_value: (any) the value before the change, or None if there wasn't one
+        :param new_value: (any) the value after the change, or None if it was deleted
+        """
+        if not self.built:
+            return
+        if len(path) < 2:
+            users = new_value if len(path) == 1 else (new_value or {}).get('users')
+            self.rebuild(users or {})
+            return
+        if len(path) > 2 and path[2] != 'scheduled_workout':
+            return
+
+        user_id = path[1]
+        now = self.clock()
+        with self.condition:
+            # A whole user or their dict of workouts being replaced or deleted
+            if len(path) <= 3:
+                for key in [key for key in self.reminders if key[0] == user_id]:
+                    del self.reminders[key]
+                workouts = new_value.get('scheduled_workout', {}) if len(path) == 2 and new_value else new_value
+                for workout_id, workout in (workouts or {}).items():
+                    self._schedule(user_id, workout_id, workout.get('days_scheduled'), now)
+
+            # A workout being added, replaced or deleted
+            elif len(path) == 4:
+                days_scheduled = new_value.get('days_scheduled') if isinstance(new_value, Mapping) else None
+                self._schedule(user_id, path[3], days_scheduled, now)
+
+            # A workout's schedule being changed
+            elif len(path) == 5 and path[4] == 'days_scheduled':
+                self._schedule(user_id, path[3], new_value, now)
+            else:
+                return
+            self.condition.notify()
+
+    def pop_due(self):
+        """Take every reminder that is due off the heap, and push each workout's following reminder.
+
+        :return: (list of tuples) (user_id, workout_id) for every reminder that is due, soonest first
+        """
+        now = self.clock()
+        due = []
+        with self.condition:
+            while self.heap and self.heap[0][0] <= now:
+                reminder_time, user_id, workout_id = heapq.heappop(self.heap)
+                reminder = self.reminders.get((user_id, workout_id))
+                if reminder is None or reminder[0] != reminder_time:
+                    continue
+                due.append((user_id, workout_id))
+                self._schedule(user_id, workout_id, reminder[1], max(now, reminder_time))
+        return due
+
+    def seconds_until_due(self):
+        """Get how long it is until the next reminder is due.
+
+        :return: (float) the number of seconds, 0 if one is already due, or None if there are no reminders
+        """
+        with self.condition:
+            if not self.heap:
+                return None
+            return max(self.heap[0][0] - self.clock(), 0)
+
+    def start(self, send):
+        """Start sending reminders on a background thread, which sleeps until the next one is due or the reminders
+        change.
+
+        :param send: (function) called with (user_id, workout_id) for every reminder that comes due. It is called on the
+                     scheduler's thread, so it should hand the work off rather than block
+        :return: (Thread) the scheduler's thread
+        """
+        def send_reminders():
+            while True:
+                with self.condition:
+                    if self.stopping:
+                        return
+                    timeout = self.seconds_until_due()
+                    if timeout != 0:
+                        self.condition.wait(timeout)
+                        continue
+                for user_id, workout_id in self.pop_due():
+                    try:
+                        send(user_id, workout_id)
+                    except Exception as error:
+                        traceback.print_exception(type(error), error, error.__traceback__)
+
+        with self.condition:
+            self.stopping = False
+        self.thread = threading.Thread(target=send_reminders, name='workout-reminders', daemon=True)
+        self.thread.start()
+        return self.thread
+
+    def stop(self):
+        """Stop the scheduler's thread, if it's running, and wait for it to finish."""
+        with self.condition:
+            self.stopping = True
+            self.condition.notify()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def _schedule(self, user_id, workout_id, days_scheduled, after):
+        """Set a workout's next reminder, replacing any it had. Must be called while holding the condition's lock."""
+        reminder_time = next_reminder_time(schedule_mask(days_scheduled), after, self.hour)
+        if reminder_time is None:
+            self.reminders.pop((user_id, workout_id), None)
+            return
+        self.reminders[(user_id, workout_id)] = (reminder_time, days_scheduled)
+        heapq.heappush(self.heap, (reminder_time, user_id, workout_id))
+
+        # Stale entries are left in the heap when reminders move, so clear them out once they are half of it
+        if len(self.heap) > 2 * len(self.reminders) + 64:
+            self.heap = [(reminder[0], key[0], key[1]) for key, reminder in self.reminders.items()]
+            heapq.heapify(self.heap)
@@ -0,0 +1,138 @@
+import argparse
+import os
+from hashlib import md5
+from decouple import config
+
+from workout_codecs import get_codec, read_database
+from workout_metrics import metrics
+from workout_storage import StorageEngine
+
+
+class ShardedEngine(StorageEngine):
+    """Keeps every user's data in a file of its own inside a directory, so a change to one user only rewrites that
+    user's file and never serializes anybody else's history. With buckets set, users are hashed into that many bucket
+    files instead, which keeps the number of files down on big servers while still only rewriting the bucket a user
+    belongs to.
+
+    Shards are written with the codec named by FILE_CODEC, like the single-file database, and read with whichever
+    codec they were written with, so changing FILE_CODEC converts each shard the next time it's written. They keep
+    the .json extension whatever the codec, so existing shard directories are still found.
+    """
+
+    def __init__(self, directory, buckets=0, codec=None):
+        self.directory = directory
+        self.buckets = buckets
+        self.codec = codec or get_codec()
+        # The user ids living in each shard, so that writing a bucket doesn't need a scan of every user
+        self.bucket_members = {}
+
+    def load(self):
+        os.makedirs(self.directory, exist_ok=True)
+        json_data = {'users': {}}
+        for filename in sorted(os.listdir(self.directory)):
+            if not filename.endswith('.json'):
+                continue
+            shard = read_database(os.path.join(self.directory, filename))
+            json_data['users'].update(shard)
+            for user_id in shard:
+                self.bucket_members.setdefault(self.shard_name(user_id), set()).add(user_id)
+
+        return json_data
+
+    def prepare(self, json_data, mutations):
+        # Work out which shards were touched. A mutation of the whole database touches every shard there is
+        shard_names = set()
+        for op, path, value in mutations:
+            if len(path) < 2:
+                shard_names.update(self.shard_name(user_id) for user_id in json_data['users'])
+                shard_names.update(self.bucket_members)
+                self.bucket_members = {}
+                for user_id in json_data['users']:
+                    self.bucket_members.setdefault(self.shard_name(user_id), set()).add(user_id)
+                continue
+
+            user_id = path[1]
+            shard_name = self.shard_name(user_id)
+            shard_names.add(shard_name)
+            if user_id in json_data['users']:
+                self.bucket_members.setdefault(shard_name, set()).add(user_id)
+            else:
+                self.bucket_members.get(shard_name, set()).discard(user_id)
+
+        # Serialize the touched shards now, while the resident data can't change under us. None marks a shard that
+        # has no users left and should be removed
+        batch = {}
+        for shard_name in shard_names:
+            users = {user_id: json_data['users'][user_id] for user_id in self.bucket_members.get(shard_name, ())
+                     if user_id in json_data['users']}
+            batch[shard_name] = self.codec.dumps(users) if users else None
+        return batch
+
+    def write(self, batch):
+        for shard_name, contents in batch.items():
+            self.write_shard(shard_name, contents)
+
+    def shard_name(self, user_id):
+        """Get the name of the shard a user's data is kept in.
+
+        :param user_id: (str) the Discord ID of the user
+        :return: (str) the shard's name, which is also its filename without the extension
+        """
+        if not self.buckets:
+            return str(user_id)
+        return f"bucket-{int(md5(str(user_id).encode()).hexdigest(), 16) % self.buckets}"
+
+    def write_shard(self, shard_name, contents):
+        """Write one shard file, or remove it if no users are left in it.
+
+        :param shard_name: (str) the name of the shard
+        :param contents: (bytes) the serialized {user_id: user} of every user in the shard, or None if it's empty
+        """
+        filename = os.path.join(self.directory, shard_name + '.json')
+        if contents is None:
+            if os.path.isfile(filename):
+                os.remove(filename)
+            return
+
+        # Write to a temporary file and swap it in, so a crash mid-write never leaves a truncated shard
+        temp_filename = filename + '.tmp'
+        with open(temp_filename, 'wb') as file:
+            file.write(contents)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_filename, filename)
+        metrics.count_bytes('written', len(contents))
+
+
+def split_json_file(json_filename, directory, buckets=0):
+    """Split a monolithic JSON database into shard files.
+
+    :param json_filename: (str) the path of the database file to read, in any FILE_CODEC format
+    :param directory: (str) the directory the shard files will be written to
+    :param buckets: (int) the number of buckets to hash users into, or 0 for one file per user
+    :return: (int) the number of shard files that were written
+    """
+    json_data = read_database(json_filename)
+
+    engine = ShardedEngine(directory, buckets, get_codec())
+    os.makedirs(directory, exist_ok=True)
+    engine.persist(json_data, [('set', (), json_data)])
+
+    return len(engine.bucket_members)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Split the JSON workout database into one file per user.")
+    parser.add_argument('json_filename', nargs='?', default=None,
+                        help="the JSON database to split (defaults to the FILENAME config key)")
+    parser.add_argument('directory', nargs='?', default=None,
+                        help="where to write the shards (defaults to the SHARD_DIRECTORY config key)")
+    parser.add_argument('--buckets', type=int, default=None,
+                        help="hash users into this many files instead of one per user (defaults to SHARD_BUCKETS)")
+    args = parser.parse_args()
+
+    num_shards = split_json_file(args.json_filename or config("FILENAME"),
+                                 args.directory or config("SHARD_DIRECTORY", default='shards'),
+                                 args.buckets if args.buckets is not None
+                                 else config("SHARD_BUCKETS", default=0, cast=int))
+    print(f"Wrote {num_shards} shard files. Set STORAGE_ENGINE=sharded to use them.")
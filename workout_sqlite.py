@@ -0,0 +1,243 @@
+import argparse
+import json
+import sqlite3
+import threading
+from decouple import config
+
+from workout_codecs import read_database
+from workout_metrics import metrics
+from workout_models import encode_record
+from workout_storage import StorageEngine, record_path, lookup_path
+
+# Every record keeps its fields as a JSON document in the data column. The other columns are only there so that
+# the records can be found and ordered through the indexes without decoding the documents.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    user_id TEXT PRIMARY KEY,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS workouts (
+    user_id TEXT NOT NULL,
+    workout_id TEXT NOT NULL,
+    created REAL NOT NULL,
+    workout_name TEXT,
+    data TEXT NOT NULL,
+    PRIMARY KEY (user_id, workout_id)
+);
+CREATE TABLE IF NOT EXISTS reports (
+    user_id TEXT NOT NULL,
+    report_id TEXT NOT NULL,
+    workout_id TEXT,
+    created REAL NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (user_id, report_id)
+);
+CREATE INDEX IF NOT EXISTS workouts_by_user_created ON workouts (user_id, created);
+CREATE INDEX IF NOT EXISTS reports_by_user_created ON reports (user_id, created);
+CREATE INDEX IF NOT EXISTS reports_by_workout ON reports (user_id, workout_id);
+"""
+
+WORKOUT_KEYS = ('scheduled_workout', 'unscheduled_workout')
+
+
+class SQLiteEngine(StorageEngine):
+    """Keeps the database in SQLite, with one row per user, workout and report. Changing one field only rewrites the
+    row of the record it belongs to. The (user_id, created) indexes let load() read every user's rows in time order
+    without sorting them. Time range lookups are served from the backend's in-memory indexes, not from SQLite."""
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.lock = threading.Lock()
+        # Batches are written on the backend's writer thread, while load() and close() are called from others
+        self.connection = sqlite3.connect(filename, check_same_thread=False)
+        self.connection.executescript(SCHEMA)
+
+    def load(self):
+        json_data = {'users': {}}
+        # SQLite's own pages aren't visible from here, so the size of the documents read stands in for the bytes read
+        bytes_read = 0
+        with self.lock:
+            for user_id, data in self.connection.execute("SELECT user_id, data FROM users"):
+                bytes_read += len(data)
+                user = json.loads(data)
+                user['unscheduled_workout'] = {}
+                user['scheduled_workout'] = {}
+                json_data['users'][user_id] = user
+
+            for user_id, workout_id, data in self.connection.execute(
+                    "SELECT user_id, workout_id, data FROM workouts ORDER BY user_id, created"):
+                bytes_read += len(data)
+                workout = json.loads(data)
+                workout['reports'] = {}
+                json_data['users'][user_id]['scheduled_workout'][workout_id] = workout
+
+            for user_id, report_id, workout_id, data in self.connection.execute(
+                    "SELECT user_id, report_id, workout_id, data FROM reports ORDER BY user_id, created"):
+                bytes_read += len(data)
+                user = json_data['users'][user_id]
+                if workout_id is None:
+                    user['unscheduled_workout'][report_id] = json.loads(data)
+                else:
+                    user['scheduled_workout'][workout_id]['reports'][report_id] = json.loads(data)
+
+        metrics.count_bytes('read', bytes_read)
+        return json_data
+
+    def prepare(self, json_data, mutations):
+        # Each mutation only needs the one record it touched to be rewritten from the resident data. A record that is
+        # missing from the resident data by now has been deleted, so it is deleted here, too.
+        statements = []
+        synced = set()
+        for op, path, value in mutations:
+            path = record_path(path)
+            if path in synced:
+                continue
+            synced.add(path)
+            _sync_record(statements, json_data, path, whole=_replaces_subtree(path, mutations))
+        return statements
+
+    def write(self, batch):
+        # The whole batch is one transaction, so it costs one commit no matter how many rows it touches
+        with self.lock, self.connection:
+            for statement, params in batch:
+                self.connection.execute(statement, params)
+        # Count the size of the documents written, the same way load() counts what it reads
+        metrics.count_bytes('written', sum(len(params[-1]) for statement, params in batch
+                                           if statement.startswith('INSERT')))
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+def _sync_record(statements, json_data, path, whole=False):
+    """Add the statements that make the rows for the record at path match the resident data.
+
+    :param statements: (list of tuples) the (statement, params) of the batch being prepared
+    :param json_data: (dict) the resident database
+    :param path: (tuple) the path of a user, workout or report record
+    :param whole: (bool) if True and path is a user or workout, rewrite the rows of everything inside it, too
+    """
+    user_id = path[1] if len(path) > 1 else None
+    if user_id is None:
+        # The whole database was replaced
+        statements.append(("DELETE FROM users", ()))
+        statements.append(("DELETE FROM workouts", ()))
+        statements.append(("DELETE FROM reports", ()))
+        for user_id in json_data['users']:
+            _insert_user(statements, user_id, json_data['users'][user_id])
+        return
+
+    record = lookup_path(json_data, path)
+    if len(path) == 2:
+        if record is None or whole:
+            statements.append(("DELETE FROM users WHERE user_id = ?", (user_id,)))
+            statements.append(("DELETE FROM workouts WHERE user_id = ?", (user_id,)))
+            statements.append(("DELETE FROM reports WHERE user_id = ?", (user_id,)))
+            if record is not None:
+                _insert_user(statements, user_id, record)
+        else:
+            _upsert_user_row(statements, user_id, record)
+
+    elif path[2] == 'unscheduled_workout':
+        statements.append(("DELETE FROM reports WHERE user_id = ? AND report_id = ?", (user_id, path[3])))
+        if record is not None:
+            _upsert_report_row(statements, user_id, path[3], None, record)
+
+    elif len(path) == 4:
+        if record is None or whole:
+            statements.append(("DELETE FROM workouts WHERE user_id = ? AND workout_id = ?",
+                               (user_id, path[3])))
+            statements.append(("DELETE FROM reports WHERE user_id = ? AND workout_id = ?",
+                               (user_id, path[3])))
+            if record is not None:
+                _insert_workout(statements, user_id, path[3], record)
+        else:
+            _upsert_workout_row(statements, user_id, path[3], record)
+
+    else:
+        statements.append(("DELETE FROM reports WHERE user_id = ? AND report_id = ?", (user_id, path[5])))
+        if record is not None:
+            _upsert_report_row(statements, user_id, path[5], path[3], record)
+
+
+def _replaces_subtree(path, mutations):
+    """Check whether any of the mutations replaced a user or workout wholesale, or replaced one of the dicts of
+    records inside it. If so, every row inside that user or workout has to be rewritten, not just its own row.
+
+    :param path: (tuple) the path of the user or workout record
+    :param mutations: (list of tuples) the mutations being persisted
+    :return: (bool) True if the rows inside the record have to be rewritten
+    """
+    child_keys = WORKOUT_KEYS if len(path) == 2 else ('reports',)
+    for op, mutation_path, value in mutations:
+        if mutation_path == path or (len(mutation_path) == len(path) + 1 and mutation_path[:len(path)] == path
+                                     and mutation_path[-1] in child_keys):
+            return True
+    return False
+
+
+def _upsert_user_row(statements, user_id, user):
+    """Queue a write of a user's own fields (everything but their workouts) to the users table."""
+    data = {field: value for field, value in user.items() if field not in WORKOUT_KEYS}
+    statements.append(("INSERT OR REPLACE INTO users (user_id, data) VALUES (?, ?)", (user_id, json.dumps(data))))
+
+
+def _upsert_report_row(statements, user_id, report_id, workout_id, report):
+    """Queue a write of one report to the reports table. workout_id is None for unscheduled reports."""
+    statements.append(("INSERT OR REPLACE INTO reports (user_id, report_id, workout_id, created, data) "
+                       "VALUES (?, ?, ?, ?, ?)",
+                       (user_id, report_id, workout_id, float(report_id), json.dumps(report, default=encode_record))))
+
+
+def _upsert_workout_row(statements, user_id, workout_id, workout):
+    """Queue a write of a scheduled workout's own fields (everything but its reports) to the workouts table."""
+    data = {field: value for field, value in workout.items() if field != 'reports'}
+    statements.append(("INSERT OR REPLACE INTO workouts (user_id, workout_id, created, workout_name, data) "
+                       "VALUES (?, ?, ?, ?, ?)",
+                       (user_id, workout_id, float(workout_id), workout.get('workout_name'), json.dumps(data))))
+
+
+def _insert_workout(statements, user_id, workout_id, workout):
+    """Queue writes of a scheduled workout and all its reports."""
+    _upsert_workout_row(statements, user_id, workout_id, workout)
+    for report_id, report in workout.get('reports', {}).items():
+        _upsert_report_row(statements, user_id, report_id, workout_id, report)
+
+
+def _insert_user(statements, user_id, user):
+    """Queue writes of a user along with all their workouts and reports."""
+    _upsert_user_row(statements, user_id, user)
+    for workout_id, workout in user.get('scheduled_workout', {}).items():
+        _insert_workout(statements, user_id, workout_id, workout)
+    for report_id, report in user.get('unscheduled_workout', {}).items():
+        _upsert_report_row(statements, user_id, report_id, None, report)
+
+
+def migrate_json_to_sqlite(json_filename, sqlite_filename):
+    """Copy everything in an existing JSON database into a SQLite database, in one transaction.
+
+    :param json_filename: (str) the path of the database file to read, in any FILE_CODEC format
+    :param sqlite_filename: (str) the path of the SQLite database to create or fill
+    :return: (int) the number of users that were migrated
+    """
+    json_data = read_database(json_filename)
+
+    engine = SQLiteEngine(sqlite_filename)
+    engine.persist(json_data, [('set', (), json_data)])
+    engine.close()
+
+    return len(json_data['users'])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Copy the JSON workout database into a SQLite database.")
+    parser.add_argument('json_filename', nargs='?', default=None,
+                        help="the JSON database to migrate (defaults to the FILENAME config key)")
+    parser.add_argument('sqlite_filename', nargs='?', default=None,
+                        help="the SQLite database to write (defaults to the SQLITE_FILENAME config key)")
+    args = parser.parse_args()
+
+    num_users = migrate_json_to_sqlite(args.json_filename or config("FILENAME"),
+                                       args.sqlite_filename or config("SQLITE_FILENAME", default='workouts.sqlite3'))
+    print(f"Migrated {num_users} users. Set STORAGE_ENGINE=sqlite to use the new database.")
@@ -0,0 +1,273 @@
+from bisect import bisect_left, insort
+from collections import Counter
+from datetime import datetime
+
+from workout_indexes import report_entries
+
+# The completion a scheduled report has when the workout wasn't done. Every other report counts as a session
+SKIPPED = 'skipped'
+# How many weeks of volume the summary covers, this week included
+VOLUME_WEEKS = 8
+
+
+def week_of(timestamp):
+    """Number the week a time falls in, counting Monday-to-Sunday weeks in local time, so that consecutive weeks get
+    consecutive numbers.
+
+    :param timestamp: (float) unix time
+    :return: (int) the week number
+    """
+    return (datetime.fromtimestamp(timestamp).toordinal() - 1) // 7
+
+
+def week_start(week):
+    """Get the Monday a week number from week_of() starts on.
+
+    :param week: (int) the week number
+    :return: (datetime) midnight at the start of the week, in local time
+    """
+    return datetime.fromordinal(week * 7 + 1)
+
+
+def completion_label(completion):
+    """Get the label a completion is counted and shown under. The report_scheduled command stores 'partially_complete'
+    while edit_report stores 'partially complete', so both spellings are counted as the latter.
+
+    :param completion: (str) the completion stored in a report, or None if it doesn't have one
+    :return: (str) the label, or the completion as it is if it isn't a string
+    """
+    if not isinstance(completion, str):
+        return completion
+    return completion.replace('_', ' ')
+
+
+def report_completions(path, value):
+    """List every report contained in a value of the database, like report_entries(), but with each report's
+    completion instead of its workout's name.
+
+    :param path: (tuple) the keys leading to the value
+    :param value: (dict or Record) the value at the end of the path
+    :return: (list of tuples) (report_id, workout_id, completion) for every report. workout_id and completion are None
+             for unscheduled reports
+    """
+    completions = []
+    for report_id, workout_id, workout_name in report_entries(path, value):
+        completion = None
+        if workout_id is not None:
+            # Walk from the value down to the report, starting from however deep the path already is
+            report = value
+            for key in ('scheduled_workout', workout_id, 'reports', report_id)[len(path) - 2:]:
+                report = report[key]
+            completion = report.get('completion')
+        completions.append((report_id, workout_id, completion))
+    return completions
+
+
+class UserStats:
+    """The running totals kept for one user. Every report changes them by a constant amount, so none of them are ever
+    recounted from the reports."""
+    __slots__ = ('sessions', 'unscheduled', 'completions', 'session_times', 'weeks', 'end_of', 'start_of',
+                 'streak_lengths')
+
+    def __init__(self):
+        # The number of reports that weren't skipped, and how many of those were unscheduled
+        self.sessions = 0
+        self.unscheduled = 0
+        # workout_id -> Counter of completion_label() -> number of reports
+        self.completions = {}
+        # The times of every session, sorted, for the time of the last one
+        self.session_times = []
+        # week number -> number of sessions that week, for weeks with at least one
+        self.weeks = {}
+        # Streaks are runs of consecutive weeks with sessions. end_of maps each streak's first week to its last week,
+        # start_of maps its last week to its first, and streak_lengths counts how many streaks there are of each length
+        self.end_of = {}
+        self.start_of = {}
+        self.streak_lengths = Counter()
+
+
+class WorkoutStats:
+    """Per-user and per-workout statistics: completion rates for every scheduled workout, sessions per week, weekly
+    streaks and the time of the last session.
+
+    Like the indexes, a user's totals are built the first time they're needed, archived reports included, and then
+    kept up to date by update(), which adjusts them for just the reports that changed. Reading them never looks at the
+    reports at all, so the stats cost the same however long a user's history is.
+    """
+
+    def __init__(self, archive=None):
+        # Where older reports are kept, if anywhere
+        self.archive = archive
+        # user_id -> UserStats
+        self.users = {}
+
+    def clear(self):
+        """Forget every user's totals. They are rebuilt the next time they're needed."""
+        self.users = {}
+
+    def forget(self, user_id):
+        """Forget one user's totals. They are rebuilt the next time they're needed.
+
+        :param user_id: (str) the Discord ID of the user
+        """
+        self.users.pop(user_id, None)
+
+    def build(self, user_id, user):
+        """Build a user's totals from scratch if they haven't been built yet.
+
+        :param user_id: (str) the Discord ID of the user
+        :param user: (dict) the user's resident data
+        """
+        if user_id in self.users:
+            return
+        self.users[user_id] = UserStats()
+        completions = report_completions(('users', user_id), user)
+        if self.archive is not None:
+            completions += self.archive.completions(user_id, user)
+        for report_id, workout_id, completion in completions:
+            self._add(user_id, report_id, workout_id, completion)
+
+    def update(self, op, path, old_value, new_value):
+        """Bring the totals up to date after a change to the resident database. Users whose totals haven't been built
+        yet are skipped, since they'll be built from the up-to-date data anyway.
+
+        :param op: (str) 'set' or 'delete'
+        :param path: (tuple) the keys leading to the value that changed
+        :param old_value: (any) the value before the change, or None if there wasn't one
+        :param new_value: (any) the value after the change, or None if it was deleted
+        """
+        if len(path) < 2:
+            self.clear()
+            return
+        user_id = path[1]
+        if user_id not in self.users:
+            return
+
+        # When a whole user or one of their dicts of workouts is replaced, it's simplest to rebuild their totals later
+        if len(path) == 2 or (len(path) == 3 and path[2] in ('scheduled_workout', 'unscheduled_workout')):
+            self.forget(user_id)
+            return
+
+        # A scheduled report's completion being edited moves it from one count to another
+        if len(path) == 7 and path[4] == 'reports' and path[6] == 'completion':
+            self._remove(user_id, path[5], path[3], old_value)
+            self._add(user_id, path[5], path[3], new_value)
+            return
+
+        for report_id, workout_id, completion in report_completions(path, old_value):
+            self._remove(user_id, report_id, workout_id, completion)
+        for report_id, workout_id, completion in report_completions(path, new_value):
+            self._add(user_id, report_id, workout_id, completion)
+
+    def summary(self, user_id, now=None):
+        """Get a user's statistics.
+
+        :param user_id: (str) the Discord ID of the user
+        :param now: (float) unix time to measure the current streak and weekly volume from. None means right now
+        :return: (dict) 'sessions' and 'unscheduled' (ints), 'last_session' (float unix time, or None),
+                 'current_streak' and 'longest_streak' (ints, in weeks; a streak stays current until a whole week goes
+                 by without a session), 'weekly_volume' (list of (datetime, int) with the start of each of the last
+                 VOLUME_WEEKS weeks and its number of sessions, oldest first) and 'completions'
+                 ({workout_id: {completion_label(): count}})
+        """
+        stats = self.users[user_id]
+        this_week = week_of(datetime.now().timestamp() if now is None else now)
+        current_streak = 0
+        for week in (this_week, this_week - 1):
+            if week in stats.start_of:
+                current_streak = week - stats.start_of[week] + 1
+                break
+
+        return {'sessions': stats.sessions,
+                'unscheduled': stats.unscheduled,
+                'last_session': stats.session_times[-1] if stats.session_times else None,
+                'current_streak': current_streak,
+                'longest_streak': max(stats.streak_lengths) if stats.streak_lengths else 0,
+                'weekly_volume': [(week_start(week), stats.weeks.get(week, 0))
+                                  for week in range(this_week - VOLUME_WEEKS + 1, this_week + 1)],
+                'completions': {workout_id: dict(counts) for workout_id, counts in stats.completions.items()}}
+
+    def _add(self, user_id, report_id, workout_id, completion):
+        """Count one report into a user's totals."""
+        stats = self.users[user_id]
+        if workout_id is not None:
+            stats.completions.setdefault(workout_id, Counter())[completion_label(completion)] += 1
+            if completion == SKIPPED:
+                return
+        else:
+            stats.unscheduled += 1
+
+        report_time = float(report_id)
+        stats.sessions += 1
+        insort(stats.session_times, report_time)
+        week = week_of(report_time)
+        stats.weeks[week] = stats.weeks.get(week, 0) + 1
+        if stats.weeks[week] == 1:
+            self._join_week(stats, week)
+
+    def _remove(self, user_id, report_id, workout_id, completion):
+        """Take one report back out of a user's totals."""
+        stats = self.users[user_id]
+        if workout_id is not None:
+            counts = stats.completions.get(workout_id)
+            if counts is not None:
+                label = completion_label(completion)
+                counts[label] -= 1
+                if counts[label] <= 0:
+                    del counts[label]
+                if not counts:
+                    del stats.completions[workout_id]
+            if completion == SKIPPED:
+                return
+        else:
+            stats.unscheduled -= 1
+
+        report_time = float(report_id)
+        stats.sessions -= 1
+        position = bisect_left(stats.session_times, report_time)
+        if position < len(stats.session_times) and stats.session_times[position] == report_time:
+            del stats.session_times[position]
+        week = week_of(report_time)
+        stats.weeks[week] -= 1
+        if stats.weeks[week] == 0:
+            del stats.weeks[week]
+            self._split_week(stats, week)
+
+    @staticmethod
+    def _join_week(stats, week):
+        """Add a week that just got its first session to the streaks, joining the streaks on either side of it."""
+        first, last = week, week
+        if week - 1 in stats.start_of:
+            first = stats.start_of.pop(week - 1)
+            del stats.end_of[first]
+            _uncount_streak(stats, week - first)
+        if week + 1 in stats.end_of:
+            last = stats.end_of.pop(week + 1)
+            del stats.start_of[last]
+            _uncount_streak(stats, last - week)
+        stats.end_of[first] = last
+        stats.start_of[last] = first
+        stats.streak_lengths[last - first + 1] += 1
+
+    @staticmethod
+    def _split_week(stats, week):
+        """Take a week that just lost its last session out of the streaks, splitting the streak it was in."""
+        # Find the start of the week's streak by walking back through the weeks with sessions before it
+        first = week
+        while first - 1 in stats.weeks:
+            first -= 1
+        last = stats.end_of.pop(first)
+        del stats.start_of[last]
+        _uncount_streak(stats, last - first + 1)
+        for streak_first, streak_last in ((first, week - 1), (week + 1, last)):
+            if streak_first <= streak_last:
+                stats.end_of[streak_first] = streak_last
+                stats.start_of[streak_last] = streak_first
+                stats.streak_lengths[streak_last - streak_first + 1] += 1
+
+
+def _uncount_streak(stats, length):
+    """Take one streak of a length out of a user's count of streak lengths."""
+    stats.streak_lengths[length] -= 1
+    if not stats.streak_lengths[length]:
+        del stats.streak_lengths[length]
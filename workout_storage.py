@@ -0,0 +1,190 @@
+import os
+from collections.abc import Mapping
+from decouple import config
+
+from workout_codecs import get_codec, read_database, write_database
+
+
+class StorageEngine:
+    """Base class for the places the resident database can be persisted to.
+
+    The backend keeps the whole database in memory and hands each engine the batch of mutations made since the last
+    write. A mutation is a tuple (op, path, value) where op is 'set' or 'delete' and path is the tuple of keys leading
+    from the top of the database to the changed value, ex: ('users', '1234', 'scheduled_workout', '1646880978.1').
+
+    Persisting a batch happens in two steps. prepare() runs while the resident database is locked and turns the batch
+    into whatever the engine is going to write, so it must copy or serialize anything it needs. write() then runs with
+    the database unlocked, so commands carry on while the engine waits on the disk. write() must not return until the
+    batch is durable.
+    """
+    def load(self):
+        """Read the whole database, creating empty storage first if there isn't any yet.
+
+        :return: (dict) the database, laid out as {'users': {user_id: {...}}}
+        """
+        raise NotImplementedError
+
+    def prepare(self, json_data, mutations):
+        """Turn a batch of mutations into the data to be written. Called with the resident database locked.
+
+        :param json_data: (dict) the resident database, with all the mutations already applied
+        :param mutations: (list of tuples) (op, path, value) for every change made since the last batch
+        :return: (any) the prepared batch, to be handed to write()
+        """
+        raise NotImplementedError
+
+    def write(self, batch):
+        """Write a prepared batch to storage and wait until it is durable. Batches are written one at a time, in the
+        order they were prepared.
+
+        :param batch: (any) a batch returned by prepare()
+        """
+        raise NotImplementedError
+
+    def persist(self, json_data, mutations):
+        """Prepare and write a batch of mutations in one go.
+
+        :param json_data: (dict) the database, with all the mutations already applied
+        :param mutations: (list of tuples) (op, path, value) for every change made since the last batch
+        """
+        self.write(self.prepare(json_data, mutations))
+
+    def close(self):
+        """Release anything the engine holds open."""
+
+
+class JSONFileEngine(StorageEngine):
+    """Keeps the whole database in the single file named by the FILENAME config key, written with the codec named by
+    FILE_CODEC. The file is read with whichever codec it was written with, so changing FILE_CODEC converts it on the
+    next write.
+
+    Every user is kept serialized as of the last batch. prepare() only serializes again the users that the batch
+    changed, so the time the database stays locked depends on the size of the change, and write() puts the file
+    together from the serialized users with the database unlocked. That costs a second copy of the database in memory.
+    """
+
+    def __init__(self, filename, codec):
+        self.filename = filename
+        self.codec = codec
+        # user_id -> the user serialized with the codec, in the same order as the resident database
+        self.users = {}
+
+    def load(self):
+        if not os.path.isfile(self.filename):
+            json_data = {'users': {}}
+            self.persist(json_data, [])
+            return json_data
+
+        json_data = read_database(self.filename)
+        self.users = {user_id: self.codec.dumps(user) for user_id, user in json_data.get('users', {}).items()}
+        return json_data
+
+    def prepare(self, json_data, mutations):
+        users = json_data['users']
+        user_ids = set()
+        for op, path, value in mutations:
+            if len(path) < 2:
+                # The whole database or every user was replaced
+                self.users = {}
+                user_ids = users
+                break
+            user_ids.add(path[1])
+            if len(path) == 2 and op == 'delete':
+                self.users.pop(path[1], None)
+
+        added = False
+        for user_id in user_ids:
+            if user_id in users:
+                added = added or user_id not in self.users
+                self.users[user_id] = self.codec.dumps(users[user_id])
+            else:
+                self.users.pop(user_id, None)
+        # New users go in the same place as in the resident database, which is at the end but in the order they came
+        if added:
+            self.users = {user_id: self.users[user_id] for user_id in users}
+        return list(self.users.items())
+
+    def write(self, batch):
+        write_database(self.filename, self.codec.dumps_map([('users', self.codec.dumps_map(batch))]))
+
+
+def open_engine():
+    """Create the storage engine named by the STORAGE_ENGINE config key ('json' by default, 'journal',
+    'sharded' or 'sqlite').
+
+    :return: (StorageEngine) the engine the backend should persist to
+    """
+    engine_name = config("STORAGE_ENGINE", default='json')
+    if engine_name == 'json':
+        return JSONFileEngine(config("FILENAME"), get_codec())
+    if engine_name == 'journal':
+        from workout_journal import JournalEngine
+        return JournalEngine(config("FILENAME"), get_codec(),
+                             compact_bytes=config("JOURNAL_COMPACT_BYTES", default=1048576, cast=int))
+    if engine_name == 'sharded':
+        from workout_shards import ShardedEngine
+        return ShardedEngine(config("SHARD_DIRECTORY", default='shards'),
+                             buckets=config("SHARD_BUCKETS", default=0, cast=int), codec=get_codec())
+    if engine_name == 'sqlite':
+        from workout_sqlite import SQLiteEngine
+        return SQLiteEngine(config("SQLITE_FILENAME", default='workouts.sqlite3'))
+
+    raise ValueError(f"STORAGE_ENGINE must be 'json', 'journal', 'sharded' or 'sqlite', but got '{engine_name}'.")
+
+
+def record_path(path):
+    """Trim a mutation path down to the path of the record (user, workout or report) that it changed. Engines that
+    store records separately use this to work out which single record has to be rewritten.
+
+    :param path: (tuple) the keys leading to the changed value
+    :return: (tuple) the keys leading to the record containing the changed value
+    """
+    if len(path) <= 3:
+        return path[:2]
+    if path[2] == 'unscheduled_workout':
+        return path[:4]
+    if path[2] == 'scheduled_workout':
+        if len(path) >= 6 and path[4] == 'reports':
+            return path[:6]
+        return path[:4]
+
+    # Any other field belongs to the user record itself
+    return path[:2]
+
+
+def lookup_path(json_data, path):
+    """Follow a path of keys into the database.
+
+    :param json_data: (dict) the database
+    :param path: (tuple) the keys to follow
+    :return: (any) the value at the end of the path, or None if some key along the way is missing
+    """
+    node = json_data
+    for key in path:
+        if not isinstance(node, Mapping) or key not in node:
+            return None
+        node = node[key]
+    return node
+
+
+def apply_mutation(json_data, op, path, value):
+    """Apply one mutation to a database dict. This is lenient about missing keys, because replaying a log on top of
+    a snapshot that already contains some of its changes has to give the same result as replaying it once.
+
+    :param json_data: (dict) the database to change
+    :param op: (str) 'set' or 'delete'
+    :param path: (tuple) the keys leading to the changed value
+    :param value: (any) the new value for 'set', ignored for 'delete'
+    """
+    if not path:
+        json_data.clear()
+        json_data.update(value)
+        return
+
+    parent = lookup_path(json_data, path[:-1])
+    if not isinstance(parent, Mapping):
+        return
+    if op == 'set':
+        parent[path[-1]] = value
+    else:
+        parent.pop(path[-1], None)
@@ -1,16 +1,25 @@
 from decouple import config
 from interactions import (SlashContext, OptionType, Client, SlashCommand,
-                          slash_option, SlashCommandChoice, AutocompleteContext, listen)
+                          slash_option, SlashCommandChoice, AutocompleteContext, listen, File,
+                          ActionRow, Button, ButtonStyle, ComponentContext, component_callback)
 import traceback
-from interactions.api.events import CommandError
+from interactions.api.events import CommandError, ComponentError
+import aiohttp
+import asyncio
 import os
-from json import dump as json_dump
+import re
+import tempfile
 
-from workout_main import (schedule_routine_main, report_scheduled_main, report_unscheduled_main,
-                          edit_workout_main, edit_report_main, view_report_main, view_workout_main,
-                          delete_report_main, delete_workout_main)
-from workout_quickfetches import (reports_years_quickfetch, reports_months_quickfetch, reports_days_quickfetch,
-                                  reports_by_day_quickfetch, fields_in_report_quickfetch, workouts_quickfetch)
+from workout_backend import load_store, start_archiver, start_reminders
+from workout_cache import quickfetch_cache
+from workout_metrics import metrics, instrumented, start_exporters
+from workout_async import (run_blocking, schedule_routine_async, report_scheduled_async, report_unscheduled_async,
+                           edit_workout_async, edit_report_async, view_report_async, view_workout_async,
+                           delete_report_async, delete_workout_async, stats_async, adherence_async, leaderboard_async,
+                           export_async, import_async, reminder_async, reports_years_quickfetch_async,
+                           reports_months_quickfetch_async, reports_days_quickfetch_async,
+                           reports_by_day_quickfetch_async,
+                           fields_in_report_quickfetch_async, workouts_quickfetch_async)
 
 
 @listen()
@@ -19,10 +28,36 @@ async def on_ready():
     print("Ready")
     print(f"This bot is owned by {bot.owner}")
 
-    # Make sure the database file is already there. If it's not, create it
-    if not os.path.isfile(config("FILENAME")) or not os.path.isfile(config("FILENAME")):
-        with open(config("FILENAME"), 'w') as new_json:
-            json_dump({"users": {}}, new_json)
+    # Load the database into memory once, off the event loop. If the file isn't there yet, it will be created
+    await run_blocking(load_store)
+
+    # Serve or write out the performance metrics, if that has been configured
+    start_exporters()
+
+    # Move old reports into the archive now and then, if that has been configured
+    start_archiver()
+
+    # Remind users of their scheduled workouts. The scheduler runs on its own thread, so it hands each reminder back
+    # to the event loop to be sent
+    loop = asyncio.get_running_loop()
+    start_reminders(lambda user_id, workout_id: asyncio.run_coroutine_threadsafe(send_reminder(user_id, workout_id),
+                                                                                 loop))
+
+
+async def send_reminder(user_id, workout_id):
+    """Sends a user a direct message reminding them that one of their scheduled workouts is due today.
+
+    :param user_id: (str) the Discord ID of the user
+    :param workout_id: (str) the id of the workout that is due
+    """
+    try:
+        msg = await reminder_async(user_id, workout_id)
+        if msg:
+            user = await bot.fetch_user(user_id)
+            await user.send(msg)
+    except Exception as error:
+        # A user who has left or closed their DMs shouldn't stop anybody else's reminders
+        traceback.print_exception(error)
 
 
 @listen(CommandError, disable_default_listeners=True)  # tell the dispatcher that this replaces the default listener
@@ -32,6 +67,24 @@ async def on_command_error(event: CommandError):
 
     :param event: (object) contains information about the interaction
     """
+    await send_error(event)
+
+
+@listen(ComponentError, disable_default_listeners=True)
+async def on_component_error(event: ComponentError):
+    """Listens for any errors in button presses, and sends them to the person who pressed the button the same way as
+    errors in slash commands.
+
+    :param event: (object) contains information about the interaction
+    """
+    await send_error(event)
+
+
+async def send_error(event):
+    """Sends the error messages of a failed interaction to the person who started it as an ephemeral msg.
+
+    :param event: (object) contains information about the interaction, and the error in event.error
+    """
     traceback.print_exception(event.error)
     if not event.ctx.responded:
         errors = ''
@@ -77,24 +130,25 @@ base_command = SlashCommand(
               opt_type=OptionType.STRING, required=False)
 @slash_option(name="show_everyone", description="Want the post to be visible to everyone?",
               opt_type=OptionType.BOOLEAN, required=False)
+@instrumented('command')
 async def schedule_routine(ctx: SlashContext, workout_name,
                            muscle_group=None, weights_used=None, tutorial_url=None, image_url=None,
                            workout_day_1=None, workout_day_2=None, workout_day_3=None,
                            workout_day_4=None, workout_day_5=None, workout_day_6=None, workout_day_7=None,
                            show_everyone=False):
-    msg = schedule_routine_main(user=ctx.author,
-                                workout_name=workout_name,
-                                muscle_group=muscle_group,
-                                weights_used=weights_used,
-                                tutorial_url=tutorial_url,
-                                image_url=image_url,
-                                workout_day_1=workout_day_1,
-                                workout_day_2=workout_day_2,
-                                workout_day_3=workout_day_3,
-                                workout_day_4=workout_day_4,
-                                workout_day_5=workout_day_5,
-                                workout_day_6=workout_day_6,
-                                workout_day_7=workout_day_7,)
+    msg = await schedule_routine_async(user=ctx.author,
+                                       workout_name=workout_name,
+                                       muscle_group=muscle_group,
+                                       weights_used=weights_used,
+                                       tutorial_url=tutorial_url,
+                                       image_url=image_url,
+                                       workout_day_1=workout_day_1,
+                                       workout_day_2=workout_day_2,
+                                       workout_day_3=workout_day_3,
+                                       workout_day_4=workout_day_4,
+                                       workout_day_5=workout_day_5,
+                                       workout_day_6=workout_day_6,
+                                       workout_day_7=workout_day_7,)
 
     await ctx.send(msg, ephemeral=not show_everyone)
 
@@ -115,11 +169,12 @@ async def schedule_routine(ctx: SlashContext, workout_name,
               opt_type=OptionType.STRING, required=False)
 @slash_option(name="show_everyone", description="Want the post to be visible to everyone?",
               opt_type=OptionType.BOOLEAN, required=False)
+@instrumented('command')
 async def report_scheduled(ctx: SlashContext, workout_name, completion, comment=None, show_everyone=False):
-    msg = report_scheduled_main(user=ctx.author,
-                                workout_id=workout_name,
-                                completion=completion,
-                                comment=comment)
+    msg = await report_scheduled_async(user=ctx.author,
+                                       workout_id=workout_name,
+                                       completion=completion,
+                                       comment=comment)
 
     await ctx.send(msg, ephemeral=not show_everyone)
 
@@ -143,16 +198,17 @@ async def report_scheduled(ctx: SlashContext, workout_name, completion, comment=
               opt_type=OptionType.BOOLEAN, required=False)
 @slash_option(name="comment", description="Is there anything you'd like to note about how the workout session went?",
               opt_type=OptionType.STRING, required=False)
+@instrumented('command')
 async def report_unscheduled(ctx: SlashContext, workout_name,
                              muscle_group=None, weights_used=None, tutorial_url=None, image_url=None,
                              show_everyone=False, comment=None):
-    msg = report_unscheduled_main(user=ctx.author,
-                                  workout_name=workout_name,
-                                  muscle_group=muscle_group,
-                                  weights_used=weights_used,
-                                  tutorial_url=tutorial_url,
-                                  image_url=image_url,
-                                  comment=comment)
+    msg = await report_unscheduled_async(user=ctx.author,
+                                         workout_name=workout_name,
+                                         muscle_group=muscle_group,
+                                         weights_used=weights_used,
+                                         tutorial_url=tutorial_url,
+                                         image_url=image_url,
+                                         comment=comment)
 
     await ctx.send(msg, ephemeral=not show_everyone)
 
@@ -197,21 +253,22 @@ async def report_unscheduled(ctx: SlashContext, workout_name,
               opt_type=OptionType.STRING, required=False, autocomplete=True)
 @slash_option(name="show_everyone", description="Want the post to be visible to everyone?",
               opt_type=OptionType.BOOLEAN, required=False)
+@instrumented('command')
 async def edit_workout(ctx: SlashContext, workout_name, field_to_change, new_value=None, new_schedule_day_1=None,
                        new_schedule_day_2=None, new_schedule_day_3=None, new_schedule_day_4=None,
                        new_schedule_day_5=None, new_schedule_day_6=None, new_schedule_day_7=None,
                        show_everyone=False):
-    msg = edit_workout_main(user=ctx.author,
-                            workout_id=workout_name,
-                            field=field_to_change,
-                            new_value=new_value,
-                            new_schedule_day_1=new_schedule_day_1,
-                            new_schedule_day_2=new_schedule_day_2,
-                            new_schedule_day_3=new_schedule_day_3,
-                            new_schedule_day_4=new_schedule_day_4,
-                            new_schedule_day_5=new_schedule_day_5,
-                            new_schedule_day_6=new_schedule_day_6,
-                            new_schedule_day_7=new_schedule_day_7)
+    msg = await edit_workout_async(user=ctx.author,
+                                   workout_id=workout_name,
+                                   field=field_to_change,
+                                   new_value=new_value,
+                                   new_schedule_day_1=new_schedule_day_1,
+                                   new_schedule_day_2=new_schedule_day_2,
+                                   new_schedule_day_3=new_schedule_day_3,
+                                   new_schedule_day_4=new_schedule_day_4,
+                                   new_schedule_day_5=new_schedule_day_5,
+                                   new_schedule_day_6=new_schedule_day_6,
+                                   new_schedule_day_7=new_schedule_day_7)
 
     await ctx.send(msg, ephemeral=not show_everyone)
 
@@ -235,17 +292,19 @@ async def edit_workout(ctx: SlashContext, workout_name, field_to_change, new_val
               opt_type=OptionType.STRING, required=True)
 @slash_option(name="show_everyone", description="Want the post to be visible to everyone?",
               opt_type=OptionType.BOOLEAN, required=False)
+@instrumented('command')
 async def edit_report(ctx: SlashContext, year, month, day, report_to_edit, field_to_change, new_value,
                       show_everyone=False):
-    msg = edit_report_main(user=ctx.author,
-                           report_id=report_to_edit,
-                           field=field_to_change,
-                           new_value=new_value)
+    msg = await edit_report_async(user=ctx.author,
+                                  report_id=report_to_edit,
+                                  field=field_to_change,
+                                  new_value=new_value)
 
     await ctx.send(msg, ephemeral=not show_everyone)
 
 
 @edit_report.autocomplete("field_to_change")
+@instrumented('autocomplete')
 async def fields_in_report_autocomplete(ctx: AutocompleteContext):
     """Fetches the fields of information contained within the selected report.
 
@@ -254,8 +313,8 @@ async def fields_in_report_autocomplete(ctx: AutocompleteContext):
     # Fetch a list of fields in the selected report that the user might be able to change
     try:
         float(ctx.args[3])
-        fields = fields_in_report_quickfetch(userid=int(ctx.author_id),
-                                             report_id=ctx.args[3])
+        fields = await fields_in_report_quickfetch_async(userid=int(ctx.author_id),
+                                                         report_id=ctx.args[3])
     except:
         fields = [{'name': 'Error: Please delete the command and try again. Make sure you fill in all fields in order.',
                    'value': 'error'}]
@@ -278,9 +337,10 @@ async def fields_in_report_autocomplete(ctx: AutocompleteContext):
               opt_type=OptionType.STRING, required=True, autocomplete=True)
 @slash_option(name="show_everyone", description="Want the post to be visible to everyone?",
               opt_type=OptionType.BOOLEAN, required=False)
+@instrumented('command')
 async def view_report(ctx: SlashContext, year, month, day, report_to_view, show_everyone=False):
-    msg = view_report_main(user=ctx.author,
-                           report_id=report_to_view)
+    msg = await view_report_async(user=ctx.author,
+                                  report_id=report_to_view)
 
     await ctx.send(msg, ephemeral=not show_everyone)
 
@@ -294,11 +354,56 @@ async def view_report(ctx: SlashContext, year, month, day, report_to_view, show_
               opt_type=OptionType.STRING, required=True, autocomplete=True)
 @slash_option(name="show_everyone", description="Want the post to be visible to everyone?",
               opt_type=OptionType.BOOLEAN, required=False)
-async def view_workout(ctx: SlashContext, workout_name, show_everyone=False):
-    msg = view_workout_main(user=ctx.author,
-                            workout_id=workout_name)
+@slash_option(name="oldest_first", description="Want to page through the reports from the oldest one instead?",
+              opt_type=OptionType.BOOLEAN, required=False)
+@instrumented('command')
+async def view_workout(ctx: SlashContext, workout_name, show_everyone=False, oldest_first=False):
+    msg, page, num_pages = await view_workout_async(user=ctx.author,
+                                                    workout_id=workout_name,
+                                                    newest_first=not oldest_first)
+
+    await ctx.send(msg, components=view_workout_buttons(ctx.author.id, workout_name, page, num_pages, oldest_first),
+                   ephemeral=not show_everyone)
 
-    await ctx.send(msg, ephemeral=not show_everyone)
+
+@component_callback(re.compile(r"^view_workout:"))
+@instrumented('command')
+async def view_workout_page(ctx: ComponentContext):
+    """Turns the page of a view_workout message when one of its buttons is pressed. Everything needed to show the
+    page is in the button's custom id, so nothing has to be remembered between presses.
+
+    :param ctx: (object) contains information about the interaction
+    """
+    user_id, workout_id, page, oldest_first = ctx.custom_id.split(':')[1:]
+    if int(ctx.author.id) != int(user_id):
+        raise PermissionError("Only the person who viewed this workout can turn its pages.")
+    oldest_first = oldest_first == '1'
+    msg, page, num_pages = await view_workout_async(user=ctx.author,
+                                                    workout_id=workout_id,
+                                                    page=int(page),
+                                                    newest_first=not oldest_first)
+
+    await ctx.edit_origin(content=msg,
+                          components=view_workout_buttons(ctx.author.id, workout_id, page, num_pages, oldest_first))
+
+
+def view_workout_buttons(user_id, workout_id, page, num_pages, oldest_first):
+    """Makes the previous and next buttons of a view_workout message, or none if the reports fit on one page.
+
+    :param user_id: (int) the Discord ID of the person viewing the workout
+    :param workout_id: (str) the id of the workout being viewed
+    :param page: (int) the page being shown, counting from 0
+    :param num_pages: (int) how many pages there are
+    :param oldest_first: (bool) whether the reports run from oldest to newest
+    :return: (list) the rows of buttons to send with the message
+    """
+    if num_pages <= 1:
+        return []
+    custom_id = f"view_workout:{user_id}:{workout_id}:{{page}}:{int(oldest_first)}"
+    return [ActionRow(Button(style=ButtonStyle.SECONDARY, label="Previous", custom_id=custom_id.format(page=page - 1),
+                             disabled=page <= 0),
+                      Button(style=ButtonStyle.SECONDARY, label="Next", custom_id=custom_id.format(page=page + 1),
+                             disabled=page >= num_pages - 1))]
 
 # -------------------------------------------------------------------------------------------------------------------- #
 """delete_report"""
@@ -320,10 +425,11 @@ async def view_workout(ctx: SlashContext, workout_name, show_everyone=False):
                        SlashCommandChoice(name='Yes', value='True')])
 @slash_option(name="show_everyone", description="Want the post to be visible to everyone?",
               opt_type=OptionType.BOOLEAN, required=False)
+@instrumented('command')
 async def delete_report(ctx: SlashContext, year, month, day, report_to_delete, are_you_sure, show_everyone=False):
     if are_you_sure == 'True':
-        msg = delete_report_main(user=ctx.author,
-                                 report_id=report_to_delete)
+        msg = await delete_report_async(user=ctx.author,
+                                        report_id=report_to_delete)
     else:
         msg = "Because you said you are not sure you want to delete the report, it has **not** been deleted."
 
@@ -348,16 +454,132 @@ async def delete_report(ctx: SlashContext, year, month, day, report_to_delete, a
                        SlashCommandChoice(name='Yes', value='True')])
 @slash_option(name="show_everyone", description="Want the post to be visible to everyone?",
               opt_type=OptionType.BOOLEAN, required=False)
+@instrumented('command')
 async def delete_workout(ctx: SlashContext, workout_name, save_report_history, are_you_sure, show_everyone=False):
     if are_you_sure == 'True':
-        msg = delete_workout_main(user=ctx.author,
-                                  workout_id=workout_name,
-                                  save=save_report_history)
+        msg = await delete_workout_async(user=ctx.author,
+                                         workout_id=workout_name,
+                                         save=save_report_history)
     else:
         msg = "Because you said you are not sure you want to delete the workout, it has **not** been deleted."
 
     await ctx.send(msg, ephemeral=not show_everyone)
 
+# -------------------------------------------------------------------------------------------------------------------- #
+"""stats"""
+
+
+@base_command.subcommand(sub_cmd_name="stats",
+                         sub_cmd_description="See your streak, weekly volume and how often you complete each workout")
+@slash_option(name="show_everyone", description="Want the post to be visible to everyone?",
+              opt_type=OptionType.BOOLEAN, required=False)
+@instrumented('command')
+async def stats(ctx: SlashContext, show_everyone=False):
+    msg = await stats_async(user=ctx.author)
+
+    await ctx.send(msg, ephemeral=not show_everyone)
+
+# -------------------------------------------------------------------------------------------------------------------- #
+"""adherence"""
+
+
+@base_command.subcommand(sub_cmd_name="adherence",
+                         sub_cmd_description="See how closely you've kept to the days your workouts are scheduled on")
+@slash_option(name="show_everyone", description="Want the post to be visible to everyone?",
+              opt_type=OptionType.BOOLEAN, required=False)
+@instrumented('command')
+async def adherence(ctx: SlashContext, show_everyone=False):
+    msg = await adherence_async(user=ctx.author)
+
+    await ctx.send(msg, ephemeral=not show_everyone)
+
+# -------------------------------------------------------------------------------------------------------------------- #
+"""leaderboard"""
+
+
+@base_command.subcommand(sub_cmd_name="leaderboard",
+                         sub_cmd_description="See who has worked out the most this week, this month and of all time")
+@slash_option(name="show_everyone", description="Want the post to be visible to everyone?",
+              opt_type=OptionType.BOOLEAN, required=False)
+@instrumented('command')
+async def leaderboard(ctx: SlashContext, show_everyone=False):
+    msg = await leaderboard_async(user=ctx.author)
+
+    await ctx.send(msg, ephemeral=not show_everyone)
+
+# -------------------------------------------------------------------------------------------------------------------- #
+"""export"""
+
+
+@base_command.subcommand(sub_cmd_name="export",
+                         sub_cmd_description="Download your whole workout history as a file")
+@slash_option(name="file_format", description="NDJSON (one JSON record per line) or CSV (for spreadsheets)?",
+              opt_type=OptionType.STRING, required=False,
+              choices=[SlashCommandChoice(name='NDJSON', value='ndjson'),
+                       SlashCommandChoice(name='CSV', value='csv')])
+@instrumented('command')
+async def export(ctx: SlashContext, file_format='ndjson'):
+    # Writing the file can take a moment for a long history, so let Discord know the answer is coming
+    await ctx.defer(ephemeral=True)
+    msg, filename = await export_async(user=ctx.author,
+                                       file_format=file_format)
+    try:
+        await ctx.send(msg, file=File(filename, file_name=f"workouts_{ctx.author.id}.{file_format}"), ephemeral=True)
+    finally:
+        os.remove(filename)
+
+# -------------------------------------------------------------------------------------------------------------------- #
+"""import_history"""
+
+
+@base_command.subcommand(sub_cmd_name="import_history",
+                         sub_cmd_description="Import a workout history file into a user's history (bot owner only)")
+@slash_option(name="user", description="Whose history should the file be imported into?",
+              opt_type=OptionType.USER, required=True)
+@slash_option(name="history_file", description="A file from /workout export, in NDJSON or CSV",
+              opt_type=OptionType.ATTACHMENT, required=True)
+@instrumented('command')
+async def import_history(ctx: SlashContext, user, history_file):
+    if int(ctx.author.id) != int(bot.owner.id):
+        raise PermissionError("Only the owner of the bot can import workout histories.")
+    await ctx.defer(ephemeral=True)
+
+    # Stream the attachment to a temporary file, so a big history is never held in memory all at once
+    file_format = 'csv' if history_file.filename.lower().endswith('.csv') else 'ndjson'
+    file_descriptor, filename = tempfile.mkstemp(prefix='workout_import_', suffix=f".{file_format}")
+    try:
+        with os.fdopen(file_descriptor, 'wb') as file:
+            async with aiohttp.ClientSession() as session:
+                async with session.get(history_file.url) as response:
+                    response.raise_for_status()
+                    async for chunk in response.content.iter_chunked(1 << 16):
+                        file.write(chunk)
+        msg = await import_async(user=user,
+                                 filename=filename,
+                                 file_format=file_format)
+    finally:
+        os.remove(filename)
+
+    await ctx.send(msg, ephemeral=True)
+
+# -------------------------------------------------------------------------------------------------------------------- #
+"""perf"""
+
+
+@base_command.subcommand(sub_cmd_name="perf",
+                         sub_cmd_description="Show the bot's performance metrics (bot owner only)")
+@instrumented('command')
+async def perf(ctx: SlashContext):
+    if int(ctx.author.id) != int(bot.owner.id):
+        raise PermissionError("Only the owner of the bot can see its performance metrics.")
+
+    cache_stats = quickfetch_cache.stats()
+    msg = (f"```\n{metrics.summary(max_length=1800)}```"
+           f"Quickfetch cache: {cache_stats['size']}/{cache_stats['max_size']} entries, "
+           f"{cache_stats['hit_rate']:.0%} hit rate, {cache_stats['evictions']} evictions")
+
+    await ctx.send(msg, ephemeral=True)
+
 # -------------------------------------------------------------------------------------------------------------------- #
 """Common-use autocompletes"""
 
@@ -376,6 +598,7 @@ async def delete_workout(ctx: SlashContext, workout_name, save_report_history, a
 @edit_workout.autocomplete("new_schedule_day_5")
 @edit_workout.autocomplete("new_schedule_day_6")
 @edit_workout.autocomplete("new_schedule_day_7")
+@instrumented('autocomplete')
 async def days_of_the_week_autocomplete(ctx: AutocompleteContext):
     """Fetches a list of days from Monday to Friday so you can pick which days you want to schedule your workout for.
 
@@ -395,14 +618,15 @@ async def days_of_the_week_autocomplete(ctx: AutocompleteContext):
 @report_scheduled.autocomplete("workout_name")
 @edit_workout.autocomplete("workout_name")
 @view_workout.autocomplete("workout_name")
+@instrumented('autocomplete')
 async def user_workouts_autocomplete(ctx: AutocompleteContext):
-    """Fetches a list of all of a user's scheduled workouts.
+    """Fetches the user's scheduled workouts that best match what they have typed so far.
 
     :param ctx: (object) contains information about the interaction
     """
     # Fetch a list of the user's workouts
     try:
-        workouts = workouts_quickfetch(userid=int(ctx.author_id))
+        workouts = await workouts_quickfetch_async(userid=int(ctx.author_id), text=ctx.input_text)
     except KeyError:
         workouts = [{'name': 'There are no workouts reported under your name. Get swole, then try again',
                      'value': 'error'}]
@@ -412,6 +636,7 @@ async def user_workouts_autocomplete(ctx: AutocompleteContext):
 @edit_report.autocomplete("year")
 @view_report.autocomplete("year")
 @delete_report.autocomplete("year")
+@instrumented('autocomplete')
 async def reports_years_autocomplete(ctx: AutocompleteContext):
     """Fetches a list of years in which the user has completed workout sessions.
 
@@ -419,7 +644,7 @@ async def reports_years_autocomplete(ctx: AutocompleteContext):
     """
     # Fetch a list of years in which the user has submitted reports
     try:
-        years_list = reports_years_quickfetch(userid=int(ctx.author_id))
+        years_list = await reports_years_quickfetch_async(userid=int(ctx.author_id))
     except KeyError:
         years_list = [{'name': 'There are no workouts reported under your name. Get swole, then try again',
                        'value': 'error'}]
@@ -430,6 +655,7 @@ async def reports_years_autocomplete(ctx: AutocompleteContext):
 @edit_report.autocomplete("month")
 @view_report.autocomplete("month")
 @delete_report.autocomplete("month")
+@instrumented('autocomplete')
 async def reports_months_autocomplete(ctx: AutocompleteContext):
     """Fetches a list of months within the selected year in which the user has completed workout sessions.
 
@@ -438,8 +664,8 @@ async def reports_months_autocomplete(ctx: AutocompleteContext):
     # Fetch a list of months in the selected year in which the user has submitted reports
     try:
         int(ctx.args[0])
-        months_list = reports_months_quickfetch(userid=int(ctx.author_id),
-                                                year=ctx.args[0])
+        months_list = await reports_months_quickfetch_async(userid=int(ctx.author_id),
+                                                            year=ctx.args[0])
     except:
         months_list = [{'name': 'Error: Please delete the command and try again. '
                                 'Make sure you fill in all fields in order.',
@@ -451,6 +677,7 @@ async def reports_months_autocomplete(ctx: AutocompleteContext):
 @edit_report.autocomplete("day")
 @view_report.autocomplete("day")
 @delete_report.autocomplete("day")
+@instrumented('autocomplete')
 async def reports_days_autocomplete(ctx: AutocompleteContext):
     """Fetches a list of days within the selected year and month in which the user has completed workout sessions.
 
@@ -459,9 +686,9 @@ async def reports_days_autocomplete(ctx: AutocompleteContext):
     # Fetch a list of days in the selected month of the selected year in which the user has submitted reports
     try:
         int(ctx.args[1])
-        days_list = reports_days_quickfetch(userid=int(ctx.author_id),
-                                            year=ctx.args[0],
-                                            month=ctx.args[1])
+        days_list = await reports_days_quickfetch_async(userid=int(ctx.author_id),
+                                                        year=ctx.args[0],
+                                                        month=ctx.args[1])
     except:
         days_list = [{'name': 'Error: Please delete the command and try again. '
                               'Make sure you fill in all fields in order.',
@@ -473,6 +700,7 @@ async def reports_days_autocomplete(ctx: AutocompleteContext):
 @edit_report.autocomplete("report_to_edit")
 @view_report.autocomplete("report_to_view")
 @delete_report.autocomplete("report_to_view")
+@instrumented('autocomplete')
 async def reports_by_day_autocomplete(ctx: AutocompleteContext):
     """Fetches a list of reports made by the user around the specified day. Includes the day before and the day
     after to smooth out any memory/time zone issues.
@@ -482,10 +710,11 @@ async def reports_by_day_autocomplete(ctx: AutocompleteContext):
     # Fetch a list of all the reports the user has made on the selected day, and on surrounding days if convenient
     try:
         int(ctx.args[2])
-        reports = reports_by_day_quickfetch(userid=int(ctx.author_id),
-                                            year=ctx.args[0],
-                                            month=ctx.args[1],
-                                            day=ctx.args[2])
+        reports = await reports_by_day_quickfetch_async(userid=int(ctx.author_id),
+                                                        year=ctx.args[0],
+                                                        month=ctx.args[1],
+                                                        day=ctx.args[2],
+                                                        text=ctx.input_text)
     except:
         reports = [{'name': 'Error: Please delete the command and try again. '
                             'Make sure you fill in all fields in order.',